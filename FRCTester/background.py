@@ -0,0 +1,66 @@
+from abc import ABC, abstractmethod
+import asyncio
+import threading
+
+from aiohttp import web
+
+
+class BackgroundServer(ABC):
+    # Runs the application of create_app on its own event loop in a background thread,
+    # port 0 picks a free port, the bound port is set once the server has started
+    def __init__(self, host: str, port: int):
+        self.host = host
+        self.port = port
+        self.loop = None
+        self.runner = None
+        self.thread = None
+
+    @abstractmethod
+    def create_app(self) -> web.Application:
+        pass
+
+    def start(self) -> 'BackgroundServer':
+        started = threading.Event()
+        self.loop = asyncio.new_event_loop()
+
+        async def setup():
+            self.runner = web.AppRunner(self.create_app(), access_log=None)
+            await self.runner.setup()
+            site = web.TCPSite(self.runner, self.host, self.port)
+            await site.start()
+            self.port = self.runner.addresses[0][1]
+
+        errors = []
+
+        def run():
+            asyncio.set_event_loop(self.loop)
+            try:
+                self.loop.run_until_complete(setup())
+            except OSError as error:
+                # The address is in use or not available, raised by start() in the calling thread
+                errors.append(error)
+                return
+            finally:
+                started.set()
+            self.loop.run_forever()
+
+        self.thread = threading.Thread(target=run, daemon=True)
+        self.thread.start()
+        started.wait()
+        if errors:
+            self.thread.join()
+            self.loop.close()
+            raise errors[0]
+        return self
+
+    def stop(self) -> None:
+        asyncio.run_coroutine_threadsafe(self.runner.cleanup(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
+
+    def __enter__(self) -> 'BackgroundServer':
+        return self.start()
+
+    def __exit__(self, *args) -> None:
+        self.stop()
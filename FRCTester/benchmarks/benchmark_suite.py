@@ -0,0 +1,183 @@
+from pathlib import Path
+from unittest import mock
+import argparse
+import asyncio
+import csv
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import main
+from client_benchmark import get_free_port, start_server
+from memory_benchmark import generate_results
+from parser_benchmark import ROW_KINDS, generate_rows, get_row_kind
+from report import ReportWriter
+
+
+BENCHMARKS_DIR = Path(__file__).resolve().parent
+# Allowed regression against the baseline as a share of the baseline value, and whether higher values are better
+BUDGETS = {
+    'parse_v1_rows_per_second': (0.25, True),
+    'parse_v2_rows_per_second': (0.25, True),
+    'parse_v2_broken_rows_per_second': (0.25, True),
+    'get_queries_rows_per_second': (0.25, True),
+    'report_rows_per_second': (0.25, True),
+    'client_requests_per_second': (0.30, True),
+    'peak_memory_mb': (0.25, False)
+}
+
+
+def best_rate(measure, repeat: int) -> float:
+    # The fastest of several runs, slower runs are noise from the rest of the machine
+    return max(measure() for _ in range(repeat))
+
+
+def measure_parser(parser, texts: list) -> float:
+    start_time = time.perf_counter()
+    for text in texts:
+        parser(text)
+    return len(texts) / (time.perf_counter() - start_time)
+
+
+def measure_get_queries(directory: str, rows: int) -> float:
+    # Reading, CSV splitting and decoding of a log file, as main() does it
+    start_time = time.perf_counter()
+    with mock.patch.object(main, 'BASE_DIR', directory), mock.patch.object(main, 'PARSE_WORKERS', 1), \
+            mock.patch.dict(os.environ, {'FILENAME': 'log.csv'}):
+        for _ in main.get_queries():
+            pass
+    return rows / (time.perf_counter() - start_time)
+
+
+def measure_report(directory: str, results: list) -> float:
+    start_time = time.perf_counter()
+    with ReportWriter(directory, main.REPORT_HEADERS, 'csv', get_row=main.get_report_row) as report:
+        for result in results:
+            report.write_result(result)
+    return len(results) / (time.perf_counter() - start_time)
+
+
+def measure_pipeline_memory(directory: str) -> float:
+    # Peak of Python allocations while the log is streamed to the report as main() does it, responses are faked
+    # so only the tester is measured; the parsed queries and results must not pile up
+    rng = random.Random(1)
+    tracemalloc.start()
+    with mock.patch.object(main, 'BASE_DIR', directory), mock.patch.object(main, 'PARSE_WORKERS', 1), \
+            mock.patch.dict(os.environ, {'FILENAME': 'log.csv'}), \
+            ReportWriter(directory, main.REPORT_HEADERS, 'csv', name='pipeline', get_row=main.get_report_row) as report:
+        for query in main.get_queries():
+            report.write_result({'request_body': query, 'elapsed_time': rng.uniform(50, 500), 'status_code': 200,
+                                 'error_codes': set(), 'error_messages': set(), 'warning_codes': set(),
+                                 'warning_messages': set(), 'phases': {'ttfb': 100.0, 'body': 1.0}})
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak / 1024 / 1024
+
+
+def measure_client(queries: list, concurrency: int) -> float:
+    start_time = time.perf_counter()
+    processed = asyncio.run(main.run_api_queries(iter(queries), lambda result: None, concurrency, concurrency * 2,
+                                                 rate_limit=0, progress_bar=False, hedge=False))
+    return processed / (time.perf_counter() - start_time)
+
+
+def run_benchmarks(rows: int, requests: int, concurrency: int, repeat: int) -> dict:
+    # Offline: a generated log and the stand-in server on this machine
+    log_rows = list(generate_rows(rows))
+    texts = {kind: [row[2] for row in log_rows if get_row_kind(row) == kind] for kind in ROW_KINDS}
+    metrics = {
+        'parse_v1_rows_per_second': best_rate(lambda: measure_parser(main.get_query_data_v1, texts['v1']), repeat),
+        'parse_v2_rows_per_second': best_rate(lambda: measure_parser(main.get_query_data_v2, texts['v2']), repeat),
+        'parse_v2_broken_rows_per_second': best_rate(lambda: measure_parser(main.get_query_data_v2, texts['v2 broken']), repeat)
+    }
+    with tempfile.TemporaryDirectory() as directory:
+        with open(os.path.join(directory, 'log.csv'), 'w', newline='') as file:
+            csv.writer(file).writerows(log_rows)
+        metrics['get_queries_rows_per_second'] = best_rate(lambda: measure_get_queries(directory, rows), repeat)
+        results = list(generate_results(rows))
+        metrics['report_rows_per_second'] = best_rate(lambda: measure_report(directory, results), repeat)
+        del log_rows, results
+        metrics['peak_memory_mb'] = measure_pipeline_memory(directory)
+
+    queries = [main.get_query_data(row) for row in generate_rows(requests)]
+    port = get_free_port()
+    server = start_server(port)
+    try:
+        with mock.patch.object(main, 'FRC_URL', f'http://127.0.0.1:{port}/flight_calculator/'):
+            # Warms the server up
+            measure_client(queries[:500], concurrency)
+            metrics['client_requests_per_second'] = best_rate(lambda: measure_client(queries, concurrency), repeat)
+    finally:
+        server.terminate()
+        server.wait()
+    return metrics
+
+
+def check_budgets(metrics: dict, baseline: dict, budgets: dict = BUDGETS) -> list:
+    # Descriptions of the metrics that regressed past their budget
+    regressions = []
+    for name, (budget, higher_is_better) in budgets.items():
+        if name not in metrics or not baseline.get(name):
+            continue
+        change = (metrics[name] - baseline[name]) / baseline[name]
+        regression = -change if higher_is_better else change
+        if regression > budget:
+            regressions.append(f'{name}: {baseline[name]:,.1f} -> {metrics[name]:,.1f} '
+                               f'({change:+.1%}, budget {budget:.0%})')
+    return regressions
+
+
+def main_benchmark() -> int:
+    parser = argparse.ArgumentParser(description='Speed of the tester hot paths checked against a stored baseline')
+    parser.add_argument('--rows', type=int, default=100_000, help='rows of the generated log')
+    parser.add_argument('--requests', type=int, default=5000, help='requests sent to the stand-in server')
+    parser.add_argument('--concurrency', type=int, default=50)
+    parser.add_argument('--repeat', type=int, default=3, help='runs per metric, the best one is kept')
+    parser.add_argument('--output', default=f'{main.REPORTS_PATH}/benchmarks.json')
+    parser.add_argument('--baseline', default=str(BENCHMARKS_DIR / 'baseline.json'))
+    parser.add_argument('--update-baseline', action='store_true', help='save the results as the new baseline')
+    args = parser.parse_args()
+
+    metrics = run_benchmarks(args.rows, args.requests, args.concurrency, args.repeat)
+    data = {
+        'metrics': metrics,
+        'settings': {'rows': args.rows, 'requests': args.requests, 'concurrency': args.concurrency, 'repeat': args.repeat},
+        'python': platform.python_version(),
+        'json': main.json_loads.__module__,
+        'date': time.strftime('%Y-%m-%dT%H:%M:%S')
+    }
+    with open(args.output, 'w') as file:
+        json.dump(data, file, indent=4)
+    for name, value in metrics.items():
+        print(f'{name}: {value:,.1f}')
+    print(f'Results written to {args.output}')
+
+    if args.update_baseline:
+        with open(args.baseline, 'w') as file:
+            json.dump(data, file, indent=4)
+        print(f'Baseline updated: {args.baseline}')
+        return 0
+    if not os.path.exists(args.baseline):
+        print(f'No baseline at {args.baseline}, run with --update-baseline to create it')
+        return 0
+    with open(args.baseline) as file:
+        baseline = json.load(file)
+    if baseline.get('settings') != data['settings']:
+        print('Warning: the baseline was measured with other settings')
+    regressions = check_budgets(metrics, baseline['metrics'])
+    for regression in regressions:
+        print(f'REGRESSION {regression}')
+    if not regressions:
+        print('All metrics are within their budgets')
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main_benchmark())
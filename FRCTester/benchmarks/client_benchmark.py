@@ -0,0 +1,136 @@
+from pathlib import Path
+import argparse
+import asyncio
+import json
+import socket
+import subprocess
+import sys
+import time
+
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import main
+from parser_benchmark import generate_rows
+
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+
+
+# CLIENT BEFORE THE PRE-SERIALIZED BODIES: aiohttp encodes json= with the stdlib json module in the measured time
+
+async def legacy_test_api_query(session, query: dict) -> dict:
+    url = main.FRC_URL
+    # Trace hooks of the session fill connection timings in
+    timings = {}
+    start_time = time.perf_counter()
+    async with session.post(url, json=query, trace_request_ctx=timings) as request:
+        headers_time = time.perf_counter()
+        error_codes = set()
+        error_messages = set()
+        warning_codes = set()
+        warning_messages = set()
+        if request.status == 200:
+            request_json = await request.json()
+            if 'errors' in request_json.keys():
+                for error in request_json.get('errors'):
+                    error_codes.add(error.get('code'))
+                    error_messages.add(error.get('message'))
+            if 'warnings' in request_json.keys():
+                for warnings in request_json.get('warnings'):
+                    for warning in warnings:
+                        warning_codes.add(warning.get('code'))
+                        warning_messages.add(warning.get('message'))
+        else:
+            await request.read()
+        end_time = time.perf_counter()
+        return {
+            'request_body': query,
+            'elapsed_time': (end_time - start_time) * 1000,
+            'status_code': request.status,
+            'error_codes': error_codes,
+            'error_messages': error_messages,
+            'warning_codes': warning_codes,
+            'warning_messages': warning_messages,
+            'phases': main.get_phases(timings, start_time, headers_time, end_time)
+        }
+
+
+# STAND-IN SERVER IN ANOTHER PROCESS, SO IT DOES NOT SHARE THE CPU OF THE CLIENT
+
+def get_free_port() -> int:
+    with socket.socket() as server_socket:
+        server_socket.bind(('127.0.0.1', 0))
+        return server_socket.getsockname()[1]
+
+
+def start_server(port: int) -> subprocess.Popen:
+    process = subprocess.Popen([sys.executable, str(BASE_DIR / 'mock_server.py'), '--port', str(port)],
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + 10
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return process
+        except OSError:
+            time.sleep(0.05)
+    process.kill()
+    raise RuntimeError('The stand-in server did not start')
+
+
+def measure(queries: list, concurrency: int, legacy: bool = False) -> tuple[float, float]:
+    # Requests per second and client CPU milliseconds per request
+    test_api_query = main.test_api_query
+    prepare_query = main.prepare_query
+    if legacy:
+        main.test_api_query = legacy_test_api_query
+        main.prepare_query = lambda query: query
+    try:
+        cpu_time = time.process_time()
+        start_time = time.perf_counter()
+        processed = asyncio.run(main.run_api_queries(iter(queries), lambda result: None, concurrency, concurrency * 2,
+                                                     rate_limit=0, progress_bar=False, hedge=False))
+        elapsed_time = time.perf_counter() - start_time
+        cpu_time = time.process_time() - cpu_time
+    finally:
+        main.test_api_query = test_api_query
+        main.prepare_query = prepare_query
+    return processed / elapsed_time, cpu_time / processed * 1000
+
+
+def measure_encoding(queries: list, encode) -> float:
+    # Microseconds per query
+    start_time = time.perf_counter()
+    for query in queries:
+        encode(query)
+    return (time.perf_counter() - start_time) / len(queries) * 1_000_000
+
+
+def main_benchmark():
+    parser = argparse.ArgumentParser(description='Highest request rate and CPU cost per request of the client')
+    parser.add_argument('--requests', type=int, default=20000)
+    parser.add_argument('--concurrency', type=int, default=main.CONCURRENCY)
+    args = parser.parse_args()
+
+    queries = [main.get_query_data(row) for row in generate_rows(args.requests)]
+    port = get_free_port()
+    server = start_server(port)
+    main.FRC_URL = f'http://127.0.0.1:{port}/flight_calculator/'
+    try:
+        # Warms the connection pool and the server up
+        measure(queries[:1000], args.concurrency)
+        legacy_rate, legacy_cpu = measure(queries, args.concurrency, legacy=True)
+        rate, cpu = measure(queries, args.concurrency)
+    finally:
+        server.terminate()
+        server.wait()
+    encoder = 'orjson' if main.json_dumps.__module__ == 'orjson' else 'json'
+    print(f'Requests: {args.requests}, concurrency {args.concurrency}')
+    print(f'Encoding: json {measure_encoding(queries, lambda query: json.dumps(query).encode()):.2f} us, '
+          f'{encoder} {measure_encoding(queries, main.json_dumps):.2f} us per query')
+    print(f'json= bodies: {legacy_rate:,.0f} req/s, {legacy_cpu:.3f} ms CPU per request')
+    print(f'Pre-serialized bodies ({encoder}): {rate:,.0f} req/s, {cpu:.3f} ms CPU per request')
+
+
+if __name__ == '__main__':
+    main_benchmark()
@@ -0,0 +1,78 @@
+from pathlib import Path
+import argparse
+import gc
+import random
+import sys
+import tracemalloc
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import main
+from parser_benchmark import generate_rows
+from results import ResultStore
+
+
+ERRORS = [('MISSING_FIELD', 'aircraft is required'), ('CALCULATION_ERROR', 'Route could not be calculated')]
+WARNINGS = [('FUEL_STOP', 'Fuel stop is required')]
+
+
+def generate_results(rows: int, seed: int = 1):
+    # Results in the shape test_api_query returns, for queries parsed from a synthetic log
+    rng = random.Random(seed)
+    for row in generate_rows(rows):
+        query = main.get_query_data(row)
+        errors = [rng.choice(ERRORS)] if rng.random() < 0.05 else []
+        warnings = WARNINGS if rng.random() < 0.1 else []
+        yield {
+            'request_body': query,
+            'elapsed_time': rng.lognormvariate(5, 0.5),
+            'status_code': 200,
+            'error_codes': {code for code, _ in errors},
+            'error_messages': {message for _, message in errors},
+            'warning_codes': {code for code, _ in warnings},
+            'warning_messages': {message for _, message in warnings},
+            'phases': {'ttfb': rng.uniform(50, 500), 'body': rng.uniform(0, 5)},
+            'wait_time': 0.0,
+            'source': 'api',
+            'attempts': 1
+        }
+
+
+def measure(rows: int, store_results) -> int:
+    # Bytes per result held after all the results are stored
+    gc.collect()
+    tracemalloc.start()
+    results = store_results(generate_results(rows))
+    gc.collect()
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del results
+    return size / rows
+
+
+def store_in_list(results) -> list:
+    return list(results)
+
+
+def store_in_columns(results) -> ResultStore:
+    store = ResultStore()
+    for result in results:
+        store.append(result)
+    return store
+
+
+def main_benchmark():
+    parser = argparse.ArgumentParser(description='Memory held per result: list of dicts and the columnar store')
+    parser.add_argument('--rows', type=int, default=200_000)
+    args = parser.parse_args()
+
+    list_size = measure(args.rows, store_in_list)
+    store_size = measure(args.rows, store_in_columns)
+    print(f'Results: {args.rows}')
+    print(f'List of dicts: {list_size:,.0f} bytes per result')
+    print(f'ResultStore: {store_size:,.0f} bytes per result')
+    print(f'Reduction: {list_size / store_size:.1f}x')
+
+
+if __name__ == '__main__':
+    main_benchmark()
@@ -0,0 +1,281 @@
+from pathlib import Path
+import argparse
+import csv
+import itertools
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+import urllib.parse
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import main
+from ingest import parse_log_parallel
+
+
+AIRPORTS = ['KIV', 'VKO', 'EHAM', 'LFPB', 'KSFO', 'KLAX', 'PHKO', 'UUWW', 'USCC', 'KOPF', 'KDAL', 'LUKK']
+AIRCRAFT = ['Gulfstream G450', 'Challenger 300', 'Cessna Citation X', 'Hawker 4000', 'Gulfstream G450, VIP']
+COUNTRIES = ['Ukraine', 'Belarus', 'Poland', 'Romania', 'Moldova', 'Turkey']
+FIRS = ['OAKX', 'OSTT', 'UKBV', 'UKDV', 'UKFV', 'UKLV', 'UKOV', 'EPWW', 'LRBB', 'LUUU']
+# Share of v2 rows with the empty item left by the export (", ,"), they are not valid JSON
+BROKEN_SHARE = 0.5
+ROW_KINDS = ('v1', 'v2', 'v2 broken')
+
+
+# PARSERS BEFORE THE JSON DECODING REWRITE
+
+def legacy_get_query_data_v2(query: str) -> dict|None:
+    # Preparation text for processing
+    text = query.split('{')
+    if len(text) < 3:
+        return None
+    
+    text = text[2].replace('}"}', '')
+    text = text.replace('\\n', '')
+    text = text.replace('\\', '')
+    
+    # Getting query parameters
+    query_dict = {}
+    request_parameters = text.split(',')
+    for i in range(len(request_parameters)):
+        current_parameter = request_parameters[i].split('":')
+        if len(current_parameter) == 2:
+            converted_parameter = legacy_convert_parameter_v2(current_parameter[0], current_parameter[1])
+            query_dict.update(converted_parameter)
+        else:
+            # Current parameter could be empty
+            if len(current_parameter[0].strip()) == 0:
+                continue
+            # We should find key for current value
+            for y in range(i, 0, -1):
+                temp_parameter = request_parameters[y].split('":')
+                if len(temp_parameter) == 2:
+                    # Key was found
+                    converted_parameter = legacy_convert_parameter_v2(temp_parameter[0], current_parameter[0])
+                    # 1 cicle loop
+                    for key in converted_parameter.keys():
+                        value = converted_parameter.get(key)
+                        current_value = query_dict.get(key)
+                        if isinstance(value, list):
+                            current_value.append(value[0])
+                        else:
+                            current_value.append(value)
+                        query_dict.update({key: current_value})
+                    break
+    
+    return query_dict
+        
+
+def legacy_convert_parameter_v2(name: str, value: str) -> dict:
+    name = name.strip().replace('"', '')
+    value = value.strip().replace('"', '')
+    if '[]' in name or '[' in value or ']' in value:
+        name = name.replace('[]', '')
+        value = value.replace('[', '').replace(']', '')
+        value_v2 = []
+        if len(value) > 0:
+            for list_value in value.split(','):
+                value_v2.append(list_value.strip())
+    elif value == 'true':
+        value_v2 = True
+    elif value == 'false':
+        value_v2 = False
+    elif 'pax' in name:
+        value_v2 = int(value) if len(value) > 0 else 0
+    else:
+        value_v2 = value
+        
+    return {name: value_v2}
+    
+
+def legacy_get_query_data_v1(query: str) -> dict|None:
+    # Getting query parameters
+    url = query.split('"')[3]
+    url = url.split('?')
+    if len(url) < 2:
+        return None
+    url_query = url[1]
+    
+    url_parameters = url_query.split('&')
+    if len(url_parameters) == 0:
+        return None
+
+    # Generating dict for new version
+    query_dict = {}
+    avoid_countries = set()
+    avoid_firs = set()
+    for parameter in url_parameters:
+        current_parameter = parameter.split('=')
+        converted_parameter = legacy_convert_parameter_v1(current_parameter[0], current_parameter[1])
+        if converted_parameter is not None:
+            for query_key in converted_parameter.keys():
+                if query_key == 'avoid_countries':
+                    avoid_countries.add(converted_parameter.get(query_key))
+                elif query_key == 'avoid_firs':
+                    avoid_firs.add(converted_parameter.get(query_key))
+                else:
+                    query_dict.update(converted_parameter)
+    if len(avoid_countries) > 0:
+        query_dict.update({'avoid_countries': list(avoid_countries)})
+    if len(avoid_firs) > 0:
+        query_dict.update({'avoid_firs': list(avoid_countries)})
+    return query_dict
+
+
+def legacy_convert_parameter_v1(name: str, value: str) -> dict|None:
+    name_v2 = name
+    same_name = {
+        'departure_airport',
+        'arrival_airport',
+        'pax'
+    }
+    if name in same_name:
+        name_v2 = name.strip()
+    elif name == 'departure_date_utc':
+        name_v2 = 'departure_datetime'
+    elif name == 'aircraft_profile':
+        name_v2 = 'aircraft'
+    elif name == 'airway':
+        bool_value = True if value == 'true' else False
+        return {
+            'airway_time': bool_value,
+            'airway_distance': bool_value,
+            'airway_fuel': bool_value
+        }
+    elif name == 'weather_impact':
+        bool_value = True if value == 'true' else False
+        return {
+            'airway_time_weather_impacted': bool_value,
+            'airway_fuel_weather_impacted': bool_value
+        }
+    elif name == 'fields':
+        if value == 'great_circle_route':
+            return {
+                'great_circle_route': True
+            }
+        elif value == 'airway_route':
+            return {
+                'airway_route': True
+            } 
+    elif 'avoid_countries' in name:
+        name_v2 = 'avoid_countries'
+    elif 'avoid_firs' in name:
+        name_v2 = 'avoid_firs'
+    else:
+        return None
+
+    if name == 'pax':
+        value = int(value)
+
+    return {
+        name_v2: urllib.parse.unquote_plus(value) if isinstance(value, str) else value
+    }
+
+
+def legacy_get_query_data(row: list) -> dict|None:
+    if '/api/v1/flight_calculator' in row[2]:
+        return legacy_get_query_data_v1(row[2])
+    elif '{"url": "/flight_calculator' in row[2]:
+        return legacy_get_query_data_v2(row[2])
+    return None
+
+
+# SYNTHETIC LOG
+
+def generate_row(rng: random.Random, index: int) -> list:
+    departure_airport, arrival_airport = rng.sample(AIRPORTS, 2)
+    if rng.random() < 0.5:
+        parameters = [
+            ('departure_airport', departure_airport),
+            ('arrival_airport', arrival_airport),
+            ('pax', rng.randint(0, 12)),
+            ('aircraft_profile', rng.choice(AIRCRAFT).replace(', VIP', '')),
+            ('departure_date_utc', '2022-3-21 19:00'),
+            ('weather_impact', 'true'),
+            ('airway', rng.choice(['true', 'false']))
+        ]
+        parameters.extend(('avoid_countries[]', country) for country in rng.sample(COUNTRIES, rng.randint(0, 3)))
+        url = '/api/v1/flight_calculator/?' + urllib.parse.urlencode(parameters, quote_via=urllib.parse.quote)
+        text = json.dumps({'url': url, 'token': None})
+    else:
+        request_body = {
+            'departure_airport': departure_airport,
+            'arrival_airport': arrival_airport,
+            'aircraft': rng.choice(AIRCRAFT),
+            'pax': rng.randint(0, 12),
+            'departure_datetime': '2022-03-30T00:00',
+            'airway_route': True,
+            'airway_time': True,
+            'avoid_countries': rng.sample(COUNTRIES, rng.randint(0, 3)),
+            'avoid_firs': [rng.choice(FIRS) for _ in range(rng.randint(0, 40))]
+        }
+        separator = ', , ' if rng.random() < BROKEN_SHARE else ', '
+        text = '{"url": "/flight_calculator/"' + separator + '"request_body": ' + json.dumps(json.dumps(request_body)) + '}'
+    return [str(index), '2022-03-01 00:00:00.000000', text, '1']
+
+
+def generate_rows(rows: int, distinct_rows: int = 10000, seed: int = 1) -> list:
+    # Rows are repeated from a fixed pool, so the log size does not depend on memory
+    rng = random.Random(seed)
+    pool = [generate_row(rng, index) for index in range(min(rows, distinct_rows))]
+    return itertools.islice(itertools.cycle(pool), rows)
+
+
+def get_row_kind(row: list) -> str:
+    if '/api/v1/flight_calculator' in row[2]:
+        return 'v1'
+    return 'v2 broken' if ', ,' in row[2] else 'v2'
+
+
+def measure(parser, rows: list) -> tuple[float, int]:
+    # Rows per second and number of rows the parser failed on
+    failures = 0
+    start_time = time.perf_counter()
+    for row in rows:
+        try:
+            parser(row)
+        except (ValueError, IndexError, AttributeError):
+            failures += 1
+    return len(rows) / (time.perf_counter() - start_time), failures
+
+
+def measure_parallel(rows: int, workers: int, chunk_size: int) -> float:
+    # Reading from a file through the chunked multi-process ingest
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'log.csv')
+        with open(path, 'w', newline='') as file:
+            csv.writer(file).writerows(generate_rows(rows))
+        start_time = time.perf_counter()
+        for _ in parse_log_parallel(path, main.get_query_data, workers, chunk_size, ordered=False):
+            pass
+        return rows / (time.perf_counter() - start_time)
+
+
+def main_benchmark():
+    parser = argparse.ArgumentParser(description='Rows per second of the log parsers')
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument('--workers', type=int, default=0, help='also measure parallel ingest with this many processes')
+    parser.add_argument('--chunk-size', type=int, default=main.PARSE_CHUNK_SIZE)
+    args = parser.parse_args()
+
+    rows = list(generate_rows(args.rows))
+    kinds = {kind: [row for row in rows if get_row_kind(row) == kind] for kind in ROW_KINDS}
+    print(f'Rows: {args.rows} ({", ".join(f"{kind} {len(kind_rows)}" for kind, kind_rows in kinds.items())})')
+    # Well-formed v2 rows are decoded at once, broken ones go through the fallback search of the request body
+    for kind, kind_rows in list(kinds.items()) + [('all', rows)]:
+        if not kind_rows:
+            continue
+        legacy_rate, legacy_failures = measure(legacy_get_query_data, kind_rows)
+        rate, failures = measure(main.get_query_data, kind_rows)
+        print(f'{kind}: legacy parser {legacy_rate:,.0f} rows/s, JSON parser ({main.json_loads.__module__}) '
+              f'{rate:,.0f} rows/s, speedup {rate / legacy_rate:.2f}x, failed rows: {legacy_failures} / {failures}')
+    if args.workers > 0:
+        parallel_rate = measure_parallel(args.rows, args.workers, args.chunk_size)
+        print(f'Parallel ingest ({args.workers} processes): {parallel_rate:,.0f} rows/s')
+
+
+if __name__ == '__main__':
+    main_benchmark()
@@ -0,0 +1,144 @@
+import csv
+import heapq
+
+from histogram import LatencyHistogram
+
+
+FLAGS = ('airway_route', 'airway_time_weather_impacted', 'great_circle_route', 'ifr_route')
+DIMENSIONS = ('aircraft', 'route', 'pax', 'avoid_countries', 'avoid_firs') + FLAGS
+# Route is left out of combinations, with it nearly every combination is seen a few times only
+COMBINATION_DIMENSIONS = tuple(dimension for dimension in DIMENSIONS if dimension != 'route')
+LENGTH_BUCKETS = ((0, '0'), (2, '1-2'), (5, '3-5'), (10, '6-10'), (20, '11-20'))
+BREAKDOWN_HEADERS = ['DIMENSION', 'VALUE', 'REQUESTS', 'COUNT_ERROR', 'ERROR_RATE', 'MEAN', 'P50', 'P90', 'P99']
+
+
+def get_features(query: dict) -> dict:
+    features = {
+        'aircraft': str(query.get('aircraft', '')).strip(),
+        # Airport codes without coordinates, 'EHAM 52.30 4.76' is EHAM
+        'route': '-'.join(str(query.get(field) or '').split(' ')[0] for field in ('departure_airport', 'arrival_airport')),
+        'pax': str(query.get('pax', ''))
+    }
+    for field in ('avoid_countries', 'avoid_firs'):
+        features[field] = get_length_bucket(query[field]) if isinstance(query.get(field), list) else 'absent'
+    for flag in FLAGS:
+        features[flag] = str(bool(query.get(flag))).lower()
+    return features
+
+
+def get_length_bucket(items: list) -> str:
+    for limit, name in LENGTH_BUCKETS:
+        if len(items) <= limit:
+            return name
+    return f'{LENGTH_BUCKETS[-1][0] + 1}+'
+
+
+class KeyStats:
+    # Latency and failures of one feature value, a coarse histogram keeps thousands of keys cheap
+    def __init__(self, count_error: int = 0):
+        self.histogram = LatencyHistogram(precision=0.05)
+        self.failed = 0
+        self.count_error = count_error
+
+    def record(self, elapsed_time: float, failed: bool) -> None:
+        self.histogram.record(elapsed_time)
+        if failed:
+            self.failed += 1
+
+
+class SpaceSaving:
+    # Top-k heavy hitters of a stream (Metwally et al.): at most `capacity` keys are monitored, a new key
+    # replaces the least frequent one and inherits its count, which is kept as the count error.
+    # Statistics of a key start when the key starts to be monitored
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.counts = {}
+        self.stats = {}
+        # (count, key) pushed when a key is added, refreshed lazily when it is popped for eviction
+        self.heap = []
+
+    def record(self, key, elapsed_time: float, failed: bool) -> None:
+        if key in self.counts:
+            self.counts[key] += 1
+        elif len(self.counts) < self.capacity:
+            self.add(key, 1, 0)
+        else:
+            count = self.pop_least_frequent()
+            self.add(key, count + 1, count)
+        self.stats[key].record(elapsed_time, failed)
+
+    def add(self, key, count: int, count_error: int) -> None:
+        self.counts[key] = count
+        self.stats[key] = KeyStats(count_error)
+        heapq.heappush(self.heap, (count, key))
+
+    def pop_least_frequent(self) -> int:
+        while True:
+            count, key = heapq.heappop(self.heap)
+            if self.counts[key] == count:
+                del self.counts[key]
+                del self.stats[key]
+                return count
+            heapq.heappush(self.heap, (self.counts[key], key))
+
+    def items(self):
+        return self.stats.items()
+
+
+class LatencyBreakdown:
+    # Streaming group-by of latency and failures by query features, memory is bounded by top_keys per dimension
+    def __init__(self, top_keys: int = 200):
+        self.dimensions = {dimension: SpaceSaving(top_keys) for dimension in DIMENSIONS}
+        self.combinations = SpaceSaving(top_keys)
+
+    def record(self, result: dict) -> None:
+        query = result.get('request_body')
+        elapsed_time = result.get('elapsed_time')
+        if not isinstance(query, dict) or elapsed_time is None:
+            return
+        failed = result.get('status_code') != 200 or len(result.get('error_codes') or ()) > 0 or 'exception' in result
+        features = get_features(query)
+        for dimension, values in self.dimensions.items():
+            values.record(features[dimension], elapsed_time, failed)
+        self.combinations.record(tuple(features[dimension] for dimension in COMBINATION_DIMENSIONS), elapsed_time, failed)
+
+    def get_rows(self, dimension: str, percentile: float = 90, min_requests: int = 1) -> list:
+        # Values of a dimension, the slowest first
+        values = self.combinations if dimension == 'combination' else self.dimensions[dimension]
+        rows = []
+        for key, stats in values.items():
+            if stats.histogram.count < min_requests:
+                continue
+            if dimension == 'combination':
+                key = '; '.join(f'{name}={value}' for name, value in zip(COMBINATION_DIMENSIONS, key))
+            rows.append((dimension, key, stats))
+        rows.sort(key=lambda row: row[2].histogram.percentile(percentile), reverse=True)
+        return rows
+
+    def get_slowest_combinations(self, top: int = 20, percentile: float = 90, min_requests: int = 10) -> list:
+        return self.get_rows('combination', percentile, min_requests)[:top]
+
+    def write(self, path: str, percentile: float = 90, min_requests: int = 1) -> None:
+        write_breakdown([row for dimension in DIMENSIONS for row in self.get_rows(dimension, percentile, min_requests)], path)
+
+    def write_slowest_combinations(self, path: str, top: int = 100, percentile: float = 90, min_requests: int = 10) -> None:
+        write_breakdown(self.get_slowest_combinations(top, percentile, min_requests), path)
+
+
+def write_breakdown(rows: list, path: str) -> None:
+    with open(path, 'w', newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow(BREAKDOWN_HEADERS)
+        for dimension, key, stats in rows:
+            histogram = stats.histogram
+            writer.writerow([
+                dimension,
+                key,
+                histogram.count,
+                stats.count_error,
+                f'{stats.failed / histogram.count:.5f}',
+                f'{histogram.mean():.5f}',
+                f'{histogram.percentile(50):.5f}',
+                f'{histogram.percentile(90):.5f}',
+                f'{histogram.percentile(99):.5f}'
+            ])
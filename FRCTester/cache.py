@@ -0,0 +1,82 @@
+import json
+import sqlite3
+import time
+
+
+class ResponseCache:
+    # Results of successful requests stored in SQLite by query hash,
+    # entries older than ttl are ignored and removed, the oldest entries go first above max_entries.
+    # Puts are committed every commit_rows rows or commit_interval seconds, expired entries are removed
+    # every evict_interval seconds
+    def __init__(self, path: str, ttl: float = 86400, max_entries: int = 1_000_000, commit_rows: int = 100,
+                 commit_interval: float = 1.0, evict_interval: float = 60.0):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.commit_rows = commit_rows
+        self.commit_interval = commit_interval
+        self.evict_interval = evict_interval
+        self.uncommitted = 0
+        self.committed_at = time.monotonic()
+        self.evicted_at = time.monotonic()
+        self.entries = 0
+        self.connection = sqlite3.connect(path)
+        self.connection.execute('CREATE TABLE IF NOT EXISTS responses '
+                                '(query_hash TEXT PRIMARY KEY, created_at REAL NOT NULL, result TEXT NOT NULL)')
+        self.connection.execute('CREATE INDEX IF NOT EXISTS responses_created_at ON responses (created_at)')
+        self.evict()
+
+    def get(self, query_hash: str) -> dict|None:
+        row = self.connection.execute('SELECT created_at, result FROM responses WHERE query_hash = ?',
+                                      (query_hash,)).fetchone()
+        if row is None or row[0] < time.time() - self.ttl:
+            return None
+        result = json.loads(row[1])
+        for key in ('error_codes', 'error_messages', 'warning_codes', 'warning_messages'):
+            result[key] = set(result.get(key, []))
+        return result
+
+    def put(self, query_hash: str, result: dict) -> None:
+        stored_result = {
+            'elapsed_time': result.get('elapsed_time'),
+            'status_code': result.get('status_code'),
+            'phases': result.get('phases', {})
+        }
+        for key in ('error_codes', 'error_messages', 'warning_codes', 'warning_messages'):
+            stored_result[key] = sorted(result.get(key, []), key=str)
+        replaced = self.connection.execute('SELECT 1 FROM responses WHERE query_hash = ?', (query_hash,)).fetchone()
+        self.connection.execute('INSERT OR REPLACE INTO responses VALUES (?, ?, ?)',
+                                (query_hash, time.time(), json.dumps(stored_result)))
+        if replaced is None:
+            self.entries += 1
+        if self.entries > self.max_entries:
+            # The oldest entry makes room for the new one, found through the created_at index
+            self.connection.execute('DELETE FROM responses WHERE query_hash = '
+                                    '(SELECT query_hash FROM responses ORDER BY created_at LIMIT 1)')
+            self.entries -= 1
+        self.uncommitted += 1
+        now = time.monotonic()
+        if now - self.evicted_at >= self.evict_interval:
+            self.evict()
+        elif self.uncommitted >= self.commit_rows or now - self.committed_at >= self.commit_interval:
+            self.commit()
+
+    def commit(self) -> None:
+        self.connection.commit()
+        self.uncommitted = 0
+        self.committed_at = time.monotonic()
+
+    def evict(self) -> None:
+        self.connection.execute('DELETE FROM responses WHERE created_at < ?', (time.time() - self.ttl,))
+        self.connection.execute('DELETE FROM responses WHERE query_hash IN '
+                                '(SELECT query_hash FROM responses ORDER BY created_at DESC LIMIT -1 OFFSET ?)',
+                                (self.max_entries,))
+        self.commit()
+        self.entries = len(self)
+        self.evicted_at = time.monotonic()
+
+    def __len__(self) -> int:
+        return self.connection.execute('SELECT COUNT(*) FROM responses').fetchone()[0]
+
+    def close(self) -> None:
+        self.evict()
+        self.connection.close()
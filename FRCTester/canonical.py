@@ -0,0 +1,39 @@
+from datetime import datetime
+import hashlib
+import json
+
+
+DATETIME_FORMATS = ('%Y-%m-%d %H:%M', '%Y-%m-%dT%H:%M', '%Y-%m-%d %H:%M:%S', '%Y-%m-%dT%H:%M:%S')
+
+
+def canonicalize_query(query: dict) -> dict:
+    # Same request written in different ways gets the same form: sorted keys,
+    # sorted lists without duplicates, datetimes as YYYY-MM-DDTHH:MM:SS
+    canonical = {}
+    for key in sorted(query):
+        value = query[key]
+        if isinstance(value, list):
+            value = sorted({str(item).strip() for item in value})
+        elif isinstance(value, str):
+            value = value.strip()
+            if key.endswith('_datetime'):
+                value = canonicalize_datetime(value)
+        canonical[key] = value
+    return canonical
+
+
+def canonicalize_datetime(value: str) -> str:
+    for datetime_format in DATETIME_FORMATS:
+        try:
+            return datetime.strptime(value, datetime_format).strftime('%Y-%m-%dT%H:%M:%S')
+        except ValueError:
+            continue
+    return value
+
+
+def get_canonical_body(query: dict) -> str:
+    return json.dumps(canonicalize_query(query), sort_keys=True, separators=(',', ':'), ensure_ascii=False)
+
+
+def get_query_hash(query: dict) -> str:
+    return hashlib.sha1(get_canonical_body(query).encode('utf-8')).hexdigest()
@@ -0,0 +1,113 @@
+import csv
+import itertools
+import logging
+import time
+
+import aiohttp
+from typing import Iterator
+
+import main
+from histogram import LatencyHistogram
+
+
+CAPACITY_HEADERS = ['STEP', 'CONCURRENCY', 'REQUESTS', 'THROUGHPUT', 'P50', 'P90', 'P99', 'ERROR_RATE', 'WITHIN_SLO']
+
+
+def is_failed(result: dict) -> bool:
+    return result.get('status_code') != 200 or len(result.get('error_codes', ())) > 0 or 'exception' in result
+
+
+def run_for(queries: list, duration: float) -> Iterator[dict]:
+    # Cycles through the queries until the step time is over
+    deadline = time.monotonic() + duration
+    for query in itertools.cycle(queries):
+        if time.monotonic() >= deadline:
+            return
+        yield query
+
+
+async def run_step(queries: list, concurrency: int, duration: float, session: aiohttp.ClientSession) -> dict:
+    histogram = LatencyHistogram()
+    failed = 0
+
+    def record(result: dict):
+        nonlocal failed
+        histogram.record(result.get('elapsed_time'))
+        if is_failed(result):
+            failed += 1
+
+    start_time = time.monotonic()
+    # Every try is a result: retried or hedged requests would hide the failures and latency the search is looking for
+    await main.run_api_queries(run_for(queries, duration), record, concurrency, concurrency, rate_limit=0,
+                               session=session, progress_bar=False, hedge=False, retries=0)
+    elapsed_time = time.monotonic() - start_time
+    return {
+        'concurrency': concurrency,
+        'requests': histogram.count,
+        'throughput': histogram.count / elapsed_time if elapsed_time > 0 else 0.0,
+        'p50': histogram.percentile(50),
+        'p90': histogram.percentile(90),
+        'p99': histogram.percentile(99),
+        'error_rate': failed / histogram.count if histogram.count else 0.0
+    }
+
+
+async def search_capacity(queries: list, slo_p99: float, max_error_rate: float = 0.01, start: int = 1,
+                          increase: int = 4, decrease: float = 0.5, step_duration: float = 30,
+                          max_steps: int = 20, max_violations: int = 3,
+                          session: aiohttp.ClientSession|None = None) -> list:
+    # AIMD controller: concurrency grows by `increase` while p99 and the error rate are within the SLO
+    # and is multiplied by `decrease` after a violation, the search ends after max_violations violations
+    logger = logging.getLogger('FRC TESTER')
+    if not queries:
+        raise ValueError('No queries to send')
+    steps = []
+    concurrency = start
+    violations = 0
+    own_session = session is None
+    if own_session:
+        session = main.create_session()
+    try:
+        for step in range(1, max_steps + 1):
+            result = await run_step(queries, concurrency, step_duration, session)
+            result['step'] = step
+            result['within_slo'] = result['p99'] <= slo_p99 and result['error_rate'] <= max_error_rate
+            steps.append(result)
+            logger.info(f'Step {step}: concurrency {concurrency}, {result["throughput"]:.2f} req/s, '
+                        f'p99 {result["p99"]:.2f} ms, errors {result["error_rate"]:.2%}'
+                        f'{"" if result["within_slo"] else " - SLO violated"}')
+            if result['within_slo']:
+                concurrency += increase
+            else:
+                violations += 1
+                if violations >= max_violations:
+                    break
+                concurrency = max(1, int(concurrency * decrease))
+    finally:
+        if own_session:
+            await session.close()
+    return steps
+
+
+def find_knee(steps: list) -> dict|None:
+    # Highest throughput reached within the SLO
+    within_slo = [step for step in steps if step['within_slo']]
+    return max(within_slo, key=lambda step: step['throughput']) if within_slo else None
+
+
+def write_capacity(steps: list, path: str) -> None:
+    with open(path, 'w', newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow(CAPACITY_HEADERS)
+        for step in steps:
+            writer.writerow([
+                step['step'],
+                step['concurrency'],
+                step['requests'],
+                f'{step["throughput"]:.2f}',
+                f'{step["p50"]:.5f}',
+                f'{step["p90"]:.5f}',
+                f'{step["p99"]:.5f}',
+                f'{step["error_rate"]:.5f}',
+                step['within_slo']
+            ])
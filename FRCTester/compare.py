@@ -0,0 +1,216 @@
+from collections import Counter
+import ast
+import csv
+import gzip
+import heapq
+import json
+import math
+import os
+import random
+import sys
+import tempfile
+
+from typing import Iterator
+
+from canonical import get_query_hash
+from histogram import PERCENTILES, LatencyHistogram
+
+
+PARTITIONS = 64
+SAMPLE_SIZE = 10000
+REGRESSION_HEADERS = ['REQUEST_BODY', 'QUERY_HASH', 'BASE_TIME', 'NEW_TIME', 'DELTA', 'DELTA_PERCENT']
+
+csv.field_size_limit(sys.maxsize)
+
+
+class ReportSide:
+    # Streaming statistics of one report: latency histogram, a uniform sample of latencies and code counts
+    def __init__(self, seed: int):
+        self.histogram = LatencyHistogram()
+        self.sample = []
+        self.random = random.Random(seed)
+        self.error_codes = Counter()
+        self.warning_codes = Counter()
+        self.not_sent = 0
+        self.no_response = 0
+
+    def record(self, row: dict) -> float|None:
+        # Cached and duplicate rows repeat the response of another request, only API responses are compared
+        if row.get('SOURCE') not in (None, '', 'api'):
+            self.not_sent += 1
+            return None
+        # Requests without a response are counted apart, their time is the time it took to fail
+        if str(row.get('RESPONSE_CODE')) == '0':
+            self.no_response += 1
+            return None
+        for code in split_codes(row.get('ERROR_CODES')):
+            self.error_codes[code] += 1
+        for code in split_codes(row.get('WARNING_CODES')):
+            self.warning_codes[code] += 1
+        try:
+            response_time = float(row.get('RESPONSE_TIME'))
+        except (TypeError, ValueError):
+            return None
+        self.histogram.record(response_time)
+        # Reservoir sampling keeps every latency with the same probability
+        if len(self.sample) < SAMPLE_SIZE:
+            self.sample.append(response_time)
+        else:
+            index = self.random.randrange(self.histogram.count)
+            if index < SAMPLE_SIZE:
+                self.sample[index] = response_time
+        return response_time
+
+
+def compare_reports(base_path: str, new_path: str, output_path: str, top: int = 100,
+                    partitions: int = PARTITIONS) -> list:
+    # Reports are split into partition files by query hash, then joined one partition at a time,
+    # so memory depends on the partition size and not on the report size
+    base = ReportSide(seed=1)
+    new = ReportSide(seed=2)
+    worst = []
+    joined = 0
+    delta_total = 0.0
+    with tempfile.TemporaryDirectory() as directory:
+        write_partitions(base_path, f'{directory}/base', partitions, base, with_body=False)
+        write_partitions(new_path, f'{directory}/new', partitions, new, with_body=True)
+        for partition in range(partitions):
+            base_times = {}
+            for query_hash, response_time, _ in read_partition(f'{directory}/base', partition):
+                base_times.setdefault(query_hash, []).append(response_time)
+            new_times = {}
+            bodies = {}
+            for query_hash, response_time, body in read_partition(f'{directory}/new', partition):
+                if query_hash in base_times:
+                    new_times.setdefault(query_hash, []).append(response_time)
+                    bodies[query_hash] = body
+            for query_hash, times in new_times.items():
+                base_time = sum(base_times[query_hash]) / len(base_times[query_hash])
+                new_time = sum(times) / len(times)
+                delta = new_time - base_time
+                joined += 1
+                delta_total += delta
+                item = (delta, query_hash, base_time, new_time, bodies[query_hash])
+                if len(worst) < top:
+                    heapq.heappush(worst, item)
+                else:
+                    heapq.heappushpop(worst, item)
+
+    worst.sort(reverse=True)
+    with open(output_path, 'w', newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow(REGRESSION_HEADERS)
+        for delta, query_hash, base_time, new_time, body in worst:
+            delta_percent = delta / base_time * 100 if base_time > 0 else 0.0
+            writer.writerow([body, query_hash, f'{base_time:.5f}', f'{new_time:.5f}', f'{delta:.5f}', f'{delta_percent:.2f}'])
+
+    return get_summary(base, new, joined, delta_total, output_path)
+
+
+def get_summary(base: ReportSide, new: ReportSide, joined: int, delta_total: float, output_path: str) -> list:
+    lines = [f'Requests: base {base.histogram.count}, new {new.histogram.count}, matched queries {joined}']
+    if base.not_sent or new.not_sent:
+        lines.append(f'Cached or duplicate rows left out: base {base.not_sent}, new {new.not_sent}')
+    if base.no_response or new.no_response:
+        lines.append(f'Requests without a response: base {base.no_response}, new {new.no_response}')
+    if joined > 0:
+        lines.append(f'Mean latency delta of matched queries: {delta_total / joined:+.2f} ms')
+    for percentile in PERCENTILES:
+        base_value = base.histogram.percentile(percentile)
+        new_value = new.histogram.percentile(percentile)
+        shift = (new_value - base_value) / base_value * 100 if base_value > 0 else 0.0
+        lines.append(f'p{percentile:g}: {base_value:.2f} -> {new_value:.2f} ms ({shift:+.1f}%)')
+    lines.append(f'max: {base.histogram.max:.2f} -> {new.histogram.max:.2f} ms')
+    if base.sample and new.sample:
+        u, p_value = mann_whitney_u(base.sample, new.sample)
+        verdict = 'significant' if p_value < 0.05 else 'not significant'
+        lines.append(f'Mann-Whitney U={u:.0f}, p={p_value:.4g} ({verdict} at 0.05)')
+    for name, base_codes, new_codes in (('error', base.error_codes, new.error_codes),
+                                        ('warning', base.warning_codes, new.warning_codes)):
+        appeared = {code: count for code, count in new_codes.items() if code not in base_codes}
+        if appeared:
+            codes = ', '.join(f'{code} ({count})' for code, count in sorted(appeared.items()))
+            lines.append(f'New {name} codes: {codes}')
+    lines.append(f'Worst regressions written to {output_path}')
+    return lines
+
+
+def mann_whitney_u(first: list, second: list) -> tuple[float, float]:
+    # Two-sided test with the normal approximation and tie correction
+    values = sorted([(value, 0) for value in first] + [(value, 1) for value in second])
+    first_size = len(first)
+    second_size = len(second)
+    size = first_size + second_size
+    rank_sum = 0.0
+    tie_term = 0.0
+    index = 0
+    while index < size:
+        end = index
+        while end + 1 < size and values[end + 1][0] == values[index][0]:
+            end += 1
+        rank = (index + end) / 2 + 1
+        ties = end - index + 1
+        tie_term += ties ** 3 - ties
+        rank_sum += rank * sum(1 for position in range(index, end + 1) if values[position][1] == 0)
+        index = end + 1
+    u = rank_sum - first_size * (first_size + 1) / 2
+    mean = first_size * second_size / 2
+    variance = first_size * second_size / 12 * ((size + 1) - tie_term / (size * (size - 1))) if size > 1 else 0.0
+    if variance <= 0:
+        return u, 1.0
+    z = (abs(u - mean) - 0.5) / math.sqrt(variance)
+    return u, min(1.0, math.erfc(max(z, 0.0) / math.sqrt(2)))
+
+
+def write_partitions(path: str, prefix: str, partitions: int, side: ReportSide, with_body: bool) -> None:
+    files = [open(f'{prefix}.{partition}', 'w') for partition in range(partitions)]
+    try:
+        for row in read_report(path):
+            response_time = side.record(row)
+            query_hash = row.get('QUERY_HASH') or get_row_query_hash(row)
+            if response_time is None or query_hash is None:
+                continue
+            body = row.get('REQUEST_BODY') if with_body else ''
+            if not isinstance(body, str):
+                body = json.dumps(body, ensure_ascii=False)
+            files[int(query_hash[:8], 16) % partitions].write(
+                json.dumps([query_hash, response_time, body], ensure_ascii=False) + '\n')
+    finally:
+        for file in files:
+            file.close()
+
+
+def read_partition(prefix: str, partition: int) -> Iterator[tuple[str, float, str]]:
+    with open(f'{prefix}.{partition}') as file:
+        for line in file:
+            yield tuple(json.loads(line))
+
+
+def read_report(path: str) -> Iterator[dict]:
+    # Reports in any of the writer formats, older reports without QUERY_HASH are supported
+    opener = gzip.open if path.endswith('.gz') else open
+    with opener(path, 'rt', newline='') as file:
+        if '.ndjson' in os.path.basename(path):
+            for line in file:
+                if line.strip():
+                    yield json.loads(line)
+        else:
+            yield from csv.DictReader(file)
+
+
+def get_row_query_hash(row: dict) -> str|None:
+    body = row.get('REQUEST_BODY')
+    if isinstance(body, str):
+        try:
+            body = ast.literal_eval(body)
+        except (ValueError, SyntaxError):
+            return None
+    return get_query_hash(body) if isinstance(body, dict) else None
+
+
+def split_codes(codes) -> list:
+    if not codes:
+        return []
+    if isinstance(codes, list):
+        return codes
+    return [code.strip() for code in str(codes).split(';') if code.strip()]
@@ -0,0 +1,142 @@
+from multiprocessing.connection import Client, Connection, Listener, wait
+import asyncio
+import csv
+import logging
+import multiprocessing
+import os
+import time
+
+from tqdm import tqdm
+from typing import Callable, Iterator
+
+import main
+from histogram import RunStats
+from metrics import Metrics
+
+
+# Results are sent to the coordinator in batches of RESULTS_BATCH or every RESULTS_INTERVAL seconds
+RESULTS_BATCH = 100
+RESULTS_INTERVAL = 1.0
+
+
+def get_shard_queries(path: str, shard_index: int, shard_count: int) -> Iterator[dict]:
+    # Every shard reads the whole log but decodes only its own flight calculator rows
+    with open(path) as file:
+        index = 0
+        for row in csv.reader(file, delimiter=','):
+            if not main.is_query_row(row):
+                continue
+            if index % shard_count == shard_index:
+                query = main.get_query_data(row)
+                if query is not None:
+                    yield query
+            index += 1
+
+
+def run_shard(connection: Connection, shard_index: int, shard_count: int) -> None:
+    # Sends results to the coordinator in batches together with the live metrics counts of the shard,
+    # then the latency histograms of the shard
+    stats = RunStats()
+    batch = []
+    sent_at = time.monotonic()
+
+    def send_result(result: dict):
+        nonlocal sent_at
+        stats.record(result)
+        batch.append(result)
+        if len(batch) >= RESULTS_BATCH or time.monotonic() - sent_at >= RESULTS_INTERVAL:
+            connection.send(('results', batch.copy(), main.METRICS.take_counts()))
+            batch.clear()
+            sent_at = time.monotonic()
+
+    try:
+        path = f'{main.BASE_DIR}/{os.environ.get("FILENAME")}'
+        queries = get_shard_queries(path, shard_index, shard_count)
+        # Rate and concurrency are settings of the whole run, every shard gets its share
+        asyncio.run(main.run_api_queries(queries, send_result, max(1, main.CONCURRENCY // shard_count),
+                                         rate_limit=main.RATE_LIMIT / shard_count,
+                                         rate_burst=max(1, main.RATE_BURST // shard_count), progress_bar=False))
+        if batch:
+            connection.send(('results', batch, main.METRICS.take_counts()))
+        stats.finish()
+        connection.send(('stats', stats.to_dict()))
+    except Exception as error:
+        connection.send(('error', f'Shard {shard_index}: {error!r}'))
+        raise
+    finally:
+        connection.close()
+
+
+def run_distributed(on_result: Callable[[dict], None], workers: int, agents: int = 0,
+                    address: tuple[str, int]|None = None, authkey: bytes = b'', metrics: Metrics|None = None) -> RunStats:
+    # Shards the log between local worker processes and remote agents, every shard has its own event loop
+    # and session; results are passed to on_result in this process, shard counts are added to the live metrics
+    # and shard histograms are merged
+    logger = logging.getLogger('FRC TESTER')
+    if agents > 0 and not authkey:
+        raise ValueError('AGENT_AUTHKEY must be set to a secret key shared with the agents')
+    shard_count = workers + agents
+    connections = []
+    processes = []
+
+    if agents > 0:
+        with Listener(address, authkey=authkey) as listener:
+            logger.info(f'Waiting for {agents} agents at {address[0]}:{address[1]}...')
+            for agent_index in range(agents):
+                connection = listener.accept()
+                connection.send(('shard', workers + agent_index, shard_count))
+                connections.append(connection)
+                logger.info(f'Agent {agent_index + 1} of {agents} joined from {listener.last_accepted}')
+
+    # Spawned processes do not inherit locks held by the threads of this process (progress bars, servers)
+    context = multiprocessing.get_context('spawn')
+    for shard_index in range(workers):
+        reader, writer = context.Pipe(duplex=False)
+        process = context.Process(target=run_shard, args=(writer, shard_index, shard_count), daemon=True)
+        process.start()
+        writer.close()
+        connections.append(reader)
+        processes.append(process)
+
+    stats = RunStats()
+    errors = []
+    with tqdm() as progress:
+        while connections:
+            for connection in wait(connections):
+                try:
+                    message, *data = connection.recv()
+                except EOFError:
+                    connections.remove(connection)
+                    continue
+                if message == 'results':
+                    for result in data[0]:
+                        on_result(result)
+                    progress.update(len(data[0]))
+                    if metrics is not None:
+                        metrics.merge_counts(id(connection), data[1])
+                elif message == 'stats':
+                    stats.merge(RunStats.from_dict(data[0]))
+                elif message == 'error':
+                    errors.append(data[0])
+    for process in processes:
+        process.join()
+    stats.finish()
+    if errors:
+        raise RuntimeError('; '.join(errors))
+    return stats
+
+
+def run_agent(address: tuple[str, int], authkey: bytes) -> None:
+    # Remote part of a distributed run: gets its shard from the coordinator and streams results back
+    logger = logging.getLogger('FRC TESTER')
+    if not authkey:
+        raise ValueError('AGENT_AUTHKEY must be set to the secret key of the coordinator')
+    connection = Client(address, authkey=authkey)
+    _, shard_index, shard_count = connection.recv()
+    logger.info(f'Running shard {shard_index + 1} of {shard_count}...')
+    run_shard(connection, shard_index, shard_count)
+
+
+def parse_address(address: str) -> tuple[str, int]:
+    host, _, port = address.rpartition(':')
+    return host or '127.0.0.1', int(port)
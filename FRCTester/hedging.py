@@ -0,0 +1,21 @@
+from histogram import LatencyHistogram
+
+
+class Hedger:
+    # Delay before a duplicate request is sent: the given percentile of the latencies seen so far,
+    # recalculated every `refresh` responses, no hedging until min_samples responses were seen
+    def __init__(self, percentile: float = 95, min_samples: int = 20, refresh: int = 100):
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self.refresh = refresh
+        self.histogram = LatencyHistogram()
+        self.delay = None
+
+    def get_delay(self) -> float|None:
+        return self.delay
+
+    def record(self, elapsed_time: float) -> None:
+        self.histogram.record(elapsed_time)
+        count = self.histogram.count
+        if count >= self.min_samples and (self.delay is None or count % self.refresh == 0):
+            self.delay = self.histogram.percentile(self.percentile)
@@ -0,0 +1,146 @@
+from array import array
+import json
+import math
+import time
+
+
+PERCENTILES = (50, 90, 99, 99.9)
+PHASES = ('total', 'pool_wait', 'dns', 'connect', 'ttfb', 'body')
+
+
+class LatencyHistogram:
+    # Log-bucketed histogram: every bucket is `precision` wider than the previous one,
+    # so percentiles keep the same relative error from microseconds to hours in a few thousand counters
+    def __init__(self, lowest: float = 0.001, highest: float = 3_600_000, precision: float = 0.01):
+        self.lowest = lowest
+        self.highest = highest
+        self.precision = precision
+        self.log_base = math.log1p(precision)
+        self.counts = array('Q', bytes(8 * (self.get_index(highest) + 1)))
+        self.count = 0
+        self.total = 0.0
+        self.min = math.inf
+        self.max = 0.0
+
+    def get_index(self, value: float) -> int:
+        if value <= self.lowest:
+            return 0
+        return int(math.log(value / self.lowest) / self.log_base) + 1
+
+    def get_value(self, index: int) -> float:
+        # Upper bound of the bucket
+        return self.lowest * math.exp(self.log_base * index)
+
+    def record(self, value: float, count: int = 1) -> None:
+        value = min(max(value, 0.0), self.highest)
+        self.counts[self.get_index(value)] += count
+        self.count += count
+        self.total += value * count
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+
+    def merge(self, other: 'LatencyHistogram') -> None:
+        if (self.lowest, self.highest, self.precision) != (other.lowest, other.highest, other.precision):
+            raise ValueError('Histograms have different bucket settings')
+        for index, count in enumerate(other.counts):
+            if count:
+                self.counts[index] += count
+        self.count += other.count
+        self.total += other.total
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+    def percentile(self, percentile: float) -> float:
+        if self.count == 0:
+            return 0.0
+        rank = max(1, math.ceil(self.count * percentile / 100))
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                return min(max(self.get_value(index), self.min), self.max)
+        return self.max
+
+    def mean(self) -> float:
+        return self.total / self.count if self.count else 0.0
+
+    def to_dict(self) -> dict:
+        return {
+            'lowest': self.lowest,
+            'highest': self.highest,
+            'precision': self.precision,
+            'count': self.count,
+            'total': self.total,
+            'min': self.min if self.count else 0.0,
+            'max': self.max,
+            'buckets': {index: count for index, count in enumerate(self.counts) if count}
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> 'LatencyHistogram':
+        histogram = cls(data['lowest'], data['highest'], data['precision'])
+        for index, count in data['buckets'].items():
+            histogram.counts[int(index)] = count
+        histogram.count = data['count']
+        histogram.total = data['total']
+        histogram.min = data['min'] if data['count'] else math.inf
+        histogram.max = data['max']
+        return histogram
+
+
+class RunStats:
+    # Latency histograms of every request phase collected during one run
+    def __init__(self):
+        self.histograms = {phase: LatencyHistogram() for phase in PHASES}
+        self.started_at = time.monotonic()
+        self.finished_at = None
+
+    def record(self, result: dict) -> None:
+        self.histograms['total'].record(result.get('elapsed_time'))
+        for phase, value in result.get('phases', {}).items():
+            if phase in self.histograms:
+                self.histograms[phase].record(value)
+
+    def merge(self, other: 'RunStats') -> None:
+        # Only histograms are merged, the duration stays the one measured by this object
+        for phase, histogram in other.histograms.items():
+            self.histograms[phase].merge(histogram)
+
+    def finish(self) -> None:
+        self.finished_at = time.monotonic()
+
+    def duration(self) -> float:
+        return (self.finished_at or time.monotonic()) - self.started_at
+
+    def throughput(self) -> float:
+        duration = self.duration()
+        return self.histograms['total'].count / duration if duration > 0 else 0.0
+
+    def summary(self) -> list:
+        lines = [f'Requests: {self.histograms["total"].count}, duration: {self.duration():.2f} s, '
+                 f'throughput: {self.throughput():.2f} req/s']
+        for phase, histogram in self.histograms.items():
+            if histogram.count == 0:
+                continue
+            percentiles = ', '.join(f'p{p:g}={histogram.percentile(p):.2f}' for p in PERCENTILES)
+            lines.append(f'{phase:>9} ms: {percentiles}, max={histogram.max:.2f} (n={histogram.count})')
+        return lines
+
+    def to_dict(self) -> dict:
+        return {
+            'duration': self.duration(),
+            'throughput': self.throughput(),
+            'histograms': {phase: histogram.to_dict() for phase, histogram in self.histograms.items()}
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> 'RunStats':
+        stats = cls()
+        for phase, histogram in data['histograms'].items():
+            stats.histograms[phase] = LatencyHistogram.from_dict(histogram)
+        stats.finished_at = stats.started_at + data['duration']
+        return stats
+
+    def write(self, path: str) -> None:
+        with open(path, 'w') as file:
+            json.dump(self.to_dict(), file)
@@ -0,0 +1,79 @@
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from collections import deque
+import csv
+import io
+import mmap
+import os
+
+from alive_progress import alive_bar
+from typing import Callable, Iterator
+
+
+def get_chunks(path: str, chunk_size: int) -> list[tuple[int, int]]:
+    # Byte ranges of about chunk_size, every range ends right after a line break outside quoted fields,
+    # so a quoted field with a line break stays in one range. Quotes escaped as "" do not change the parity
+    size = os.path.getsize(path)
+    if size == 0:
+        return []
+    chunks = []
+    with open(path, 'rb') as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        start = 0
+        while start < size:
+            end = start
+            quotes = 0
+            search = min(start + chunk_size, size) - 1
+            while True:
+                line_end = data.find(b'\n', search)
+                line_end = size if line_end < 0 else line_end + 1
+                quotes += data[end:line_end].count(b'"')
+                end = search = line_end
+                if quotes % 2 == 0 or end == size:
+                    break
+            chunks.append((start, end))
+            start = end
+    return chunks
+
+
+def parse_chunk(path: str, start: int, end: int, parse_row: Callable[[list], object]) -> list:
+    with open(path, 'rb') as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        text = data[start:end].decode('utf-8')
+    items = []
+    for row in csv.reader(io.StringIO(text, newline=''), delimiter=','):
+        item = parse_row(row)
+        if item is not None:
+            items.append(item)
+    return items
+
+
+def parse_log_parallel(path: str, parse_row: Callable[[list], object], workers: int,
+                       chunk_size: int, ordered: bool = True) -> Iterator:
+    # Chunks are parsed in worker processes, at most 2 chunks per worker are waiting to be consumed.
+    # parse_row must be a module-level function, so it can be sent to the workers
+    chunks = deque(get_chunks(path, chunk_size))
+    total = chunks[-1][1] if chunks else 0
+    with ProcessPoolExecutor(max_workers=workers) as executor, alive_bar(total, title='Parsing') as progress:
+        pending = deque()
+        chunk_sizes = {}
+
+        def submit():
+            while chunks and len(pending) < workers * 2:
+                start, end = chunks.popleft()
+                future = executor.submit(parse_chunk, path, start, end, parse_row)
+                chunk_sizes[future] = end - start
+                pending.append(future)
+
+        def done(future: Future) -> list:
+            pending.remove(future)
+            progress(chunk_sizes.pop(future))
+            return future.result()
+
+        submit()
+        while pending:
+            if ordered:
+                future = pending[0]
+                future.result()
+            else:
+                future = next(iter(wait(pending, return_when=FIRST_COMPLETED).done))
+            items = done(future)
+            submit()
+            yield from items
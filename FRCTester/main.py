@@ -1,201 +1,487 @@
 from pathlib import Path
+from collections import Counter, OrderedDict
+import argparse
+import functools
+import itertools
 import csv
+import json
 import os
+import random
 import urllib.parse
 import time
 import ssl
 import certifi
 import logging
+from datetime import datetime
 
 import asyncio
 import aiohttp
 
 from alive_progress import alive_it
 from tqdm.asyncio import tqdm
+from typing import AsyncIterable, Callable, Iterable, Iterator
+
+try:
+    import orjson
+    json_loads = orjson.loads
+    json_dumps = orjson.dumps
+except ImportError:
+    json_loads = json.loads
+
+    def json_dumps(value) -> bytes:
+        return json.dumps(value, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+
+from breakdown import LatencyBreakdown
+from cache import ResponseCache
+from canonical import get_query_hash
+from compare import compare_reports
+from hedging import Hedger
+from histogram import RunStats
+from metrics import Metrics, MetricsReporter, MetricsServer
+from report import ReportWriter, read_checkpoint, skip_completed
+from results import ResultStore
+from workload import WorkloadModel
+from ingest import parse_log_parallel
+from ratelimit import TokenBucket
 
 
 BASE_DIR = Path(__file__).resolve().parent
 REPORTS_PATH = f'{BASE_DIR}/reports'
 
+# Flight calculator endpoint, can point to the local stand-in (mock_server.py)
+FRC_URL = os.environ.get('FRC_URL', 'https://frc.aviapages.com:443/flight_calculator/')
+
 SSL_CONTEXT = ssl.create_default_context(cafile=certifi.where())
 HEADERS = {
     'Content-Type': 'application/json',
     'Authorization': f'Token {os.environ.get("API_TOKEN")}'
 }
 
+# Number of requests in flight at the same time
+CONCURRENCY = int(os.environ.get('CONCURRENCY', 50))
+# Number of parsed queries buffered ahead of the workers
+QUEUE_SIZE = int(os.environ.get('QUEUE_SIZE', 1000))
+# Number of queries the producer reads from the log at a time
+READ_BATCH = int(os.environ.get('READ_BATCH', 100))
+# Target requests per second (0 - unlimited) and number of requests allowed in a burst
+RATE_LIMIT = float(os.environ.get('RATE_LIMIT', 0))
+RATE_BURST = int(os.environ.get('RATE_BURST', 1))
+# Connection pool settings
+POOL_SIZE = int(os.environ.get('POOL_SIZE', 100))
+POOL_SIZE_PER_HOST = int(os.environ.get('POOL_SIZE_PER_HOST', 0))
+KEEPALIVE_TIMEOUT = float(os.environ.get('KEEPALIVE_TIMEOUT', 15))
+DNS_CACHE_TTL = int(os.environ.get('DNS_CACHE_TTL', 10))
+# Request timeouts in seconds (0 - no timeout): whole request, getting a connection, waiting for data
+TIMEOUT_TOTAL = float(os.environ.get('TIMEOUT_TOTAL', 120))
+TIMEOUT_CONNECT = float(os.environ.get('TIMEOUT_CONNECT', 10))
+TIMEOUT_READ = float(os.environ.get('TIMEOUT_READ', 60))
+# Retries after connection errors, timeouts and RETRY_STATUS_CODES, backoff is random up to
+# RETRY_BACKOFF * 2 ^ attempt seconds, but not more than RETRY_BACKOFF_MAX
+RETRIES = int(os.environ.get('RETRIES', 0))
+RETRY_BACKOFF = float(os.environ.get('RETRY_BACKOFF', 0.5))
+RETRY_BACKOFF_MAX = float(os.environ.get('RETRY_BACKOFF_MAX', 10))
+RETRY_STATUS_CODES = {int(code) for code in os.environ.get('RETRY_STATUS_CODES', '429,502,503,504').split(',') if code}
+# Send a duplicate request when a response takes longer than HEDGE_PERCENTILE of the latencies seen so far
+HEDGE = os.environ.get('HEDGE', 'false') == 'true'
+HEDGE_PERCENTILE = float(os.environ.get('HEDGE_PERCENTILE', 95))
+# Live metrics: summary logged every METRICS_INTERVAL seconds (0 - off), Prometheus /metrics endpoint
+# on METRICS_PORT (0 - off), latency percentiles over the last METRICS_WINDOW seconds
+METRICS_INTERVAL = float(os.environ.get('METRICS_INTERVAL', 10))
+METRICS_PORT = int(os.environ.get('METRICS_PORT', 0))
+METRICS_WINDOW = float(os.environ.get('METRICS_WINDOW', 60))
+# Number of processes parsing the log (1 - parse in the main process), size of the log chunk sent to a process
+# and whether queries keep the log order when parsed in parallel
+PARSE_WORKERS = int(os.environ.get('PARSE_WORKERS', 1))
+PARSE_CHUNK_SIZE = int(os.environ.get('PARSE_CHUNK_SIZE', 16 * 1024 * 1024))
+PARSE_ORDERED = os.environ.get('PARSE_ORDERED', 'true') == 'true'
+# Send every distinct query once and copy its response to the repeats, responses of at most
+# DEDUPLICATE_MAX_ENTRIES recently seen queries are kept
+DEDUPLICATE = os.environ.get('DEDUPLICATE', 'false') == 'true'
+DEDUPLICATE_MAX_ENTRIES = int(os.environ.get('DEDUPLICATE_MAX_ENTRIES', 100_000))
+# SQLite file of cached responses (empty - no cache), cached responses expire after CACHE_TTL seconds
+CACHE_PATH = os.environ.get('CACHE_PATH', '')
+CACHE_TTL = float(os.environ.get('CACHE_TTL', 86400))
+CACHE_MAX_ENTRIES = int(os.environ.get('CACHE_MAX_ENTRIES', 1_000_000))
+# Number of local processes sending requests, number of remote agents (python main.py agent HOST:PORT)
+# joining the run at COORDINATOR_ADDRESS
+WORKERS = int(os.environ.get('WORKERS', 1))
+AGENTS = int(os.environ.get('AGENTS', 0))
+# Messages between the coordinator and agents are pickles, the key must be secret and is required with agents
+COORDINATOR_ADDRESS = os.environ.get('COORDINATOR_ADDRESS', '127.0.0.1:6000')
+AGENT_AUTHKEY = os.environ.get('AGENT_AUTHKEY', '').encode('utf-8')
+# Report file format: csv, csv.gz, ndjson or ndjson.gz, rows are flushed every REPORT_FLUSH_ROWS rows
+# or REPORT_FLUSH_INTERVAL seconds
+REPORT_FORMAT = os.environ.get('REPORT_FORMAT', 'csv')
+REPORT_FLUSH_ROWS = int(os.environ.get('REPORT_FLUSH_ROWS', 1000))
+REPORT_FLUSH_INTERVAL = float(os.environ.get('REPORT_FLUSH_INTERVAL', 5))
+# Replay speed multiplier for the original request timestamps (0 - send as fast as the workers allow)
+REPLAY_SPEED = float(os.environ.get('REPLAY_SPEED', 0))
+
+REPORT_HEADERS = ['REQUEST_BODY', 'RESPONSE_TIME', 'RESPONSE_CODE', 'ERROR_CODES', 'ERROR_MESSAGES', 'WARNING_CODES', 'WARNING_MESSAGES', 'WAIT_TIME',
+                  'SCHEDULED_TIME', 'SEND_TIME', 'POOL_WAIT_TIME', 'DNS_TIME', 'CONNECT_TIME', 'TTFB_TIME', 'BODY_TIME',
+                  'QUERY_HASH', 'SOURCE',
+                  'ATTEMPTS', 'HEDGED', 'HEDGE_WINNER', 'HEDGE_DELAY', 'EXCEPTION']
+
+# Number of synthetic queries with the mix of the log sent instead of the log (0 - send the log) and their seed
+SYNTHETIC_QUERIES = int(os.environ.get('SYNTHETIC_QUERIES', 0))
+SYNTHETIC_SEED = int(os.environ.get('SYNTHETIC_SEED', 1))
+# Number of values kept per query feature in the latency breakdown, the most frequent ones are kept
+BREAKDOWN_TOP_KEYS = int(os.environ.get('BREAKDOWN_TOP_KEYS', 200))
+
+JSON_DECODER = json.JSONDecoder()
+METRICS = Metrics(METRICS_WINDOW)
+
 logging.basicConfig(level=logging.INFO)
 
 
-def main():
+def main(resume: bool = False):
     logger = logging.getLogger('FRC TESTER')
     
     logger.info('Start of FRC requests testing...')
+    # Checked before the report is opened, a refused distributed run does not truncate it
+    if AGENTS > 0 and not AGENT_AUTHKEY:
+        raise ValueError('AGENT_AUTHKEY must be set to a secret key shared with the agents')
     
-    queries = get_queries()
-    results = asyncio.run(test_api_queries(queries))
-    with open(f'{REPORTS_PATH}/report.csv', 'w') as file:
-        writer = csv.writer(file)
-        # HEADERS
-        writer.writerow(['REQUEST_BODY', 'RESPONSE_TIME', 'RESPONSE_CODE', 'ERROR_CODES', 'ERROR_MESSAGES', 'WARNING_CODES', 'WARNING_MESSAGES'])
-        
-        # ROWS
-        for result in results:
-            row = []
-            # REQUEST_BODY
-            row.append(result.get('request_body'))
-            
-            # RESPONSE_TIME
-            row.append("{:.5f}".format(result.get('elapsed_time')))
-            
-            # RESPONSE_CODE
-            row.append(result.get('status_code'))
-            
-            # ERRORS
-            error_codes = ''
-            if len(result.get('error_codes')) > 0:
-                for error_code in result.get('error_codes'):
-                    error_codes += f'{error_code}; '
-            error_messages = ''
-            if len(result.get('error_messages')) > 0:
-                for error_message in result.get('error_messages'):
-                    error_messages += f'{error_message}; '
-            row.append(error_codes.strip())
-            row.append(error_messages.strip())
-            
-            # WARNINGS
-            warning_codes = ''
-            if len(result.get('warning_codes')) > 0:
-                for warning_code in result.get('warning_codes'):
-                    warning_codes += f'{warning_code}; '
-            warning_messages = ''
-            if len(result.get('warning_messages')) > 0:
-                for warning_message in result.get('warning_messages'):
-                    warning_messages += f'{warning_message}; '
-            row.append(warning_codes.strip())
-            row.append(warning_messages.strip())
-            
-            # ROW WRITE
-            writer.writerow(row)
-    logger.info(f'Report file created at {REPORTS_PATH}')
+    completed = read_checkpoint(f'{REPORTS_PATH}/report.checkpoint') if resume else Counter()
+    if resume:
+        logger.info(f'Resuming, {sum(completed.values())} requests are already in the report')
+
+    metrics_reporter = MetricsReporter(METRICS, METRICS_INTERVAL).start() if METRICS_INTERVAL > 0 else None
+    metrics_server = MetricsServer(METRICS, port=METRICS_PORT).start() if METRICS_PORT > 0 else None
+    if metrics_server is not None:
+        logger.info(f'Metrics are served at http://{metrics_server.host}:{metrics_server.port}/metrics')
+
+    stats = RunStats()
+    breakdown = LatencyBreakdown(BREAKDOWN_TOP_KEYS)
+    with ReportWriter(REPORTS_PATH, REPORT_HEADERS, REPORT_FORMAT, resume, REPORT_FLUSH_ROWS, REPORT_FLUSH_INTERVAL,
+                      get_row=get_report_row) as report:
+        def write_result(result: dict, record: bool = True):
+            # Cached and duplicated responses were not measured in this run
+            if result.get('source', 'api') == 'api':
+                if record:
+                    stats.record(result)
+                breakdown.record(result)
+            report.write_result(result)
+
+        if REPLAY_SPEED > 0:
+            logger.info(f'Replaying requests at {REPLAY_SPEED}x of the original rate')
+            timed_queries = skip_completed(get_timed_queries(), completed, lambda item: get_query_hash(item[1]))
+            asyncio.run(replay_api_queries(timed_queries, write_result))
+        elif WORKERS > 1 or AGENTS > 0:
+            # Imported here, the distributed runner imports this module
+            from distributed import parse_address, run_distributed
+            logger.info(f'Sharding requests between {WORKERS} processes and {AGENTS} agents')
+            if resume or DEDUPLICATE or CACHE_PATH or SYNTHETIC_QUERIES:
+                logger.warning('Resume, deduplication, cache and synthetic queries are not applied to distributed runs')
+            shard_stats = run_distributed(lambda result: write_result(result, record=False), WORKERS, AGENTS,
+                                          parse_address(COORDINATOR_ADDRESS), AGENT_AUTHKEY, METRICS)
+            stats.merge(shard_stats)
+        else:
+            if SYNTHETIC_QUERIES > 0:
+                logger.info(f'Sending {SYNTHETIC_QUERIES} synthetic queries learned from the log')
+                queries = get_synthetic_queries(SYNTHETIC_QUERIES, SYNTHETIC_SEED)
+            else:
+                queries = get_queries()
+            queries = skip_completed(queries, completed, get_query_hash)
+            cache = ResponseCache(CACHE_PATH, CACHE_TTL, CACHE_MAX_ENTRIES) if CACHE_PATH else None
+            try:
+                asyncio.run(run_api_queries(queries, write_result, deduplicate=DEDUPLICATE, cache=cache))
+            finally:
+                if cache is not None:
+                    cache.close()
+        stats.finish()
+
+    if metrics_reporter is not None:
+        metrics_reporter.stop()
+    if metrics_server is not None:
+        metrics_server.stop()
+    for line in stats.summary():
+        logger.info(line)
+    stats.write(f'{REPORTS_PATH}/histograms.json')
+    breakdown.write(f'{REPORTS_PATH}/breakdown.csv')
+    breakdown.write_slowest_combinations(f'{REPORTS_PATH}/slowest_combinations.csv')
+    for _, combination, combination_stats in breakdown.get_slowest_combinations(top=5):
+        logger.info(f'Slow: {combination} - p90 {combination_stats.histogram.percentile(90):.2f} ms '
+                    f'({combination_stats.histogram.count} requests)')
+    logger.info(f'Latency breakdown by query features created at {REPORTS_PATH}/breakdown.csv')
+    logger.info(f'Report file created at {report.path}')
     logger.info(f'Report file created locally at {os.environ.get("LOCAL_PATH")}')
 
-def get_queries() -> list:
-    queries = []
-    with open(f'{BASE_DIR}/{os.environ.get("FILENAME")}') as file:
+
+def compare(base_path: str, new_path: str, output_path: str = f'{REPORTS_PATH}/regressions.csv', top: int = 100):
+    logger = logging.getLogger('FRC TESTER')
+    
+    logger.info(f'Comparing {new_path} with {base_path}...')
+    for line in compare_reports(base_path, new_path, output_path, top):
+        logger.info(line)
+
+
+def capacity(slo_p99: float, max_error_rate: float = 0.01, start: int = 1, increase: int = 4, decrease: float = 0.5,
+             step_duration: float = 30, max_steps: int = 20, max_queries: int = 10000):
+    # Imported here, the capacity search imports this module
+    from capacity import find_knee, search_capacity, write_capacity
+    logger = logging.getLogger('FRC TESTER')
+    
+    logger.info(f'Searching for the highest throughput with p99 under {slo_p99} ms...')
+    queries = list(itertools.islice(get_queries(), max_queries))
+    steps = asyncio.run(search_capacity(queries, slo_p99, max_error_rate, start, increase, decrease, step_duration, max_steps))
+    write_capacity(steps, f'{REPORTS_PATH}/capacity.csv')
+    knee = find_knee(steps)
+    if knee is None:
+        logger.info('No step was within the SLO')
+    else:
+        logger.info(f'Knee: concurrency {knee["concurrency"]}, {knee["throughput"]:.2f} req/s, p99 {knee["p99"]:.2f} ms')
+    logger.info(f'Capacity curve created at {REPORTS_PATH}/capacity.csv')
+
+
+def soak(duration: float, rate: float, window: float = 60, mode: str = 'loop', max_queries: int = 10000,
+         concurrency: int = CONCURRENCY, seed: int = 1, rotate_windows: int = 60, keep_files: int = 24):
+    # Imported here, the soak test imports this module
+    from soak import SoakReport, run_soak
+    logger = logging.getLogger('FRC TESTER')
+    
+    logger.info(f'Soak test: {rate} req/s for {duration} s, {window} s windows...')
+    queries = list(itertools.islice(get_queries(), max_queries))
+    metrics_server = MetricsServer(METRICS, port=METRICS_PORT).start() if METRICS_PORT > 0 else None
+    try:
+        with SoakReport(REPORTS_PATH, rotate_windows, keep_files) as report:
+            summary = asyncio.run(run_soak(queries, report, duration, rate, window, concurrency, mode, seed))
+    finally:
+        if metrics_server is not None:
+            metrics_server.stop()
+    logger.info(f'{summary["requests"]} requests in {summary["windows"]} windows, {summary["failed"]} failed')
+    logger.info(f'RSS of the tester: {summary["first_rss"] / 1024 / 1024:.1f} MB at the start, '
+                f'{summary["last_rss"] / 1024 / 1024:.1f} MB at the end')
+    logger.info(f'Soak reports created at {REPORTS_PATH}/soak-*.csv')
+
+
+def get_report_row(result: dict) -> list:
+    row = []
+    # REQUEST_BODY
+    row.append(result.get('request_body'))
+    
+    # RESPONSE_TIME
+    row.append("{:.5f}".format(result.get('elapsed_time')))
+    
+    # RESPONSE_CODE
+    row.append(result.get('status_code'))
+    
+    # ERRORS, sorted so the same codes give the same row
+    error_codes = ''
+    if len(result.get('error_codes')) > 0:
+        for error_code in sorted(result.get('error_codes'), key=str):
+            error_codes += f'{error_code}; '
+    error_messages = ''
+    if len(result.get('error_messages')) > 0:
+        for error_message in sorted(result.get('error_messages'), key=str):
+            error_messages += f'{error_message}; '
+    row.append(error_codes.strip())
+    row.append(error_messages.strip())
+    
+    # WARNINGS
+    warning_codes = ''
+    if len(result.get('warning_codes')) > 0:
+        for warning_code in sorted(result.get('warning_codes'), key=str):
+            warning_codes += f'{warning_code}; '
+    warning_messages = ''
+    if len(result.get('warning_messages')) > 0:
+        for warning_message in sorted(result.get('warning_messages'), key=str):
+            warning_messages += f'{warning_message}; '
+    row.append(warning_codes.strip())
+    row.append(warning_messages.strip())
+    
+    # WAIT_TIME
+    row.append("{:.5f}".format(result.get('wait_time', 0)))
+    
+    # REPLAY SCHEDULE
+    for key in ('scheduled_time', 'send_time'):
+        row.append("{:.5f}".format(result.get(key)) if key in result else '')
+    
+    # PHASES
+    phases = result.get('phases', {})
+    for phase in ('pool_wait', 'dns', 'connect', 'ttfb', 'body'):
+        row.append("{:.5f}".format(phases.get(phase)) if phase in phases else '')
+    
+    # DEDUPLICATION
+    row.append(result.get('query_hash', ''))
+    row.append(result.get('source', 'api'))
+    
+    # RETRIES AND HEDGING
+    row.append(result.get('attempts', 1))
+    row.append(result.get('hedged', ''))
+    row.append(result.get('winner', ''))
+    row.append("{:.5f}".format(result.get('hedge_delay')) if 'hedge_delay' in result else '')
+    row.append(result.get('exception', ''))
+    
+    return row
+
+
+def get_queries() -> Iterator[dict]:
+    # Lazy reading: queries are produced one by one while the pipeline consumes them
+    return read_log(get_query_data, PARSE_ORDERED)
+
+
+def get_synthetic_queries(count: int|None = None, seed: int = 1) -> Iterator[dict]:
+    # Endless when count is None; the log is read once to learn its mix, the model is kept in the reports
+    model = WorkloadModel().learn(get_queries())
+    model.write(f'{REPORTS_PATH}/workload.json')
+    return model.generate(count, seed)
+
+
+def get_timed_queries() -> Iterator[tuple[datetime, dict]]:
+    # Queries together with the time they arrived in production, always in the log order
+    return read_log(get_timed_query_data, True)
+
+
+def read_log(parse_row: Callable[[list], object], ordered: bool = True) -> Iterator:
+    path = f'{BASE_DIR}/{os.environ.get("FILENAME")}'
+    if PARSE_WORKERS > 1:
+        yield from parse_log_parallel(path, parse_row, PARSE_WORKERS, PARSE_CHUNK_SIZE, ordered)
+        return
+    with open(path) as file:
         reader = csv.reader(file, delimiter=',')
         for row in alive_it(reader):
-            if '/api/v1/flight_calculator' in row[2]:
-                query_data_v1 = get_query_data_v1(row[2])
-                if query_data_v1 is not None:
-                    queries.append(query_data_v1)
-                queries.append(get_query_data_v1(row[2]))
-            elif '{"url": "/flight_calculator' in row[2]:
-                query_data_v2 = get_query_data_v2(row[2])
-                if query_data_v2 is not None:
-                    queries.append(query_data_v2)
+            item = parse_row(row)
+            if item is not None:
+                yield item
+
+
+def get_timed_query_data(row: list) -> tuple[datetime, dict]|None:
+    query = get_query_data(row)
+    if query is None:
+        return None
+    return get_query_date(row[1]), query
+
+
+def is_query_row(row: list) -> bool:
+    return len(row) >= 3 and ('/api/v1/flight_calculator' in row[2] or '{"url": "/flight_calculator' in row[2])
+
+
+def get_query_data(row: list) -> dict|None:
+    if len(row) < 3:
+        return None
+    if '/api/v1/flight_calculator' in row[2]:
+        return get_query_data_v1(row[2])
+    elif '{"url": "/flight_calculator' in row[2]:
+        return get_query_data_v2(row[2])
+    return None
 
-    return queries
+
+def get_query_date(date: str) -> datetime:
+    # Fractions of a second are written without trailing zeros
+    if '.' in date:
+        return datetime.strptime(date, '%Y-%m-%d %H:%M:%S.%f')
+    return datetime.strptime(date, '%Y-%m-%d %H:%M:%S')
 
 
 def get_query_data_v2(query: str) -> dict|None:
-    # Preparation text for processing
-    text = query.split('{')
-    if len(text) < 3:
+    request_body = get_query_field(query, 'request_body')
+    if isinstance(request_body, str):
+        try:
+            request_body = json_loads(request_body)
+        except ValueError:
+            return None
+    if not isinstance(request_body, dict):
         return None
-    
-    text = text[2].replace('}"}', '')
-    text = text.replace('\\n', '')
-    text = text.replace('\\', '')
-    
-    # Getting query parameters
+
     query_dict = {}
-    request_parameters = text.split(',')
-    for i in range(len(request_parameters)):
-        current_parameter = request_parameters[i].split('":')
-        if len(current_parameter) == 2:
-            converted_parameter = convert_parameter_v2(current_parameter[0], current_parameter[1])
-            query_dict.update(converted_parameter)
-        else:
-            # Current parameter could be empty
-            if len(current_parameter[0].strip()) == 0:
-                continue
-            # We should find key for current value
-            for y in range(i, 0, -1):
-                temp_parameter = request_parameters[y].split('":')
-                if len(temp_parameter) == 2:
-                    # Key was found
-                    converted_parameter = convert_parameter_v2(temp_parameter[0], current_parameter[0])
-                    # 1 cicle loop
-                    for key in converted_parameter.keys():
-                        value = converted_parameter.get(key)
-                        current_value = query_dict.get(key)
-                        if isinstance(value, list):
-                            current_value.append(value[0])
-                        else:
-                            current_value.append(value)
-                        query_dict.update({key: current_value})
-                    break
-    
+    for name, value in request_body.items():
+        query_dict.update(convert_parameter_v2(name, value))
     return query_dict
-        
 
-def convert_parameter_v2(name: str, value: str) -> dict:
-    name = name.strip().replace('"', '')
-    value = value.strip().replace('"', '')
-    if '[]' in name or '[' in value or ']' in value:
+
+def get_query_field(query: str, name: str):
+    # Logged queries are JSON objects, but some of them have empty items left by the export (", ,"),
+    # then only the needed value is decoded starting from its key
+    try:
+        return json_loads(query).get(name)
+    except (ValueError, AttributeError):
+        pass
+    key_index = query.find(f'"{name}":')
+    if key_index < 0:
+        return None
+    value_index = key_index + len(name) + 3
+    while value_index < len(query) and query[value_index].isspace():
+        value_index += 1
+    try:
+        return JSON_DECODER.raw_decode(query, value_index)[0]
+    except ValueError:
+        return None
+
+
+def convert_parameter_v2(name: str, value) -> dict:
+    name = name.strip()
+    if name.endswith('[]') or isinstance(value, list):
         name = name.replace('[]', '')
-        value = value.replace('[', '').replace(']', '')
-        value_v2 = []
-        if len(value) > 0:
-            for list_value in value.split(','):
-                value_v2.append(list_value.strip())
+        if isinstance(value, list):
+            value_v2 = [str(list_value).strip() for list_value in value]
+        elif isinstance(value, str) and len(value.strip()) > 0:
+            value_v2 = [list_value.strip() for list_value in value.split(',')]
+        else:
+            value_v2 = []
     elif value == 'true':
         value_v2 = True
     elif value == 'false':
         value_v2 = False
-    elif 'pax' in name:
-        value_v2 = int(value) if len(value) > 0 else 0
+    elif 'pax' in name and isinstance(value, str):
+        value_v2 = int(value) if len(value.strip()) > 0 else 0
     else:
         value_v2 = value
         
     return {name: value_v2}
     
 
+# Names and values of a log repeat a lot (airports, aircraft, avoid_countries[]), so they are unquoted once
+unquote_parameter = functools.lru_cache(maxsize=4096)(urllib.parse.unquote_plus)
+
+
+def parse_url_query(url_query: str) -> list[tuple[str, str]]:
+    # Same pairs as urllib.parse.parse_qsl(url_query, keep_blank_values=True), but only names and values
+    # with something to unquote go through unquote_plus
+    parameters = []
+    for parameter in url_query.split('&'):
+        if len(parameter) == 0:
+            continue
+        name, _, value = parameter.partition('=')
+        if '%' in name or '+' in name:
+            name = unquote_parameter(name)
+        if '%' in value or '+' in value:
+            value = unquote_parameter(value)
+        parameters.append((name, value))
+    return parameters
+
+
 def get_query_data_v1(query: str) -> dict|None:
     # Getting query parameters
-    url = query.split('"')[3]
-    url = url.split('?')
-    if len(url) < 2:
+    url = get_query_field(query, 'url')
+    if not isinstance(url, str):
         return None
-    url_query = url[1]
-    
-    url_parameters = url_query.split('&')
-    if len(url_parameters) == 0:
+    url_query = url.partition('?')[2]
+    if len(url_query) == 0:
         return None
 
-    # Generating dict for new version
+    # Generating dict for new version, repeated avoid parameters are collected in order without duplicates
     query_dict = {}
-    avoid_countries = set()
-    avoid_firs = set()
-    for parameter in url_parameters:
-        current_parameter = parameter.split('=')
-        converted_parameter = convert_parameter_v1(current_parameter[0], current_parameter[1])
+    avoid_countries = {}
+    avoid_firs = {}
+    for name, value in parse_url_query(url_query):
+        converted_parameter = convert_parameter_v1(name, value, quoted=False)
         if converted_parameter is not None:
-            for query_key in converted_parameter.keys():
+            for query_key, query_value in converted_parameter.items():
                 if query_key == 'avoid_countries':
-                    avoid_countries.add(converted_parameter.get(query_key))
+                    avoid_countries[query_value] = None
                 elif query_key == 'avoid_firs':
-                    avoid_firs.add(converted_parameter.get(query_key))
+                    avoid_firs[query_value] = None
                 else:
-                    query_dict.update(converted_parameter)
+                    query_dict[query_key] = query_value
     if len(avoid_countries) > 0:
         query_dict.update({'avoid_countries': list(avoid_countries)})
     if len(avoid_firs) > 0:
-        query_dict.update({'avoid_firs': list(avoid_countries)})
+        query_dict.update({'avoid_firs': list(avoid_firs)})
     return query_dict
 
 
-def convert_parameter_v1(name: str, value: str) -> dict|None:
+def convert_parameter_v1(name: str, value: str, quoted: bool = True) -> dict|None:
     name_v2 = name
     same_name = {
         'departure_airport',
@@ -238,57 +524,448 @@ def convert_parameter_v1(name: str, value: str) -> dict|None:
         return None
 
     if name == 'pax':
-        value = int(value)
+        return {name_v2: int(value) if len(value) > 0 else 0}
 
     return {
-        name_v2: urllib.parse.unquote_plus(value) if isinstance(value, str) else value
+        name_v2: urllib.parse.unquote_plus(value) if quoted else value
     }
 
 
-async def test_api_queries(queries: list) -> list:
-    async with aiohttp.ClientSession(headers=HEADERS, trust_env=True) as session:
-        tasks = []
-        for query in queries:
-            tasks.append(asyncio.ensure_future(test_api_query(session, query)))
-        return [
-            await f
-            for f in tqdm(asyncio.as_completed(tasks), total=len(tasks))
-        ]
-        
-        # return await asyncio.gather(*tasks)
+async def test_api_queries(queries: Iterable[dict], concurrency: int = CONCURRENCY, queue_size: int = QUEUE_SIZE,
+                           rate_limit: float = RATE_LIMIT, rate_burst: int = RATE_BURST,
+                           session: aiohttp.ClientSession|None = None, deduplicate: bool = False,
+                           cache: ResponseCache|None = None, hedge: bool = False) -> ResultStore:
+    results = ResultStore()
+    await run_api_queries(queries, results.append, concurrency, queue_size, rate_limit, rate_burst, session,
+                          deduplicate, cache, hedge=hedge)
+    return results
+
+
+def create_session(pool_size: int = POOL_SIZE, pool_size_per_host: int = POOL_SIZE_PER_HOST,
+                   keepalive_timeout: float = KEEPALIVE_TIMEOUT, dns_cache_ttl: int = DNS_CACHE_TTL) -> aiohttp.ClientSession:
+    # Must be called inside a running event loop, the session can be reused by several runs
+    connector = aiohttp.TCPConnector(
+        ssl=SSL_CONTEXT,
+        limit=pool_size,
+        limit_per_host=pool_size_per_host,
+        keepalive_timeout=keepalive_timeout,
+        ttl_dns_cache=dns_cache_ttl
+    )
+    timeout = aiohttp.ClientTimeout(
+        total=TIMEOUT_TOTAL or None,
+        connect=TIMEOUT_CONNECT or None,
+        sock_read=TIMEOUT_READ or None
+    )
+    return aiohttp.ClientSession(connector=connector, headers=HEADERS, trust_env=True, timeout=timeout,
+                                 trace_configs=[create_trace_config()])
+
+
+async def run_api_queries(queries: Iterable[dict]|AsyncIterable[dict], on_result: Callable[[dict], None],
+                          concurrency: int = CONCURRENCY, queue_size: int = QUEUE_SIZE,
+                          rate_limit: float = RATE_LIMIT, rate_burst: int = RATE_BURST,
+                          session: aiohttp.ClientSession|None = None, deduplicate: bool = False,
+                          cache: ResponseCache|None = None, progress_bar: bool = True, hedge: bool = HEDGE,
+                          retries: int = RETRIES) -> int:
+    # Producer/consumer pipeline: the producer reads queries lazily into a bounded queue,
+    # a fixed pool of workers sends them, so memory and open sockets do not depend on the input size
+    queue = asyncio.Queue(maxsize=queue_size)
+    rate_limiter = TokenBucket(rate_limit, rate_burst) if rate_limit > 0 else None
+    # Responses by query hash, the first occurrence of a query is sent and the others wait for its response
+    responses = OrderedDict() if deduplicate else None
+    hedger = Hedger(HEDGE_PERCENTILE) if hedge else None
+    processed = 0
+
+    own_session = session is None
+    if own_session:
+        session = create_session()
+    try:
+        with tqdm(disable=not progress_bar) as progress:
+            async def producer():
+                # Paced sources (soak tests) are asynchronous iterables
+                if hasattr(queries, '__aiter__'):
+                    async for query in queries:
+                        await queue.put(prepare_query(query))
+                else:
+                    # Reading the log blocks (parallel parsing waits for its processes), batches of queries
+                    # are read and serialized in a thread, so the workers keep sending in the meantime
+                    iterator = iter(queries)
+                    while batch := await asyncio.to_thread(read_batch, iterator, READ_BATCH):
+                        for query in batch:
+                            await queue.put(query)
+                for _ in range(concurrency):
+                    await queue.put(None)
+
+            async def worker():
+                nonlocal processed
+                while True:
+                    query = await queue.get()
+                    if query is None:
+                        return
+                    on_result(await resolve_query(session, query, rate_limiter, responses, cache, hedger, retries))
+                    processed += 1
+                    progress.update()
+
+            tasks = [asyncio.create_task(producer())]
+            tasks.extend(asyncio.create_task(worker()) for _ in range(concurrency))
+            try:
+                await asyncio.gather(*tasks)
+            finally:
+                for task in tasks:
+                    task.cancel()
+    finally:
+        if own_session:
+            await session.close()
+
+    return processed
+
+
+def read_batch(queries: Iterator[dict], size: int) -> list:
+    return [prepare_query(query) for query in itertools.islice(queries, size)]
+
+
+def read_timed_batch(timed_queries: Iterator[tuple[datetime, dict]], size: int) -> list:
+    return [(date, prepare_query(query)) for date, query in itertools.islice(timed_queries, size)]
+
+
+async def resolve_query(session, query: dict, rate_limiter: TokenBucket|None = None,
+                        responses: OrderedDict|None = None, cache: ResponseCache|None = None,
+                        hedger: Hedger|None = None, retries: int = RETRIES) -> dict:
+    if responses is None and cache is None:
+        return await send_query(session, query, rate_limiter, hedger, retries)
+
+    query_hash = get_query_hash(query)
+    if responses is not None:
+        future = responses.get(query_hash)
+        if future is not None:
+            responses.move_to_end(query_hash)
+            result = await asyncio.shield(future)
+            return dict(result, request_body=query, query_hash=query_hash, source='duplicate')
+        future = responses[query_hash] = asyncio.get_running_loop().create_future()
+        # The least recently seen queries are forgotten, their next repeat is sent again
+        while len(responses) > DEDUPLICATE_MAX_ENTRIES:
+            responses.popitem(last=False)
+
+    try:
+        result = cache.get(query_hash) if cache is not None else None
+        if result is not None:
+            result.update(request_body=query, source='cache')
+        else:
+            result = await send_query(session, query, rate_limiter, hedger, retries)
+            result['source'] = 'api'
+            if cache is not None and result.get('status_code') == 200:
+                cache.put(query_hash, result)
+        result['query_hash'] = query_hash
+    except asyncio.CancelledError:
+        if responses is not None:
+            future.cancel()
+        raise
+    except Exception as error:
+        if responses is not None:
+            future.set_exception(error)
+            # Marks the error as retrieved, there may be no duplicates waiting for it
+            future.exception()
+        raise
+    if responses is not None:
+        future.set_result(result)
+    return result
+
+
+async def send_query(session, query: dict, rate_limiter: TokenBucket|None = None, hedger: Hedger|None = None,
+                     retries: int = RETRIES) -> dict:
+    # Time spent waiting for the rate limiter is client-side queueing, not server latency
+    wait_time = await rate_limiter.acquire() if rate_limiter is not None else 0
+    if hedger is not None:
+        result = await hedge_api_query(session, query, hedger, retries)
+    else:
+        result = await retry_api_query(session, query, retries)
+    result['wait_time'] = wait_time * 1000
+    return result
+
 
+async def retry_api_query(session, query: dict, retries: int = RETRIES) -> dict:
+    # Connection errors, timeouts and overload statuses are retried with full jitter exponential backoff
+    first_start_time = time.perf_counter()
+    for attempt in range(1, retries + 2):
+        start_time = time.perf_counter()
+        result = None
+        METRICS.request_started()
+        try:
+            result = await test_api_query(session, query)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as error:
+            result = get_failed_result(query, error, (time.perf_counter() - start_time) * 1000)
+        finally:
+            METRICS.request_finished(result)
+        if attempt > retries or not is_retryable(result):
+            break
+        await asyncio.sleep(random.uniform(0, min(RETRY_BACKOFF_MAX, RETRY_BACKOFF * 2 ** (attempt - 1))))
+    if attempt > 1:
+        # The time the caller waited: all the attempts and the pauses between them, phases are of the last attempt
+        result['elapsed_time'] = (time.perf_counter() - first_start_time) * 1000
+    result['attempts'] = attempt
+    return result
 
-async def test_api_query(session, query: dict) -> set:
-    url = 'https://frc.aviapages.com:443/flight_calculator/'
-    start_time = time.time()
-    async with session.post(url, json=query, ssl=SSL_CONTEXT) as request:
-        elapsed_time = (time.time() - start_time) * 1000
+
+async def hedge_api_query(session, query: dict, hedger: Hedger, retries: int = RETRIES) -> dict:
+    # A duplicate request is sent when the first one takes longer than the hedging delay,
+    # the response that comes first is reported with the latency counted from the first request
+    delay = hedger.get_delay()
+    primary = asyncio.create_task(retry_api_query(session, query, retries))
+    done = set()
+    if delay is not None:
+        done, _ = await asyncio.wait({primary}, timeout=delay / 1000)
+    if delay is None or primary in done:
+        result = await primary
+        hedger.record(result.get('elapsed_time'))
+        result.update(hedged=False, winner='primary')
+        return result
+
+    hedge = asyncio.create_task(retry_api_query(session, query, retries))
+    try:
+        done, _ = await asyncio.wait({primary, hedge}, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        for task in (primary, hedge):
+            if not task.done():
+                task.cancel()
+        await asyncio.gather(primary, hedge, return_exceptions=True)
+    if primary in done:
+        result = primary.result()
+        result.update(hedged=True, winner='primary')
+    else:
+        result = hedge.result()
+        result['elapsed_time'] += delay
+        result.update(hedged=True, winner='hedge')
+    hedger.record(result.get('elapsed_time'))
+    result['hedge_delay'] = delay
+    return result
+
+
+def is_retryable(result: dict) -> bool:
+    return result.get('status_code') == 0 or result.get('status_code') in RETRY_STATUS_CODES
+
+
+def get_failed_result(query: dict, error: Exception, elapsed_time: float) -> dict:
+    # Request without a response, status code 0
+    return {
+        'request_body': query,
+        'elapsed_time': elapsed_time,
+        'status_code': 0,
+        'error_codes': set(),
+        'error_messages': set(),
+        'warning_codes': set(),
+        'warning_messages': set(),
+        'exception': repr(error) if str(error) else type(error).__name__
+    }
+
+
+async def replay_api_queries(timed_queries: Iterable[tuple[datetime, dict]], on_result: Callable[[dict], None],
+                             speed: float = REPLAY_SPEED, session: aiohttp.ClientSession|None = None) -> int:
+    # Open-loop replay: every query is sent at its original offset from the first one divided by speed,
+    # no matter how many responses are still pending
+    processed = 0
+    pending = set()
+    failures = []
+
+    def finish(task: asyncio.Task):
+        pending.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            failures.append(task.exception())
+
+    own_session = session is None
+    if own_session:
+        session = create_session()
+    try:
+        with tqdm() as progress:
+            start_time = time.monotonic()
+
+            async def replay_query(query: dict, scheduled_time: float):
+                nonlocal processed
+                send_time = time.monotonic() - start_time
+                result = await retry_api_query(session, query)
+                # Offsets from the start of the replay, send time later than scheduled time means the client lagged
+                result['scheduled_time'] = scheduled_time * 1000
+                result['send_time'] = send_time * 1000
+                on_result(result)
+                processed += 1
+                progress.update()
+
+            # Reading the log blocks (parallel parsing waits for its processes), batches of queries are read
+            # in a thread, the next batch while the current one is sent
+            iterator = iter(timed_queries)
+            reading = asyncio.ensure_future(asyncio.to_thread(read_timed_batch, iterator, READ_BATCH))
+            first_date = None
+            try:
+                while batch := await reading:
+                    reading = asyncio.ensure_future(asyncio.to_thread(read_timed_batch, iterator, READ_BATCH))
+                    for date, query in batch:
+                        if first_date is None:
+                            first_date = date
+                            start_time = time.monotonic()
+                        scheduled_time = (date - first_date).total_seconds() / speed
+                        delay = start_time + scheduled_time - time.monotonic()
+                        if delay > 0:
+                            await asyncio.sleep(delay)
+                        task = asyncio.create_task(replay_query(query, scheduled_time))
+                        pending.add(task)
+                        task.add_done_callback(finish)
+                        # Lets the request start before the next one is scheduled
+                        await asyncio.sleep(0)
+                        if failures:
+                            raise failures[0]
+                if pending:
+                    await asyncio.gather(*pending)
+            finally:
+                reading.cancel()
+                for task in pending:
+                    task.cancel()
+    finally:
+        if own_session:
+            await session.close()
+
+    return processed
+
+
+class PreparedQuery(dict):
+    # Query with its request body already serialized, reports and hashes see a plain dict
+    def __init__(self, query: dict, body: bytes):
+        super().__init__(query)
+        self.body = body
+
+
+def prepare_query(query: dict) -> PreparedQuery:
+    return query if isinstance(query, PreparedQuery) else PreparedQuery(query, json_dumps(query))
+
+
+async def test_api_query(session, query: dict) -> dict:
+    url = FRC_URL
+    # Encoding is not a part of the measured time, queued queries are serialized by the producer.
+    # The body is sent as is with the Content-Type header of the session
+    body = prepare_query(query).body
+    # Trace hooks of the session fill connection timings in
+    timings = {}
+    start_time = time.perf_counter()
+    async with session.post(url, data=body, trace_request_ctx=timings) as request:
+        headers_time = time.perf_counter()
         error_codes = set()
         error_messages = set()
         warning_codes = set()
         warning_messages = set()
+        exception = None
         if request.status == 200:
-            request_json = await request.json()
-            if 'errors' in request_json.keys():
-                for error in request_json.get('errors'):
-                    error_codes.add(error.get('code'))
-                    error_messages.add(error.get('message'))
-            if 'warnings' in request_json.keys():
-                for warnings in request_json.get('warnings'):
-                    for warning in warnings:
-                        warning_codes.add(warning.get('code'))
-                        warning_messages.add(warning.get('message'))
-        return {
+            try:
+                # Parsed whatever the Content-Type, a body that is not the expected JSON is kept as the exception
+                request_json = await request.json(content_type=None)
+                if 'errors' in request_json.keys():
+                    for error in request_json.get('errors'):
+                        error_codes.add(error.get('code'))
+                        error_messages.add(error.get('message'))
+                if 'warnings' in request_json.keys():
+                    for warnings in request_json.get('warnings'):
+                        for warning in warnings:
+                            warning_codes.add(warning.get('code'))
+                            warning_messages.add(warning.get('message'))
+            except (ValueError, AttributeError, TypeError) as error:
+                exception = repr(error)
+        else:
+            await request.read()
+        end_time = time.perf_counter()
+        result = {
             'request_body': query,
-            'elapsed_time': elapsed_time,
+            'elapsed_time': (end_time - start_time) * 1000,
             'status_code': request.status,
             'error_codes': error_codes,
             'error_messages': error_messages,
             'warning_codes': warning_codes,
-            'warning_messages': warning_messages
+            'warning_messages': warning_messages,
+            'phases': get_phases(timings, start_time, headers_time, end_time)
         }
+        if exception is not None:
+            result['exception'] = exception
+        return result
+
+
+def get_phases(timings: dict, start_time: float, headers_time: float, end_time: float) -> dict:
+    # Phase durations in milliseconds, connection phases exist only when a new connection was opened
+    phases = {}
+    if 'pool_wait_start' in timings and 'pool_wait_end' in timings:
+        phases['pool_wait'] = (timings['pool_wait_end'] - timings['pool_wait_start']) * 1000
+    dns_time = 0.0
+    if 'dns_start' in timings and 'dns_end' in timings:
+        dns_time = timings['dns_end'] - timings['dns_start']
+        phases['dns'] = dns_time * 1000
+    if 'connect_start' in timings and 'connect_end' in timings:
+        # TCP connect together with the TLS handshake, aiohttp has no separate hook for TLS
+        phases['connect'] = (timings['connect_end'] - timings['connect_start'] - dns_time) * 1000
+    request_sent_time = max(start_time, timings.get('pool_wait_end', 0), timings.get('connect_end', 0))
+    phases['ttfb'] = (headers_time - request_sent_time) * 1000
+    phases['body'] = (end_time - headers_time) * 1000
+    return phases
+
+
+def create_trace_config() -> aiohttp.TraceConfig:
+    def on_event(name: str):
+        async def hook(session, trace_config_ctx, params):
+            if isinstance(trace_config_ctx.trace_request_ctx, dict):
+                trace_config_ctx.trace_request_ctx[name] = time.perf_counter()
+        return hook
+
+    trace_config = aiohttp.TraceConfig()
+    trace_config.on_connection_queued_start.append(on_event('pool_wait_start'))
+    trace_config.on_connection_queued_end.append(on_event('pool_wait_end'))
+    trace_config.on_connection_create_start.append(on_event('connect_start'))
+    trace_config.on_connection_create_end.append(on_event('connect_end'))
+    trace_config.on_dns_resolvehost_start.append(on_event('dns_start'))
+    trace_config.on_dns_resolvehost_end.append(on_event('dns_end'))
+    return trace_config
+
+
+def run_command_line():
+    parser = argparse.ArgumentParser(description='AviaPages FRC requests tester')
+    parser.add_argument('--resume', action='store_true', help='continue an interrupted run, skipping requests already in the report')
+    subparsers = parser.add_subparsers(dest='command')
+    compare_parser = subparsers.add_parser('compare', help='compare latencies and error codes of two reports')
+    compare_parser.add_argument('base', help='report of the earlier run')
+    compare_parser.add_argument('new', help='report of the later run')
+    compare_parser.add_argument('--output', default=f'{REPORTS_PATH}/regressions.csv', help='CSV of the worst regressions')
+    compare_parser.add_argument('--top', type=int, default=100, help='number of the worst regressions to write')
+    capacity_parser = subparsers.add_parser('capacity', help='find the highest throughput within a latency SLO')
+    capacity_parser.add_argument('--slo-p99', type=float, required=True, help='p99 latency limit in milliseconds')
+    capacity_parser.add_argument('--max-error-rate', type=float, default=0.01, help='share of failed requests allowed')
+    capacity_parser.add_argument('--start', type=int, default=1, help='concurrency of the first step')
+    capacity_parser.add_argument('--increase', type=int, default=4, help='concurrency added after a step within the SLO')
+    capacity_parser.add_argument('--decrease', type=float, default=0.5, help='concurrency multiplier after a violation')
+    capacity_parser.add_argument('--step-duration', type=float, default=30, help='seconds per step')
+    capacity_parser.add_argument('--max-steps', type=int, default=20)
+    capacity_parser.add_argument('--max-queries', type=int, default=10000, help='number of log queries sent in a loop')
+    soak_parser = subparsers.add_parser('soak', help='send the log queries at a steady rate for hours, reporting every window')
+    soak_parser.add_argument('--duration', type=float, required=True, help='seconds')
+    soak_parser.add_argument('--rate', type=float, required=True, help='requests per second')
+    soak_parser.add_argument('--window', type=float, default=60, help='seconds per report row')
+    soak_parser.add_argument('--mode', choices=('loop', 'sample'), default='loop', help='queries in the log order or random ones')
+    soak_parser.add_argument('--max-queries', type=int, default=10000, help='number of log queries to send from')
+    soak_parser.add_argument('--concurrency', type=int, default=CONCURRENCY)
+    soak_parser.add_argument('--seed', type=int, default=1, help='seed of the sample mode')
+    soak_parser.add_argument('--rotate-windows', type=int, default=60, help='windows per report file')
+    soak_parser.add_argument('--keep-files', type=int, default=24, help='number of report files kept')
+    agent_parser = subparsers.add_parser('agent', help='join a distributed run as a remote agent')
+    agent_parser.add_argument('address', help='coordinator HOST:PORT')
+    args = parser.parse_args()
+    if args.command == 'compare':
+        compare(args.base, args.new, args.output, args.top)
+    elif args.command == 'capacity':
+        capacity(args.slo_p99, args.max_error_rate, args.start, args.increase, args.decrease, args.step_duration,
+                 args.max_steps, args.max_queries)
+    elif args.command == 'soak':
+        soak(args.duration, args.rate, args.window, args.mode, args.max_queries, args.concurrency, args.seed,
+             args.rotate_windows, args.keep_files)
+    elif args.command == 'agent':
+        from distributed import parse_address, run_agent
+        run_agent(parse_address(args.address), AGENT_AUTHKEY)
+    else:
+        main(resume=args.resume)
 
 
 if __name__ == '__main__':
-    main()
-    
\ No newline at end of file
+    # soak, capacity and distributed import this file as `main`, the command line runs in that module,
+    # so they share its state (METRICS, patched settings) instead of a second copy of the script
+    import main as frc_main
+    frc_main.run_command_line()
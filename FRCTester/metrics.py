@@ -0,0 +1,196 @@
+from collections import Counter, deque
+import logging
+import threading
+import time
+
+from aiohttp import web
+
+from background import BackgroundServer
+from histogram import PERCENTILES, LatencyHistogram
+
+
+class Metrics:
+    # Live counters of a run, updated from the event loop and read by the reporter and HTTP threads
+    def __init__(self, window: float = 60):
+        self.window = window
+        self.lock = threading.Lock()
+        self.sent = 0
+        self.completed = 0
+        self.in_flight = 0
+        self.status_codes = Counter()
+        self.error_codes = Counter()
+        self.latency_total = 0.0
+        # Histogram per second of the rolling window
+        self.seconds = deque()
+        # Latencies since the last take_counts() and in flight requests of the shards of a distributed run
+        self.recent = LatencyHistogram()
+        self.taken = {'sent': 0, 'completed': 0, 'latency_total': 0.0, 'status_codes': Counter(), 'error_codes': Counter()}
+        self.remote_in_flight = {}
+
+    def request_started(self) -> None:
+        with self.lock:
+            self.sent += 1
+            self.in_flight += 1
+
+    def request_finished(self, result: dict|None) -> None:
+        # No result when the request was cancelled
+        second = int(time.monotonic())
+        with self.lock:
+            self.in_flight -= 1
+            if result is None:
+                return
+            elapsed_time = result.get('elapsed_time', 0.0)
+            self.completed += 1
+            self.latency_total += elapsed_time
+            self.status_codes[result.get('status_code')] += 1
+            for error_code in result.get('error_codes', ()):
+                self.error_codes[error_code] += 1
+            self.recent.record(elapsed_time)
+            self.get_second(second).record(elapsed_time)
+
+    def get_second(self, second: int) -> LatencyHistogram:
+        if not self.seconds or self.seconds[-1][0] != second:
+            self.seconds.append((second, LatencyHistogram()))
+            self.drop_old(second)
+        return self.seconds[-1][1]
+
+    def take_counts(self) -> dict:
+        # Changes since the last call, a shard of a distributed run sends them to the coordinator with its results
+        with self.lock:
+            counts = {
+                'sent': self.sent - self.taken['sent'],
+                'completed': self.completed - self.taken['completed'],
+                'latency_total': self.latency_total - self.taken['latency_total'],
+                'status_codes': dict(self.status_codes - self.taken['status_codes']),
+                'error_codes': dict(self.error_codes - self.taken['error_codes']),
+                'in_flight': self.in_flight,
+                'latency': self.recent.to_dict()
+            }
+            self.taken = {'sent': self.sent, 'completed': self.completed, 'latency_total': self.latency_total,
+                          'status_codes': self.status_codes.copy(), 'error_codes': self.error_codes.copy()}
+            self.recent = LatencyHistogram()
+        return counts
+
+    def merge_counts(self, source, counts: dict) -> None:
+        # Adds the take_counts() of a shard, its latencies count in the current second of the window
+        histogram = LatencyHistogram.from_dict(counts['latency'])
+        second = int(time.monotonic())
+        with self.lock:
+            self.sent += counts['sent']
+            self.completed += counts['completed']
+            self.latency_total += counts['latency_total']
+            self.status_codes.update(counts['status_codes'])
+            self.error_codes.update(counts['error_codes'])
+            self.remote_in_flight[source] = counts['in_flight']
+            self.get_second(second).merge(histogram)
+
+    def drop_old(self, now: int) -> None:
+        while self.seconds and self.seconds[0][0] <= now - self.window:
+            self.seconds.popleft()
+
+    def get_window_histogram(self) -> LatencyHistogram:
+        histogram = LatencyHistogram()
+        with self.lock:
+            self.drop_old(int(time.monotonic()))
+            for _, second_histogram in self.seconds:
+                histogram.merge(second_histogram)
+        return histogram
+
+    def snapshot(self) -> dict:
+        histogram = self.get_window_histogram()
+        with self.lock:
+            return {
+                'sent': self.sent,
+                'completed': self.completed,
+                'in_flight': self.in_flight + sum(self.remote_in_flight.values()),
+                'status_codes': dict(self.status_codes),
+                'error_codes': dict(self.error_codes),
+                'latency_total': self.latency_total,
+                'window_count': histogram.count,
+                'window_throughput': histogram.count / self.window,
+                'percentiles': {percentile: histogram.percentile(percentile) for percentile in PERCENTILES},
+                'max': histogram.max
+            }
+
+    def summary(self) -> str:
+        snapshot = self.snapshot()
+        percentiles = ', '.join(f'p{percentile:g}={value:.2f}' for percentile, value in snapshot['percentiles'].items())
+        status_codes = ', '.join(f'{code}: {count}' for code, count in sorted(snapshot['status_codes'].items(), key=str))
+        line = (f'Sent {snapshot["sent"]}, completed {snapshot["completed"]}, in flight {snapshot["in_flight"]}, '
+                f'last {self.window:g} s: {snapshot["window_throughput"]:.2f} req/s, {percentiles} ms; '
+                f'status codes: {status_codes or "-"}')
+        if snapshot['error_codes']:
+            line += '; error codes: ' + ', '.join(f'{code}: {count}' for code, count in sorted(snapshot['error_codes'].items()))
+        return line
+
+    def render_prometheus(self) -> str:
+        snapshot = self.snapshot()
+        lines = [
+            '# HELP frc_requests_sent_total Requests sent to the flight calculator, retries included',
+            '# TYPE frc_requests_sent_total counter',
+            f'frc_requests_sent_total {snapshot["sent"]}',
+            '# HELP frc_requests_in_flight Requests waiting for a response',
+            '# TYPE frc_requests_in_flight gauge',
+            f'frc_requests_in_flight {snapshot["in_flight"]}',
+            '# HELP frc_responses_total Finished requests by status code, 0 - no response',
+            '# TYPE frc_responses_total counter'
+        ]
+        for status_code, count in sorted(snapshot['status_codes'].items(), key=str):
+            lines.append(f'frc_responses_total{{status_code="{escape_label(status_code)}"}} {count}')
+        lines.extend([
+            '# HELP frc_error_codes_total Errors returned by the flight calculator by code',
+            '# TYPE frc_error_codes_total counter'
+        ])
+        for error_code, count in sorted(snapshot['error_codes'].items(), key=str):
+            lines.append(f'frc_error_codes_total{{code="{escape_label(error_code)}"}} {count}')
+        lines.extend([
+            f'# HELP frc_latency_ms Response time over the last {self.window:g} seconds',
+            '# TYPE frc_latency_ms summary'
+        ])
+        for percentile, value in snapshot['percentiles'].items():
+            lines.append(f'frc_latency_ms{{quantile="{percentile / 100:g}"}} {value:.3f}')
+        lines.append(f'frc_latency_ms_sum {snapshot["latency_total"]:.3f}')
+        lines.append(f'frc_latency_ms_count {snapshot["completed"]}')
+        return '\n'.join(lines) + '\n'
+
+
+def escape_label(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class MetricsReporter:
+    # Logs the metrics summary every `interval` seconds from a background thread
+    def __init__(self, metrics: Metrics, interval: float):
+        self.metrics = metrics
+        self.interval = interval
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    def run(self) -> None:
+        logger = logging.getLogger('FRC TESTER')
+        while not self.stopped.wait(self.interval):
+            logger.info(self.metrics.summary())
+
+    def start(self) -> 'MetricsReporter':
+        self.thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.stopped.set()
+        self.thread.join()
+
+
+class MetricsServer(BackgroundServer):
+    # Serves GET /metrics in the Prometheus text format on its own event loop in a background thread
+    def __init__(self, metrics: Metrics, host: str = '0.0.0.0', port: int = 9100):
+        super().__init__(host, port)
+        self.metrics = metrics
+
+    def create_app(self) -> web.Application:
+        async def get_metrics(request: web.Request) -> web.Response:
+            return web.Response(body=self.metrics.render_prometheus().encode('utf-8'),
+                                headers={'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'})
+
+        app = web.Application()
+        app.router.add_get('/metrics', get_metrics)
+        return app
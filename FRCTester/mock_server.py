@@ -0,0 +1,147 @@
+import argparse
+import asyncio
+import json
+import random
+
+from aiohttp import web
+
+from background import BackgroundServer
+
+
+LATENCY_DISTRIBUTIONS = ('fixed', 'uniform', 'exponential', 'lognormal')
+REQUIRED_FIELDS = ('departure_airport', 'arrival_airport', 'aircraft')
+
+
+class MockSettings:
+    # Behaviour of the stand-in /flight_calculator/ endpoint, latencies are in milliseconds
+    def __init__(self, latency: float = 0, latency_spread: float = 0, latency_distribution: str = 'fixed',
+                 error_rate: float = 0, warning_rate: float = 0, status_codes: dict|None = None,
+                 body_chunks: int = 1, body_chunk_delay: float = 0, seed: int|None = None):
+        if latency_distribution not in LATENCY_DISTRIBUTIONS:
+            raise ValueError(f'Unknown latency distribution {latency_distribution}, '
+                             f'expected one of {", ".join(LATENCY_DISTRIBUTIONS)}')
+        self.latency = latency
+        self.latency_spread = latency_spread
+        self.latency_distribution = latency_distribution
+        self.error_rate = error_rate
+        self.warning_rate = warning_rate
+        # Probabilities of non-200 responses by status code, e.g. {500: 0.01, 429: 0.05}
+        self.status_codes = status_codes or {}
+        self.body_chunks = max(1, body_chunks)
+        self.body_chunk_delay = body_chunk_delay
+        self.random = random.Random(seed)
+
+    def get_latency(self) -> float:
+        if self.latency_distribution == 'uniform':
+            return max(0.0, self.random.uniform(self.latency - self.latency_spread, self.latency + self.latency_spread))
+        if self.latency_distribution == 'exponential':
+            return self.random.expovariate(1 / self.latency) if self.latency > 0 else 0.0
+        if self.latency_distribution == 'lognormal':
+            # latency is the median, latency_spread is sigma of the underlying normal distribution
+            return self.latency * self.random.lognormvariate(0, self.latency_spread) if self.latency > 0 else 0.0
+        return self.latency
+
+    def get_status_code(self) -> int:
+        value = self.random.random()
+        for status_code, probability in self.status_codes.items():
+            if value < probability:
+                return int(status_code)
+            value -= probability
+        return 200
+
+
+def get_response(query: dict, settings: MockSettings) -> dict:
+    # Same shape as the FRC answer: a list of errors and a list of warning lists (one per route)
+    errors = [{'code': 'MISSING_FIELD', 'message': f'{field} is required'}
+              for field in REQUIRED_FIELDS if not query.get(field)]
+    warnings = [[]]
+    if settings.random.random() < settings.error_rate:
+        errors.append({'code': 'CALCULATION_ERROR', 'message': 'Route could not be calculated'})
+    if settings.random.random() < settings.warning_rate:
+        warnings[0].append({'code': 'FUEL_STOP', 'message': 'Fuel stop is required'})
+    response = {
+        'departure_airport': query.get('departure_airport'),
+        'arrival_airport': query.get('arrival_airport'),
+        'aircraft': query.get('aircraft'),
+        'errors': errors,
+        'warnings': warnings
+    }
+    if not errors:
+        response['time'] = {'airway': 120, 'great_circle': 110}
+        response['distance'] = {'airway': 900, 'great_circle': 850}
+    return response
+
+
+def create_app(settings: MockSettings) -> web.Application:
+    async def flight_calculator(request: web.Request) -> web.StreamResponse:
+        try:
+            query = await request.json()
+        except ValueError:
+            query = None
+        await asyncio.sleep(settings.get_latency() / 1000)
+        if not isinstance(query, dict):
+            return web.json_response({'detail': 'JSON parse error'}, status=400)
+        status_code = settings.get_status_code()
+        if status_code != 200:
+            return web.json_response({'detail': 'Mock server error'}, status=status_code)
+
+        body = json.dumps(get_response(query, settings)).encode('utf-8')
+        if settings.body_chunks == 1 and settings.body_chunk_delay == 0:
+            return web.Response(body=body, content_type='application/json')
+        # Slow body: headers go first, then the body in chunks with a pause before each one
+        response = web.StreamResponse(headers={'Content-Type': 'application/json'})
+        response.content_length = len(body)
+        await response.prepare(request)
+        chunk_size = -(-len(body) // settings.body_chunks)
+        for start in range(0, len(body), chunk_size):
+            await asyncio.sleep(settings.body_chunk_delay / 1000)
+            await response.write(body[start:start + chunk_size])
+        await response.write_eof()
+        return response
+
+    app = web.Application()
+    app.router.add_post('/flight_calculator/', flight_calculator)
+    return app
+
+
+class MockServer(BackgroundServer):
+    # Runs the stand-in server on its own event loop in a background thread
+    def __init__(self, settings: MockSettings|None = None, host: str = '127.0.0.1', port: int = 0):
+        super().__init__(host, port)
+        self.settings = settings or MockSettings()
+
+    @property
+    def url(self) -> str:
+        return f'http://{self.host}:{self.port}/flight_calculator/'
+
+    def create_app(self) -> web.Application:
+        return create_app(self.settings)
+
+
+def parse_status_codes(value: str) -> dict:
+    # "500:0.01,429:0.05"
+    status_codes = {}
+    for item in value.split(','):
+        if item.strip():
+            status_code, probability = item.split(':')
+            status_codes[int(status_code)] = float(probability)
+    return status_codes
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Local stand-in for the FRC /flight_calculator/ endpoint')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--latency', type=float, default=0, help='milliseconds (median for lognormal)')
+    parser.add_argument('--latency-spread', type=float, default=0, help='+- ms for uniform, sigma for lognormal')
+    parser.add_argument('--latency-distribution', choices=LATENCY_DISTRIBUTIONS, default='fixed')
+    parser.add_argument('--error-rate', type=float, default=0)
+    parser.add_argument('--warning-rate', type=float, default=0)
+    parser.add_argument('--status-codes', type=parse_status_codes, default={}, help='e.g. 500:0.01,429:0.05')
+    parser.add_argument('--body-chunks', type=int, default=1)
+    parser.add_argument('--body-chunk-delay', type=float, default=0, help='milliseconds before every body chunk')
+    parser.add_argument('--seed', type=int)
+    args = parser.parse_args()
+    settings = MockSettings(args.latency, args.latency_spread, args.latency_distribution, args.error_rate,
+                            args.warning_rate, args.status_codes, args.body_chunks, args.body_chunk_delay, args.seed)
+    web.run_app(create_app(settings), host=args.host, port=args.port, access_log=None)
@@ -0,0 +1,33 @@
+import asyncio
+import time
+
+
+class TokenBucket:
+    # Token bucket limiter: refills `rate` tokens per second up to `burst` tokens,
+    # every request takes one token and waits while the bucket is empty
+    def __init__(self, rate: float, burst: int = 1):
+        if rate <= 0:
+            raise ValueError('Rate must be positive')
+        if burst < 1:
+            raise ValueError('Burst must be at least 1')
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated_at = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    def refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    async def acquire(self) -> float:
+        # Lock keeps waiting requests in FIFO order, returns time spent waiting for a token
+        start_time = time.monotonic()
+        async with self.lock:
+            self.refill()
+            while self.tokens < 1:
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+                self.refill()
+            self.tokens -= 1
+        return time.monotonic() - start_time
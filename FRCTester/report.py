@@ -0,0 +1,163 @@
+from collections import Counter
+import csv
+import gzip
+import json
+import os
+import time
+import zlib
+
+from typing import Callable, Iterable, Iterator
+
+from results import ResultStore
+
+
+REPORT_FORMATS = ('csv', 'csv.gz', 'ndjson', 'ndjson.gz')
+
+
+class ReportWriter:
+    # Writes report rows as results arrive: rows are buffered and flushed every flush_rows rows
+    # or flush_interval seconds, after every flush the query hashes of the written rows are added
+    # to the checkpoint file, so an interrupted run can be resumed. Results written with write_result
+    # are buffered in a ResultStore and turned into rows by get_row when they are flushed
+    def __init__(self, directory: str, headers: list, report_format: str = 'csv', resume: bool = False,
+                 flush_rows: int = 1000, flush_interval: float = 5.0, name: str = 'report',
+                 get_row: Callable[[dict], list]|None = None):
+        if report_format not in REPORT_FORMATS:
+            raise ValueError(f'Unknown report format {report_format}, expected one of {", ".join(REPORT_FORMATS)}')
+        self.path = f'{directory}/{name}.{report_format}'
+        self.checkpoint_path = f'{directory}/{name}.checkpoint'
+        self.headers = headers
+        self.report_format = report_format
+        self.flush_rows = flush_rows
+        self.flush_interval = flush_interval
+        self.get_row = get_row
+        self.rows = []
+        self.query_hashes = []
+        self.results = ResultStore()
+        self.flushed_at = time.monotonic()
+        self.written = 0
+
+        append = resume and os.path.exists(self.path) and recover_report(self.path, report_format.endswith('.gz')) > 0
+        mode = 'at' if append else 'wt'
+        if report_format.endswith('.gz'):
+            self.file = gzip.open(self.path, mode, newline='')
+        else:
+            self.file = open(self.path, mode, newline='')
+        self.checkpoint = open(self.checkpoint_path, 'a' if append else 'w')
+        self.csv_writer = csv.writer(self.file) if report_format.startswith('csv') else None
+        if not append and self.csv_writer is not None:
+            self.csv_writer.writerow(headers)
+            self.file.flush()
+
+    def write(self, row: list, query_hash: str) -> None:
+        self.rows.append(row)
+        self.query_hashes.append(query_hash)
+        self.flush_if_due()
+
+    def write_result(self, result: dict) -> None:
+        self.results.append(result)
+        self.flush_if_due()
+
+    def flush_if_due(self) -> None:
+        if len(self.rows) + len(self.results) >= self.flush_rows or time.monotonic() - self.flushed_at >= self.flush_interval:
+            self.flush()
+
+    def flush(self) -> None:
+        for index in range(len(self.results)):
+            self.rows.append(self.get_row(self.results.get(index)))
+            self.query_hashes.append(self.results.get_query_hash(index))
+        self.results.clear()
+        if self.csv_writer is not None:
+            self.csv_writer.writerows(self.rows)
+        else:
+            for row in self.rows:
+                self.file.write(json.dumps(dict(zip(self.headers, row)), default=str, ensure_ascii=False) + '\n')
+        self.file.flush()
+        # Rows are on disk before they are marked as completed
+        self.checkpoint.writelines(f'{query_hash}\n' for query_hash in self.query_hashes)
+        self.checkpoint.flush()
+        self.written += len(self.rows)
+        self.rows = []
+        self.query_hashes = []
+        self.flushed_at = time.monotonic()
+
+    def close(self) -> None:
+        self.flush()
+        self.file.close()
+        self.checkpoint.close()
+
+    def __enter__(self) -> 'ReportWriter':
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+
+def recover_report(path: str, compressed: bool) -> int:
+    # A report of a killed run can end with a part of a row, and a compressed one without the end of its gzip stream,
+    # rows appended after it could not be read. Only complete lines are kept, a compressed report is rewritten
+    # as one finished gzip stream. Returns the size of the kept data
+    if compressed:
+        temporary_path = f'{path}.recovered'
+        kept = 0
+        tail = b''
+        with gzip.open(temporary_path, 'wb') as output:
+            for data in read_gzip_prefix(path):
+                data = tail + data
+                end = data.rfind(b'\n') + 1
+                output.write(data[:end])
+                kept += end
+                tail = data[end:]
+        os.replace(temporary_path, path)
+        return kept
+    with open(path, 'rb+') as file:
+        position = file.seek(0, os.SEEK_END)
+        while position > 0:
+            start = max(0, position - 64 * 1024)
+            file.seek(start)
+            index = file.read(position - start).rfind(b'\n')
+            if index >= 0:
+                file.truncate(start + index + 1)
+                return start + index + 1
+            position = start
+        file.truncate(0)
+        return 0
+
+
+def read_gzip_prefix(path: str, chunk_size: int = 1024 * 1024) -> Iterator[bytes]:
+    # Decompressed data of the gzip members of a file up to the first damaged or missing part
+    decompressor = zlib.decompressobj(zlib.MAX_WBITS | 16)
+    with open(path, 'rb') as file:
+        while chunk := file.read(chunk_size):
+            while chunk:
+                try:
+                    yield decompressor.decompress(chunk)
+                except zlib.error:
+                    return
+                if not decompressor.eof:
+                    break
+                # A member ended, the rest of the chunk starts the next one
+                chunk = decompressor.unused_data
+                decompressor = zlib.decompressobj(zlib.MAX_WBITS | 16)
+
+
+def read_checkpoint(path: str) -> Counter:
+    # Number of completed requests by query hash, a query repeated in the log is completed several times
+    completed = Counter()
+    if os.path.exists(path):
+        with open(path) as file:
+            for line in file:
+                query_hash = line.strip()
+                if query_hash:
+                    completed[query_hash] += 1
+    return completed
+
+
+def skip_completed(items: Iterable, completed: Counter, get_hash: Callable[[object], str]) -> Iterator:
+    # Drops as many occurrences of every query as were completed before
+    for item in items:
+        query_hash = get_hash(item)
+        if completed[query_hash] > 0:
+            completed[query_hash] -= 1
+            continue
+        yield item
@@ -0,0 +1,127 @@
+from array import array
+import math
+
+from typing import Iterator
+
+from canonical import get_query_hash
+
+
+PHASES = ('pool_wait', 'dns', 'connect', 'ttfb', 'body')
+# Millisecond values of a result, NaN marks a value the result does not have
+FLOAT_FIELDS = ('elapsed_time', 'wait_time', 'scheduled_time', 'send_time', 'hedge_delay')
+# Small sets of repeated values, stored as ids of the shared value table
+CODE_FIELDS = ('error_codes', 'error_messages', 'warning_codes', 'warning_messages')
+VALUE_FIELDS = ('source', 'hedged', 'winner', 'exception')
+
+
+class InternTable:
+    # Every distinct value is kept once and referred to by its index, 0 is reserved for a missing value
+    def __init__(self):
+        self.ids = {}
+        self.values = [None]
+
+    def add(self, value) -> int:
+        if value is None:
+            return 0
+        value_id = self.ids.get(value)
+        if value_id is None:
+            value_id = len(self.values)
+            self.ids[value] = value_id
+            self.values.append(value)
+        return value_id
+
+    def __getitem__(self, value_id: int):
+        return self.values[value_id]
+
+    def __len__(self) -> int:
+        return len(self.values) - 1
+
+
+class ResultStore:
+    # Columnar storage of results: numbers are kept in typed arrays, a query repeated in the log
+    # is stored once and results refer to it by index, codes and messages are interned tuples.
+    # Indexing returns a result dict in the shape test_api_query returns
+    def __init__(self):
+        self.queries = []
+        self.query_hashes = []
+        self.query_ids = {}
+        self.values = InternTable()
+        self.query_index = array('I')
+        self.status_code = array('H')
+        self.attempts = array('H')
+        self.floats = {field: array('d') for field in FLOAT_FIELDS}
+        self.phases = {phase: array('d') for phase in PHASES}
+        self.codes = {field: array('I') for field in CODE_FIELDS}
+        self.others = {field: array('I') for field in VALUE_FIELDS}
+
+    def append(self, result: dict) -> int:
+        query = result.get('request_body')
+        query_hash = result.get('query_hash') or get_query_hash(query)
+        query_id = self.query_ids.get(query_hash)
+        # Queries with the same hash may be written differently, the report keeps the body as it was sent
+        if query_id is None or self.queries[query_id] != query:
+            query_id = len(self.queries)
+            self.query_ids.setdefault(query_hash, query_id)
+            self.queries.append(query)
+            self.query_hashes.append(query_hash)
+        self.query_index.append(query_id)
+        self.status_code.append(result.get('status_code') or 0)
+        self.attempts.append(result.get('attempts', 1))
+        for field, column in self.floats.items():
+            value = result.get(field)
+            column.append(math.nan if value is None else value)
+        phases = result.get('phases') or {}
+        for phase, column in self.phases.items():
+            value = phases.get(phase)
+            column.append(math.nan if value is None else value)
+        for field, column in self.codes.items():
+            # Sorted, so the same set of codes is one table entry whatever the order it was collected in
+            column.append(self.values.add(tuple(sorted(result.get(field) or (), key=str))))
+        for field, column in self.others.items():
+            column.append(self.values.add(result.get(field)))
+        return len(self.query_index) - 1
+
+    def get(self, index: int) -> dict:
+        query_id = self.query_index[index]
+        result = {
+            'request_body': self.queries[query_id],
+            'query_hash': self.query_hashes[query_id],
+            'status_code': self.status_code[index],
+            'attempts': self.attempts[index]
+        }
+        for field, column in self.floats.items():
+            if not math.isnan(column[index]):
+                result[field] = column[index]
+        result['phases'] = {phase: column[index] for phase, column in self.phases.items() if not math.isnan(column[index])}
+        for field, column in self.codes.items():
+            result[field] = set(self.values[column[index]])
+        for field, column in self.others.items():
+            if column[index]:
+                result[field] = self.values[column[index]]
+        return result
+
+    def get_query_hash(self, index: int) -> str:
+        return self.query_hashes[self.query_index[index]]
+
+    def clear(self) -> None:
+        self.__init__()
+
+    def __getitem__(self, index: int) -> dict:
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError('result index out of range')
+        return self.get(index)
+
+    def __len__(self) -> int:
+        return len(self.query_index)
+
+    def __iter__(self) -> Iterator[dict]:
+        for index in range(len(self)):
+            yield self.get(index)
+
+    def nbytes(self) -> int:
+        # Size of the columns, without the queries and the value table
+        columns = [self.query_index, self.status_code, self.attempts, *self.floats.values(), *self.phases.values(),
+                   *self.codes.values(), *self.others.values()]
+        return sum(column.buffer_info()[1] * column.itemsize for column in columns)
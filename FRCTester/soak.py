@@ -0,0 +1,176 @@
+from collections import Counter
+import asyncio
+import csv
+import itertools
+import logging
+import os
+import random
+import resource
+import time
+
+import aiohttp
+from typing import AsyncIterator
+
+import main
+from capacity import is_failed
+from histogram import LatencyHistogram
+from ratelimit import TokenBucket
+
+
+SOAK_MODES = ('loop', 'sample')
+SOAK_HEADERS = ['WINDOW_START', 'WINDOW_END', 'REQUESTS', 'THROUGHPUT', 'P50', 'P90', 'P99', 'P99.9', 'MAX',
+                'FAILED', 'ERROR_RATE', 'STATUS_CODES', 'ERROR_CODES', 'RSS_MB']
+
+
+def get_rss() -> int:
+    # Current resident set size in bytes, the peak one where /proc is not available
+    try:
+        with open('/proc/self/statm') as file:
+            return int(file.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Kilobytes on Linux, bytes on macOS
+        return peak if os.uname().sysname == 'Darwin' else peak * 1024
+
+
+async def get_soak_queries(queries: list, duration: float, rate: float, mode: str = 'loop',
+                           seed: int = 1) -> AsyncIterator[dict]:
+    # The parsed queries in a loop or in random order until the soak time is over. Queries are paced here
+    # and not by the workers, so none are left queued at the end and the rate does not depend on concurrency
+    if mode not in SOAK_MODES:
+        raise ValueError(f'Unknown soak mode {mode}, expected one of {", ".join(SOAK_MODES)}')
+    if not queries:
+        raise ValueError('No queries to send')
+    rng = random.Random(seed)
+    rate_limiter = TokenBucket(rate, 1) if rate > 0 else None
+    source = itertools.cycle(queries) if mode == 'loop' else (rng.choice(queries) for _ in itertools.count())
+    deadline = time.monotonic() + duration
+    for query in source:
+        if rate_limiter is not None:
+            await rate_limiter.acquire()
+        if time.monotonic() >= deadline:
+            return
+        yield query
+
+
+class SoakWindow:
+    # Results of one reporting window, replaced by a new window when the row is written
+    def __init__(self, start: float):
+        self.start = start
+        self.histogram = LatencyHistogram()
+        self.failed = 0
+        self.status_codes = Counter()
+        self.error_codes = Counter()
+
+    def record(self, result: dict) -> None:
+        self.histogram.record(result.get('elapsed_time', 0.0))
+        self.status_codes[result.get('status_code')] += 1
+        for error_code in result.get('error_codes', ()):
+            self.error_codes[error_code] += 1
+        if is_failed(result):
+            self.failed += 1
+
+    def get_row(self, end: float, rss: int) -> list:
+        histogram = self.histogram
+        duration = end - self.start
+        return [
+            f'{self.start:.3f}',
+            f'{end:.3f}',
+            histogram.count,
+            f'{histogram.count / duration if duration > 0 else 0.0:.2f}',
+            f'{histogram.percentile(50):.5f}',
+            f'{histogram.percentile(90):.5f}',
+            f'{histogram.percentile(99):.5f}',
+            f'{histogram.percentile(99.9):.5f}',
+            f'{histogram.max:.5f}',
+            self.failed,
+            f'{self.failed / histogram.count if histogram.count else 0.0:.5f}',
+            '; '.join(f'{code}: {count}' for code, count in sorted(self.status_codes.items(), key=str)),
+            '; '.join(f'{code}: {count}' for code, count in sorted(self.error_codes.items())),
+            f'{rss / 1024 / 1024:.1f}'
+        ]
+
+
+class SoakReport:
+    # Window rows go to soak-0001.csv, soak-0002.csv...: a new file is started every rotate_rows rows
+    # and only the last keep_files files are kept
+    def __init__(self, directory: str, rotate_rows: int = 60, keep_files: int = 24, name: str = 'soak'):
+        self.directory = directory
+        self.rotate_rows = rotate_rows
+        self.keep_files = keep_files
+        self.name = name
+        self.paths = []
+        self.files = 0
+        self.file = None
+        self.csv_writer = None
+        self.rows = 0
+
+    def write(self, row: list) -> None:
+        if self.file is None or self.rows >= self.rotate_rows:
+            self.rotate()
+        self.csv_writer.writerow(row)
+        self.file.flush()
+        self.rows += 1
+
+    def rotate(self) -> None:
+        if self.file is not None:
+            self.file.close()
+        self.files += 1
+        path = f'{self.directory}/{self.name}-{self.files:04d}.csv'
+        self.paths.append(path)
+        while len(self.paths) > self.keep_files:
+            os.remove(self.paths.pop(0))
+        self.file = open(path, 'w', newline='')
+        self.csv_writer = csv.writer(self.file)
+        self.csv_writer.writerow(SOAK_HEADERS)
+        self.rows = 0
+
+    def close(self) -> None:
+        if self.file is not None:
+            self.file.close()
+
+    def __enter__(self) -> 'SoakReport':
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+
+async def run_soak(queries: list, report: SoakReport, duration: float, rate: float, window: float = 60,
+                   concurrency: int = 50, mode: str = 'loop', seed: int = 1,
+                   session: aiohttp.ClientSession|None = None) -> dict:
+    # Steady rate for `duration` seconds, results are only aggregated into the current window,
+    # so memory does not grow with the run time; RSS of the tester is written with every window
+    logger = logging.getLogger('FRC TESTER')
+    start_time = time.time()
+    current = SoakWindow(start_time)
+    summary = {'windows': 0, 'requests': 0, 'failed': 0, 'first_rss': get_rss(), 'last_rss': 0}
+
+    def close_window(end: float):
+        nonlocal current
+        rss = get_rss()
+        report.write(current.get_row(end, rss))
+        summary['windows'] += 1
+        summary['requests'] += current.histogram.count
+        summary['failed'] += current.failed
+        summary['last_rss'] = rss
+        logger.info(f'Window {summary["windows"]}: {current.histogram.count} requests, '
+                    f'p99 {current.histogram.percentile(99):.2f} ms, {current.failed} failed, RSS {rss / 1024 / 1024:.1f} MB')
+        current = SoakWindow(end)
+
+    async def ticker():
+        while True:
+            await asyncio.sleep(max(0.0, current.start + window - time.time()))
+            close_window(current.start + window)
+
+    tick = asyncio.create_task(ticker())
+    try:
+        # Not retried or hedged, so the failures and latency of FRC show in the window they happen in
+        await main.run_api_queries(get_soak_queries(queries, duration, rate, mode, seed), lambda result: current.record(result),
+                                   concurrency, 1, rate_limit=0, session=session, progress_bar=False, hedge=False, retries=0)
+    finally:
+        tick.cancel()
+        await asyncio.gather(tick, return_exceptions=True)
+    if current.histogram.count > 0:
+        close_window(time.time())
+    return summary
@@ -0,0 +1,37 @@
+from pathlib import Path
+import unittest
+import sys
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'benchmarks'))
+
+from benchmark_suite import BUDGETS, check_budgets
+
+
+class BudgetsTest(unittest.TestCase):
+    def test_within_budget(self):
+        baseline = {'report_rows_per_second': 1000.0, 'peak_memory_mb': 10.0}
+        metrics = {'report_rows_per_second': 800.0, 'peak_memory_mb': 12.0}
+        self.assertEqual(check_budgets(metrics, baseline, {'report_rows_per_second': (0.25, True),
+                                                           'peak_memory_mb': (0.25, False)}), [])
+
+    def test_regressions(self):
+        budgets = {'report_rows_per_second': (0.25, True), 'peak_memory_mb': (0.25, False)}
+        baseline = {'report_rows_per_second': 1000.0, 'peak_memory_mb': 10.0}
+        regressions = check_budgets({'report_rows_per_second': 700.0, 'peak_memory_mb': 13.0}, baseline, budgets)
+        self.assertEqual(len(regressions), 2)
+        self.assertTrue(regressions[0].startswith('report_rows_per_second: 1,000.0 -> 700.0 (-30.0%'))
+        # Faster and smaller is never a regression
+        self.assertEqual(check_budgets({'report_rows_per_second': 5000.0, 'peak_memory_mb': 1.0}, baseline, budgets), [])
+
+    def test_missing_metrics(self):
+        self.assertEqual(check_budgets({'parse_v1_rows_per_second': 1.0}, {}), [])
+        self.assertEqual(check_budgets({}, {'parse_v1_rows_per_second': 100.0}), [])
+
+    def test_every_metric_has_a_budget(self):
+        for budget, higher_is_better in BUDGETS.values():
+            self.assertGreater(budget, 0)
+            self.assertIsInstance(higher_is_better, bool)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,78 @@
+import unittest
+import csv
+import os
+import random
+import tempfile
+
+from breakdown import BREAKDOWN_HEADERS, LatencyBreakdown, SpaceSaving, get_features, get_length_bucket
+
+
+QUERY = {'departure_airport': 'EHAM 52.3080555556 4.7641666667', 'arrival_airport': 'LFPB', 'aircraft': 'f900',
+         'pax': 2, 'airway_route': True, 'avoid_countries': [], 'avoid_firs': ['UKBV', 'UKDV', 'UKFV']}
+
+
+class BreakdownTest(unittest.TestCase):
+    def test_get_features(self):
+        features = get_features(QUERY)
+        self.assertEqual(features['route'], 'EHAM-LFPB')
+        self.assertEqual(features['aircraft'], 'f900')
+        self.assertEqual(features['pax'], '2')
+        self.assertEqual(features['avoid_countries'], '0')
+        self.assertEqual(features['avoid_firs'], '3-5')
+        self.assertEqual(features['airway_route'], 'true')
+        self.assertEqual(features['ifr_route'], 'false')
+        self.assertEqual(get_features({})['avoid_firs'], 'absent')
+
+    def test_get_length_bucket(self):
+        self.assertEqual(get_length_bucket(['A']), '1-2')
+        self.assertEqual(get_length_bucket(['A'] * 20), '11-20')
+        self.assertEqual(get_length_bucket(['A'] * 40), '21+')
+
+    def test_space_saving(self):
+        # Two heavy keys in a long tail of keys seen once
+        rng = random.Random(1)
+        stream = ['heavy'] * 3000 + ['warm'] * 1000 + [f'rare{index}' for index in range(5000)]
+        rng.shuffle(stream)
+        top = SpaceSaving(capacity=50)
+        for key in stream:
+            top.record(key, 1.0, False)
+        self.assertEqual(len(top.counts), 50)
+        self.assertIn('heavy', top.counts)
+        self.assertIn('warm', top.counts)
+        # Counts are overestimated by at most the count error
+        self.assertGreaterEqual(top.counts['heavy'], 3000)
+        self.assertLessEqual(top.counts['heavy'] - top.stats['heavy'].count_error, 3000)
+        self.assertEqual(len(top.heap), 50)
+
+    def test_slowest_combinations(self):
+        breakdown = LatencyBreakdown(top_keys=10)
+        for index in range(100):
+            breakdown.record({'request_body': dict(QUERY, ifr_route=True), 'elapsed_time': 900.0 + index, 'status_code': 200})
+            breakdown.record({'request_body': QUERY, 'elapsed_time': 100.0, 'status_code': 200,
+                              'error_codes': {'CALCULATION_ERROR'} if index % 4 == 0 else set()})
+        breakdown.record({'request_body': dict(QUERY, aircraft='slow'), 'elapsed_time': 5000.0, 'status_code': 200})
+        # Rare combinations are not ranked
+        slowest = breakdown.get_slowest_combinations(top=5, min_requests=10)
+        self.assertEqual(len(slowest), 2)
+        self.assertIn('ifr_route=true', slowest[0][1])
+        self.assertAlmostEqual(slowest[1][2].failed / slowest[1][2].histogram.count, 0.25)
+        ifr_route = dict((key, stats) for _, key, stats in breakdown.get_rows('ifr_route'))
+        self.assertEqual(ifr_route['true'].histogram.count, 100)
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'breakdown.csv')
+            breakdown.write(path)
+            with open(path) as file:
+                rows = list(csv.reader(file))
+        self.assertEqual(rows[0], BREAKDOWN_HEADERS)
+        aircraft = [row for row in rows if row[0] == 'aircraft']
+        self.assertEqual([row[1] for row in aircraft], ['slow', 'f900'])
+
+    def test_skips_results_without_query(self):
+        breakdown = LatencyBreakdown()
+        breakdown.record({'request_body': None, 'elapsed_time': 1.0, 'status_code': 0})
+        self.assertEqual(breakdown.get_rows('aircraft'), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,120 @@
+import unittest
+from unittest import mock
+import os
+import sqlite3
+import tempfile
+import time
+
+from cache import ResponseCache
+from canonical import canonicalize_query, get_query_hash
+
+
+RESULT = {
+    'request_body': {'pax': 1},
+    'elapsed_time': 120.5,
+    'status_code': 200,
+    'error_codes': {'E1'},
+    'error_messages': {'Error'},
+    'warning_codes': set(),
+    'warning_messages': set(),
+    'phases': {'ttfb': 100.0}
+}
+
+
+class CanonicalTest(unittest.TestCase):
+    def test_canonicalize_query(self):
+        query = {
+            'pax': 2,
+            'departure_datetime': '2022-3-21 19:00',
+            'avoid_countries': ['Ukraine', 'Belarus', 'Ukraine'],
+            'aircraft': ' Gulfstream G450 '
+        }
+        canonical = canonicalize_query(query)
+        self.assertEqual(list(canonical), ['aircraft', 'avoid_countries', 'departure_datetime', 'pax'])
+        self.assertEqual(canonical['avoid_countries'], ['Belarus', 'Ukraine'])
+        self.assertEqual(canonical['departure_datetime'], '2022-03-21T19:00:00')
+        self.assertEqual(canonical['aircraft'], 'Gulfstream G450')
+
+    def test_get_query_hash(self):
+        first = {'pax': 2, 'departure_datetime': '2022-03-21 19:00', 'avoid_firs': ['UKBV', 'UKDV']}
+        second = {'avoid_firs': ['UKDV', 'UKBV'], 'departure_datetime': '2022-03-21T19:00', 'pax': 2}
+        self.assertEqual(get_query_hash(first), get_query_hash(second))
+        self.assertNotEqual(get_query_hash(first), get_query_hash(dict(second, pax=3)))
+
+
+class ResponseCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'cache.sqlite')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_get_put(self):
+        cache = ResponseCache(self.path)
+        self.assertIsNone(cache.get('hash'))
+        cache.put('hash', RESULT)
+        cache.close()
+
+        cache = ResponseCache(self.path)
+        result = cache.get('hash')
+        cache.close()
+        self.assertEqual(result.get('status_code'), 200)
+        self.assertEqual(result.get('elapsed_time'), 120.5)
+        self.assertEqual(result.get('error_codes'), {'E1'})
+        self.assertEqual(result.get('warning_codes'), set())
+        self.assertEqual(result.get('phases'), {'ttfb': 100.0})
+        self.assertNotIn('request_body', result)
+
+    def test_ttl(self):
+        cache = ResponseCache(self.path, ttl=60)
+        cache.put('hash', RESULT)
+        with mock.patch('cache.time.time', return_value=cache.connection.execute(
+                'SELECT created_at FROM responses').fetchone()[0] + 61):
+            self.assertIsNone(cache.get('hash'))
+            cache.evict()
+        self.assertEqual(len(cache), 0)
+        cache.close()
+
+    def test_max_entries(self):
+        cache = ResponseCache(self.path, max_entries=3)
+        for index in range(5):
+            with mock.patch('cache.time.time', return_value=1_000_000_000 + index):
+                cache.put(f'hash{index}', RESULT)
+        with mock.patch('cache.time.time', return_value=1_000_000_010):
+            cache.evict()
+            self.assertEqual(len(cache), 3)
+            self.assertIsNone(cache.get('hash1'))
+            self.assertIsNotNone(cache.get('hash4'))
+        cache.close()
+
+    def test_limits_during_run(self):
+        # Entries above max_entries are removed and puts are committed while the cache is open
+        cache = ResponseCache(self.path, max_entries=3, commit_rows=2)
+        start_time = time.time() - 10
+        for index in range(5):
+            with mock.patch('cache.time.time', return_value=start_time + index):
+                cache.put(f'hash{index}', RESULT)
+        cache.put('hash4', RESULT)
+        self.assertEqual(len(cache), 3)
+        self.assertIsNone(cache.get('hash1'))
+        self.assertIsNotNone(cache.get('hash2'))
+        reader = sqlite3.connect(self.path)
+        try:
+            self.assertEqual(reader.execute('SELECT COUNT(*) FROM responses').fetchone()[0], 3)
+        finally:
+            reader.close()
+        cache.close()
+
+    def test_evict_interval(self):
+        cache = ResponseCache(self.path, ttl=60, evict_interval=0)
+        with mock.patch('cache.time.time', return_value=1_000_000_000):
+            cache.put('old', RESULT)
+        cache.put('new', RESULT)
+        self.assertEqual(len(cache), 1)
+        self.assertIsNotNone(cache.get('new'))
+        cache.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,79 @@
+import unittest
+from unittest import mock
+import asyncio
+import csv
+import os
+import tempfile
+
+import capacity
+import main
+from mock_server import MockServer, MockSettings
+
+
+QUERY = {'departure_airport': 'KIV', 'arrival_airport': 'VKO', 'aircraft': 'Challenger 300', 'pax': 1}
+
+
+class CapacityTest(unittest.TestCase):
+    def test_aimd(self):
+        # Model of a server saturating at 40 requests in flight
+        async def fake_run_step(queries, concurrency, duration, session):
+            return {
+                'concurrency': concurrency,
+                'requests': concurrency * 10,
+                'throughput': min(concurrency, 40) * 10.0,
+                'p50': 50.0,
+                'p90': 80.0,
+                'p99': 100.0 if concurrency <= 40 else 100.0 * concurrency / 40,
+                'error_rate': 0.0
+            }
+
+        async def search():
+            async with main.create_session() as session:
+                return await capacity.search_capacity([QUERY], slo_p99=120, start=8, increase=16, max_steps=10,
+                                                      max_violations=2, session=session)
+
+        with mock.patch.object(capacity, 'run_step', fake_run_step):
+            steps = asyncio.run(search())
+        self.assertEqual([step['concurrency'] for step in steps], [8, 24, 40, 56, 28, 44, 60])
+        self.assertEqual([step['within_slo'] for step in steps], [True, True, True, False, True, True, False])
+        knee = capacity.find_knee(steps)
+        self.assertEqual(knee['concurrency'], 40)
+        self.assertEqual(knee['throughput'], 400)
+
+    def test_search_capacity(self):
+        with MockServer(MockSettings(latency=5, status_codes={500: 0.5}, seed=1)) as server, \
+                mock.patch.object(main, 'FRC_URL', server.url), \
+                tempfile.TemporaryDirectory() as directory:
+            steps = asyncio.run(capacity.search_capacity([QUERY], slo_p99=1000, start=2, step_duration=0.2,
+                                                         max_steps=3, max_violations=1))
+            path = os.path.join(directory, 'capacity.csv')
+            capacity.write_capacity(steps, path)
+            with open(path) as file:
+                rows = list(csv.DictReader(file))
+        # Half of the requests fail, so the first step already violates the SLO
+        self.assertEqual(len(steps), 1)
+        self.assertGreater(steps[0]['requests'], 10)
+        self.assertAlmostEqual(steps[0]['error_rate'], 0.5, delta=0.2)
+        self.assertIsNone(capacity.find_knee(steps))
+        self.assertEqual(rows[0]['CONCURRENCY'], '2')
+        self.assertEqual(rows[0]['WITHIN_SLO'], 'False')
+
+    def test_run_step_without_retries(self):
+        # Overload statuses are retryable, the step still sees every one of them
+        async def run():
+            async with main.create_session() as session:
+                return await capacity.run_step([QUERY], 4, 0.3, session)
+
+        with MockServer(MockSettings(latency=2, status_codes={503: 0.5}, seed=1)) as server, \
+                mock.patch.object(main, 'FRC_URL', server.url):
+            step = asyncio.run(run())
+        self.assertGreater(step['requests'], 20)
+        self.assertAlmostEqual(step['error_rate'], 0.5, delta=0.15)
+
+    def test_no_queries(self):
+        with self.assertRaises(ValueError):
+            asyncio.run(capacity.search_capacity([], slo_p99=100))
+
+
+if __name__ == '__main__':
+    unittest.main()
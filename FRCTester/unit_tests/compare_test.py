@@ -0,0 +1,98 @@
+import unittest
+import csv
+import os
+import random
+import tempfile
+
+import main
+from compare import compare_reports, mann_whitney_u
+from report import ReportWriter
+
+
+def get_result(query: dict, elapsed_time: float, error_codes: set = None) -> dict:
+    return {
+        'request_body': query,
+        'elapsed_time': elapsed_time,
+        'status_code': 200,
+        'error_codes': error_codes or set(),
+        'error_messages': set(),
+        'warning_codes': set(),
+        'warning_messages': set()
+    }
+
+
+class CompareTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.output_path = os.path.join(self.directory.name, 'regressions.csv')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def write_report(self, name: str, results: list, report_format: str = 'csv') -> str:
+        with ReportWriter(self.directory.name, main.REPORT_HEADERS, report_format, name=name) as report:
+            for result in results:
+                report.write(main.get_report_row(result), main.get_query_hash(result.get('request_body')))
+        return report.path
+
+    def test_compare_reports(self):
+        rng = random.Random(1)
+        queries = [{'pax': pax, 'aircraft': 'f900'} for pax in range(200)]
+        base_path = self.write_report('base', [get_result(query, rng.gauss(100, 5)) for query in queries])
+        new_results = [get_result(query, rng.gauss(130 if query['pax'] < 100 else 100, 5)) for query in queries]
+        new_results[0] = get_result(queries[0], 1000, {'TIMEOUT'})
+        new_path = self.write_report('new', new_results, 'ndjson.gz')
+
+        summary = compare_reports(base_path, new_path, self.output_path, top=10, partitions=4)
+        self.assertIn('matched queries 200', summary[0])
+        self.assertTrue(any('Mann-Whitney' in line and '(significant' in line for line in summary))
+        self.assertTrue(any(line == 'New error codes: TIMEOUT (1)' for line in summary))
+        with open(self.output_path) as file:
+            rows = list(csv.DictReader(file))
+        self.assertEqual(len(rows), 10)
+        self.assertEqual(rows[0]['QUERY_HASH'], main.get_query_hash(queries[0]))
+        self.assertGreater(float(rows[0]['DELTA']), 800)
+        self.assertTrue(all(float(row['DELTA']) > 10 for row in rows))
+
+    def test_compare_sources(self):
+        # Cached and duplicate rows and requests without a response are not counted as latencies
+        queries = [{'pax': pax} for pax in range(4)]
+        base_path = self.write_report('base', [get_result(query, 100) for query in queries])
+        new_results = [get_result(query, 110) for query in queries]
+        new_results[1].update(elapsed_time=1, source='cache')
+        new_results[2].update(elapsed_time=1, source='duplicate')
+        new_results[3].update(elapsed_time=30000, status_code=0)
+        new_path = self.write_report('new', new_results)
+
+        summary = compare_reports(base_path, new_path, self.output_path)
+        self.assertEqual(summary[0], 'Requests: base 4, new 1, matched queries 1')
+        self.assertEqual(summary[1], 'Cached or duplicate rows left out: base 0, new 2')
+        self.assertEqual(summary[2], 'Requests without a response: base 0, new 1')
+        self.assertIn('+10.00 ms', summary[3])
+        self.assertTrue(any(line == 'max: 100.00 -> 110.00 ms' for line in summary))
+
+    def test_compare_old_reports(self):
+        # Reports written before the QUERY_HASH column existed
+        paths = []
+        for name, elapsed_time in (('base', 100), ('new', 110)):
+            path = os.path.join(self.directory.name, f'{name}.csv')
+            with open(path, 'w') as file:
+                writer = csv.writer(file)
+                writer.writerow(main.REPORT_HEADERS[:7])
+                writer.writerow([{'pax': 1, 'avoid_firs': ['A', 'B']}, elapsed_time, 200, '', '', '', ''])
+            paths.append(path)
+        summary = compare_reports(paths[0], paths[1], self.output_path)
+        self.assertIn('matched queries 1', summary[0])
+        self.assertIn('+10.00 ms', summary[1])
+
+    def test_mann_whitney_u(self):
+        u, p_value = mann_whitney_u([1, 2, 3, 4, 5], [6, 7, 8, 9, 10])
+        self.assertEqual(u, 0)
+        self.assertLess(p_value, 0.05)
+        u, p_value = mann_whitney_u([1, 2, 3, 4], [1, 2, 3, 4])
+        self.assertEqual(u, 8)
+        self.assertAlmostEqual(p_value, 1.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
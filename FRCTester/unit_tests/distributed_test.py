@@ -0,0 +1,119 @@
+import unittest
+from unittest import mock
+import csv
+import json
+import multiprocessing
+import socket
+import tempfile
+import threading
+
+import main
+from distributed import get_shard_queries, parse_address, run_agent, run_distributed, run_shard
+from metrics import Metrics
+from mock_server import MockServer, MockSettings
+
+
+LOG_PATH = f'{main.BASE_DIR}/frc_test.csv'
+
+
+class DistributedTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.mock_server = MockServer(MockSettings(latency=5)).start()
+        # Worker processes are spawned and read the settings from the environment
+        cls.patches = [
+            mock.patch.object(main, 'FRC_URL', cls.mock_server.url),
+            mock.patch.dict(main.os.environ, {'FILENAME': 'frc_test.csv', 'FRC_URL': cls.mock_server.url})
+        ]
+        for patch in cls.patches:
+            patch.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        for patch in cls.patches:
+            patch.stop()
+        cls.mock_server.stop()
+
+    def test_get_shard_queries(self):
+        queries = list(main.get_queries())
+        shards = [list(get_shard_queries(LOG_PATH, index, 3)) for index in range(3)]
+        self.assertEqual([len(shard) for shard in shards], [3, 3, 3])
+        key = lambda query: json.dumps(query, sort_keys=True)
+        self.assertEqual(sorted((query for shard in shards for query in shard), key=key), sorted(queries, key=key))
+
+    def test_run_distributed(self):
+        results = []
+        metrics = Metrics()
+        stats = run_distributed(results.append, workers=3, metrics=metrics)
+        self.assertEqual(len(results), 9)
+        # Live metrics of the shard processes reach the coordinator
+        self.assertEqual(metrics.sent, 9)
+        self.assertEqual(metrics.snapshot()['in_flight'], 0)
+        self.assertEqual(metrics.status_codes, {200: 9})
+        self.assertEqual(stats.histograms['total'].count, 9)
+        self.assertTrue(all(result.get('status_code') == 200 for result in results))
+        self.assertGreaterEqual(stats.histograms['total'].min, 5)
+
+    def test_run_shard_share(self):
+        # 3 shards of a run limited to 6 requests per second and 50 concurrent requests
+        calls = []
+
+        async def fake_run_api_queries(queries, on_result, concurrency, **kwargs):
+            calls.append(dict(kwargs, concurrency=concurrency))
+            return 0
+
+        reader, writer = multiprocessing.Pipe(duplex=False)
+        with mock.patch.multiple(main, run_api_queries=fake_run_api_queries, RATE_LIMIT=6, RATE_BURST=3, CONCURRENCY=50):
+            run_shard(writer, 0, 3)
+        self.assertEqual(reader.recv()[0], 'stats')
+        self.assertEqual(calls[0]['rate_limit'], 2)
+        self.assertEqual(calls[0]['rate_burst'], 1)
+        self.assertEqual(calls[0]['concurrency'], 16)
+
+    def test_run_agent(self):
+        results = []
+        address = ('127.0.0.1', 0)
+        # Port 0 cannot be used by the agent, so a free port is found first
+        with socket.socket() as sock:
+            sock.bind(address)
+            address = sock.getsockname()
+        agent = threading.Thread(target=self.start_agent, args=(address,))
+        agent.start()
+        stats = run_distributed(results.append, workers=1, agents=1, address=address, authkey=b'key')
+        agent.join()
+        self.assertEqual(len(results), 9)
+        self.assertEqual(stats.histograms['total'].count, 9)
+
+    def start_agent(self, address: tuple):
+        for _ in range(50):
+            try:
+                return run_agent(address, b'key')
+            except ConnectionRefusedError:
+                threading.Event().wait(0.1)
+
+    def test_main_workers(self):
+        with tempfile.TemporaryDirectory() as directory, \
+                mock.patch.object(main, 'REPORTS_PATH', directory), \
+                mock.patch.object(main, 'WORKERS', 2):
+            main.main()
+            with open(f'{directory}/report.csv') as file:
+                rows = list(csv.reader(file))
+            with open(f'{directory}/histograms.json') as file:
+                histograms = json.load(file)
+        self.assertEqual(len(rows), 10)
+        self.assertEqual(histograms['histograms']['total']['count'], 9)
+
+    def test_parse_address(self):
+        self.assertEqual(parse_address('10.0.0.5:6000'), ('10.0.0.5', 6000))
+        self.assertEqual(parse_address(':6000'), ('127.0.0.1', 6000))
+
+    def test_authkey_required(self):
+        # Without a key anyone reaching the port could send pickles to the coordinator or the agent
+        with self.assertRaises(ValueError):
+            run_distributed(lambda result: None, workers=1, agents=1, address=('127.0.0.1', 0), authkey=b'')
+        with self.assertRaises(ValueError):
+            run_agent(('127.0.0.1', 6000), b'')
+
+
+if __name__ == '__main__':
+    unittest.main()
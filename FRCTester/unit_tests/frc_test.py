@@ -1,9 +1,35 @@
 import unittest
+from unittest import mock
+import types
+import os
+import tempfile
+import json
+import pickle
 import main
+from mock_server import MockServer
+import aiohttp.web
 import asyncio
+import time
+import urllib.parse
+from datetime import datetime, timedelta
 
 
 class MainTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        # Requests go to the local stand-in unless FRC_URL is set to test the live endpoint
+        cls.mock_server = None
+        if 'FRC_URL' not in os.environ:
+            cls.mock_server = MockServer().start()
+            cls.frc_url = mock.patch.object(main, 'FRC_URL', cls.mock_server.url)
+            cls.frc_url.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        if cls.mock_server is not None:
+            cls.frc_url.stop()
+            cls.mock_server.stop()
+
     def test_get_query_data_v1(self):
         query = '{"url": "/api/v1/flight_calculator/?departure_airport=PHKO&arrival_airport=KSFO&pax=2&aircraft_profile=Gulfstream%20G450&departure_date_utc=2022-3-21%2019:00&weather_impact=true&airway=true", "token": null}'
         answer = {
@@ -154,6 +180,302 @@ class MainTest(unittest.TestCase):
         # self.assertEqual(len(result.get('warning_codes')), 1)
         # self.assertEqual(len(result.get('warning_messages')), 1)
     
+    def test_get_query_data_v2_values(self):
+        query = '{"url": "/flight_calculator/", "request_body": "{\\"departure_airport\\": \\"KIV\\", \\"arrival_airport\\": \\"VKO\\", \\"aircraft\\": \\"Gulfstream G450, VIP\\", \\"pax\\": \\"3\\", \\"avoid_firs[]\\": \\"UKBV,UKDV\\", \\"tag\\": \\"{A: 1}\\"}"}'
+        answer = {
+            'departure_airport': 'KIV',
+            'arrival_airport': 'VKO',
+            'aircraft': 'Gulfstream G450, VIP',
+            'pax': 3,
+            'avoid_firs': ['UKBV', 'UKDV'],
+            'tag': '{A: 1}'
+        }
+        self.assertEqual(main.get_query_data_v2(query), answer)
+        self.assertIsNone(main.get_query_data_v2('{"url": "/flight_calculator/", "request_body": "{\\"pax\\": "}'))
+        self.assertIsNone(main.get_query_data_v2('{"url": "/flight_calculator/", "token": null}'))
+
+    def test_get_query_data_v1_avoid(self):
+        query = '{"url": "/api/v1/flight_calculator/?departure_airport=KIV&arrival_airport=VKO&pax=&avoid_countries[]=Ukraine&avoid_countries[]=Belarus&avoid_countries[]=Ukraine&avoid_firs[]=UKBV&fields=airway_route", "token": null}'
+        answer = {
+            'departure_airport': 'KIV',
+            'arrival_airport': 'VKO',
+            'pax': 0,
+            'avoid_countries': ['Ukraine', 'Belarus'],
+            'avoid_firs': ['UKBV'],
+            'airway_route': True
+        }
+        self.assertEqual(main.get_query_data_v1(query), answer)
+        self.assertIsNone(main.get_query_data_v1('{"url": "/api/v1/flight_calculator/", "token": null}'))
+
+    def test_parse_url_query(self):
+        for url_query in ['departure_airport=KIV&pax=&fields', 'a=1&&b=x+y&c=%26%3D',
+                          'avoid_countries%5B%5D=South%20Africa&aircraft_profile=Cessna+Citation+X', '']:
+            with self.subTest(url_query=url_query):
+                self.assertEqual(main.parse_url_query(url_query),
+                                 urllib.parse.parse_qsl(url_query, keep_blank_values=True))
+
+    def test_get_queries(self):
+        with mock.patch.dict(main.os.environ, {'FILENAME': 'frc_test.csv'}):
+            queries = main.get_queries()
+            self.assertIsInstance(queries, types.GeneratorType)
+            queries = list(queries)
+        self.assertEqual(len(queries), 9)
+        self.assertEqual(queries[0].get('departure_airport'), 'PHKO')
+        self.assertEqual(queries[1].get('departure_airport'), 'KOPF')
+
+    def test_run_api_queries_bounded(self):
+        in_flight = 0
+        max_in_flight = 0
+
+        async def fake_test_api_query(session, query):
+            nonlocal in_flight, max_in_flight
+            in_flight += 1
+            max_in_flight = max(max_in_flight, in_flight)
+            await asyncio.sleep(0.001)
+            in_flight -= 1
+            return {'request_body': query}
+
+        queries = ({'pax': i} for i in range(200))
+        with mock.patch.object(main, 'test_api_query', fake_test_api_query):
+            results = asyncio.run(main.test_api_queries(queries, concurrency=4, queue_size=8))
+        self.assertEqual(len(results), 200)
+        self.assertEqual(max_in_flight, 4)
+        self.assertEqual(sorted(result.get('request_body').get('pax') for result in results), list(range(200)))
+
+    def test_run_api_queries_shared_session(self):
+        async def fake_test_api_query(session, query):
+            return {'request_body': query}
+
+        async def run_twice():
+            session = main.create_session(pool_size=8, pool_size_per_host=8)
+            try:
+                first = await main.test_api_queries([{'pax': 1}], session=session)
+                second = await main.test_api_queries([{'pax': 2}], rate_limit=100, rate_burst=2, session=session)
+                return first, second, session.closed
+            finally:
+                await session.close()
+
+        with mock.patch.object(main, 'test_api_query', fake_test_api_query):
+            first, second, closed = asyncio.run(run_twice())
+        self.assertFalse(closed)
+        self.assertEqual(first[0].get('request_body'), {'pax': 1})
+        self.assertEqual(second[0].get('request_body'), {'pax': 2})
+        self.assertGreaterEqual(second[0].get('wait_time'), 0)
+
+    def test_get_timed_queries(self):
+        with mock.patch.dict(main.os.environ, {'FILENAME': 'frc_test.csv'}):
+            timed_queries = list(main.get_timed_queries())
+        self.assertEqual(len(timed_queries), 9)
+        self.assertEqual(timed_queries[0][0], datetime(2022, 3, 1, 0, 4, 2, 184166))
+        self.assertEqual(timed_queries[0][1].get('departure_airport'), 'PHKO')
+        self.assertEqual(main.get_query_date('2022-03-01 00:16:07.83671'), datetime(2022, 3, 1, 0, 16, 7, 836710))
+        self.assertEqual(main.get_query_date('2022-03-01 00:16:07'), datetime(2022, 3, 1, 0, 16, 7))
+
+    def test_replay_api_queries(self):
+        async def slow_test_api_query(session, query):
+            await asyncio.sleep(0.3)
+            return {'request_body': query}
+
+        # Responses are slower than the arrival rate, requests are still sent on schedule
+        first_date = datetime(2022, 3, 1)
+        timed_queries = [(first_date + timedelta(seconds=0.1 * i), {'pax': i}) for i in range(5)]
+        results = []
+        with mock.patch.object(main, 'test_api_query', slow_test_api_query):
+            processed = asyncio.run(main.replay_api_queries(timed_queries, results.append, speed=2))
+        self.assertEqual(processed, 5)
+        for result in results:
+            scheduled_time = result.get('request_body').get('pax') * 50
+            self.assertAlmostEqual(result.get('scheduled_time'), scheduled_time, places=5)
+            self.assertGreaterEqual(result.get('send_time'), scheduled_time - 5)
+            self.assertLess(result.get('send_time'), scheduled_time + 40)
+
+    def test_replay_blocking_source(self):
+        # A source that blocks does not stall the replay loop, so responses are read and requests sent on time
+        async def fake_test_api_query(session, query):
+            await asyncio.sleep(0.01)
+            return {'request_body': query}
+
+        first_date = datetime(2022, 3, 1)
+
+        def slow_timed_queries():
+            for index in range(3):
+                time.sleep(0.2)
+                yield first_date + timedelta(seconds=0.2 * index), {'pax': index}
+
+        async def run():
+            lags = []
+
+            async def ticker():
+                while True:
+                    start_time = time.perf_counter()
+                    await asyncio.sleep(0.01)
+                    lags.append(time.perf_counter() - start_time)
+
+            tick = asyncio.create_task(ticker())
+            results = []
+            with mock.patch.object(main, 'READ_BATCH', 1):
+                await main.replay_api_queries(slow_timed_queries(), results.append, speed=1)
+            tick.cancel()
+            return results, lags
+
+        with mock.patch.object(main, 'test_api_query', fake_test_api_query):
+            results, lags = asyncio.run(run())
+        self.assertEqual(len(results), 3)
+        self.assertLess(max(lags), 0.1)
+
+    def test_run_api_queries_blocking_source(self):
+        # A source that blocks (parallel parsing waiting for its processes) does not stall the requests in flight
+        async def fake_test_api_query(session, query):
+            await asyncio.sleep(0.01)
+            return {'request_body': query, 'elapsed_time': 1.0, 'status_code': 200}
+
+        def slow_queries():
+            for pax in range(3):
+                time.sleep(0.2)
+                yield {'pax': pax}
+
+        async def run():
+            lags = []
+
+            async def ticker():
+                while True:
+                    start_time = time.perf_counter()
+                    await asyncio.sleep(0.01)
+                    lags.append(time.perf_counter() - start_time)
+
+            tick = asyncio.create_task(ticker())
+            with mock.patch.object(main, 'READ_BATCH', 1):
+                results = await main.test_api_queries(slow_queries(), concurrency=2)
+            tick.cancel()
+            return results, lags
+
+        with mock.patch.object(main, 'test_api_query', fake_test_api_query):
+            results, lags = asyncio.run(run())
+        self.assertEqual(len(results), 3)
+        self.assertLess(max(lags), 0.1)
+
+    def test_run_api_queries_deduplicate(self):
+        sent = []
+
+        async def fake_test_api_query(session, query):
+            sent.append(query)
+            await asyncio.sleep(0.01)
+            return {'request_body': query, 'elapsed_time': 1.0, 'status_code': 200}
+
+        queries = [{'pax': 1, 'avoid_firs': ['A', 'B']}, {'pax': 2}, {'avoid_firs': ['B', 'A'], 'pax': 1}, {'pax': 2}]
+        with mock.patch.object(main, 'test_api_query', fake_test_api_query):
+            results = asyncio.run(main.test_api_queries(queries, concurrency=4, deduplicate=True))
+        self.assertEqual(len(sent), 2)
+        self.assertEqual(len(results), 4)
+        self.assertEqual(sorted(result.get('source') for result in results), ['api', 'api', 'duplicate', 'duplicate'])
+        self.assertIn({'avoid_firs': ['B', 'A'], 'pax': 1}, [result.get('request_body') for result in results])
+
+    def test_run_api_queries_deduplicate_limit(self):
+        sent = []
+
+        async def fake_test_api_query(session, query):
+            sent.append(query)
+            return {'request_body': query, 'elapsed_time': 1.0, 'status_code': 200}
+
+        # With room for 2 queries, pax 1 is forgotten once pax 3 is seen, pax 2 is kept because it was seen again
+        queries = [{'pax': 1}, {'pax': 2}, {'pax': 2}, {'pax': 3}, {'pax': 2}, {'pax': 1}]
+        with mock.patch.object(main, 'test_api_query', fake_test_api_query), \
+                mock.patch.object(main, 'DEDUPLICATE_MAX_ENTRIES', 2):
+            results = asyncio.run(main.test_api_queries(queries, concurrency=1, deduplicate=True))
+        self.assertEqual(sent, [{'pax': 1}, {'pax': 2}, {'pax': 3}, {'pax': 1}])
+        self.assertEqual([result.get('source') for result in results], ['api', 'api', 'duplicate', 'api', 'duplicate', 'api'])
+
+    def test_run_api_queries_cache(self):
+        sent = []
+
+        async def fake_test_api_query(session, query):
+            sent.append(query)
+            return {'request_body': query, 'elapsed_time': 1.0, 'status_code': 200 if query.get('pax') else 500}
+
+        queries = [{'pax': 1}, {'pax': 0}]
+        with tempfile.TemporaryDirectory() as directory, \
+                mock.patch.object(main, 'test_api_query', fake_test_api_query):
+            cache = main.ResponseCache(os.path.join(directory, 'cache.sqlite'))
+            asyncio.run(main.test_api_queries(queries, cache=cache))
+            results = asyncio.run(main.test_api_queries(queries, cache=cache))
+            cache.close()
+        # Only successful responses are cached
+        self.assertEqual(len(sent), 3)
+        sources = {result.get('request_body').get('pax'): result.get('source') for result in results}
+        self.assertEqual(sources, {1: 'cache', 0: 'api'})
+
+    def test_get_phases(self):
+        timings = {'dns_start': 1.0, 'dns_end': 1.01, 'connect_start': 1.0, 'connect_end': 1.05}
+        phases = main.get_phases(timings, 0.99, 1.25, 1.3)
+        self.assertAlmostEqual(phases.get('dns'), 10)
+        self.assertAlmostEqual(phases.get('connect'), 40)
+        self.assertAlmostEqual(phases.get('ttfb'), 200)
+        self.assertAlmostEqual(phases.get('body'), 50)
+        self.assertNotIn('pool_wait', phases)
+
+    def test_trace_config(self):
+        async def handler(request):
+            return aiohttp.web.json_response({})
+
+        async def post():
+            app = aiohttp.web.Application()
+            app.router.add_post('/', handler)
+            runner = aiohttp.web.AppRunner(app)
+            await runner.setup()
+            site = aiohttp.web.TCPSite(runner, '127.0.0.1', 0)
+            await site.start()
+            port = runner.addresses[0][1]
+            timings = {}
+            try:
+                async with main.create_session() as session:
+                    async with session.post(f'http://127.0.0.1:{port}/', json={}, trace_request_ctx=timings) as request:
+                        await request.read()
+            finally:
+                await runner.cleanup()
+            return timings
+
+        timings = asyncio.run(post())
+        self.assertLessEqual(timings.get('connect_start'), timings.get('connect_end'))
+
+    def test_prepared_body(self):
+        requests = []
+
+        async def handler(request):
+            requests.append((request.headers.get('Content-Type'), await request.read()))
+            return aiohttp.web.json_response({'errors': [], 'warnings': [[]]})
+
+        async def post(queries):
+            app = aiohttp.web.Application()
+            app.router.add_post('/flight_calculator/', handler)
+            runner = aiohttp.web.AppRunner(app)
+            await runner.setup()
+            site = aiohttp.web.TCPSite(runner, '127.0.0.1', 0)
+            await site.start()
+            port = runner.addresses[0][1]
+            try:
+                with mock.patch.object(main, 'FRC_URL', f'http://127.0.0.1:{port}/flight_calculator/'):
+                    return await main.test_api_queries(queries)
+            finally:
+                await runner.cleanup()
+
+        query = {'departure_airport': 'KIV', 'arrival_airport': 'VKO', 'aircraft': 'Gulfstream G450, VIP', 'avoid_firs': ['UKBV']}
+        results = asyncio.run(post([query]))
+        self.assertEqual(results[0].get('status_code'), 200)
+        self.assertEqual(requests[0][0], 'application/json')
+        self.assertEqual(json.loads(requests[0][1]), query)
+
+    def test_prepare_query(self):
+        query = {'departure_airport': 'KIV', 'pax': 2}
+        prepared = main.prepare_query(query)
+        self.assertEqual(prepared, query)
+        self.assertEqual(repr(prepared), repr(query))
+        self.assertEqual(json.loads(prepared.body), query)
+        self.assertIs(main.prepare_query(prepared), prepared)
+        self.assertEqual(main.get_query_hash(prepared), main.get_query_hash(query))
+        # Sent to the coordinator by worker processes
+        copy = pickle.loads(pickle.dumps(prepared))
+        self.assertEqual(copy.body, prepared.body)
+
     def test_convert_parameter_v1(self):
         parameter_name = 'departure_airport'
         parameter_value = 'ABC'
@@ -0,0 +1,72 @@
+import unittest
+import json
+import os
+import random
+import tempfile
+
+from histogram import LatencyHistogram, RunStats
+
+
+class LatencyHistogramTest(unittest.TestCase):
+    def test_percentiles(self):
+        histogram = LatencyHistogram()
+        for value in range(1, 10001):
+            histogram.record(value / 10)
+        self.assertEqual(histogram.count, 10000)
+        self.assertAlmostEqual(histogram.percentile(50), 500, delta=5)
+        self.assertAlmostEqual(histogram.percentile(99), 990, delta=10)
+        self.assertAlmostEqual(histogram.percentile(99.9), 999, delta=10)
+        self.assertEqual(histogram.percentile(100), 1000)
+        self.assertEqual(histogram.min, 0.1)
+        self.assertAlmostEqual(histogram.mean(), 500.05)
+
+    def test_merge(self):
+        random.seed(1)
+        values = [random.expovariate(0.01) for _ in range(5000)]
+        merged = LatencyHistogram()
+        whole = LatencyHistogram()
+        for index, value in enumerate(values):
+            whole.record(value)
+            if index % 2 == 0:
+                merged.record(value)
+        other = LatencyHistogram()
+        for value in values[1::2]:
+            other.record(value)
+        merged.merge(other)
+        self.assertEqual(merged.count, whole.count)
+        for percentile in (50, 90, 99):
+            self.assertEqual(merged.percentile(percentile), whole.percentile(percentile))
+        with self.assertRaises(ValueError):
+            merged.merge(LatencyHistogram(precision=0.1))
+
+    def test_serialization(self):
+        histogram = LatencyHistogram()
+        for value in (0.5, 12, 12.2, 800):
+            histogram.record(value)
+        restored = LatencyHistogram.from_dict(json.loads(json.dumps(histogram.to_dict())))
+        self.assertEqual(restored.count, 4)
+        self.assertEqual(restored.percentile(50), histogram.percentile(50))
+        self.assertEqual(restored.max, 800)
+        self.assertEqual(list(restored.counts), list(histogram.counts))
+
+
+class RunStatsTest(unittest.TestCase):
+    def test_summary(self):
+        stats = RunStats()
+        stats.record({'elapsed_time': 120, 'phases': {'dns': 3, 'connect': 20, 'ttfb': 90, 'body': 7}})
+        stats.record({'elapsed_time': 80, 'phases': {'ttfb': 75, 'body': 5}})
+        stats.finish()
+        self.assertEqual(stats.histograms['total'].count, 2)
+        self.assertEqual(stats.histograms['dns'].count, 1)
+        summary = stats.summary()
+        self.assertIn('Requests: 2', summary[0])
+        self.assertFalse(any('pool_wait' in line for line in summary))
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'histograms.json')
+            stats.write(path)
+            with open(path) as file:
+                self.assertEqual(json.load(file)['histograms']['ttfb']['count'], 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,69 @@
+import unittest
+from unittest import mock
+import csv
+import json
+import os
+import tempfile
+
+import main
+from ingest import get_chunks, parse_chunk, parse_log_parallel
+
+
+LOG_PATH = f'{main.BASE_DIR}/frc_test.csv'
+
+
+class IngestTest(unittest.TestCase):
+    def test_get_chunks(self):
+        chunks = get_chunks(LOG_PATH, 1000)
+        self.assertGreater(len(chunks), 5)
+        self.assertEqual(chunks[0][0], 0)
+        self.assertEqual(chunks[-1][1], os.path.getsize(LOG_PATH))
+        with open(LOG_PATH, 'rb') as file:
+            data = file.read()
+        for (start, end), (next_start, _) in zip(chunks, chunks[1:]):
+            self.assertEqual(end, next_start)
+            self.assertEqual(data[end - 1:end], b'\n')
+
+    def test_get_chunks_empty(self):
+        with tempfile.NamedTemporaryFile() as file:
+            self.assertEqual(get_chunks(file.name, 1000), [])
+
+    def test_get_chunks_quoted_line_breaks(self):
+        # Quoted fields with line breaks and "" escapes, every boundary must fall between records
+        with open(LOG_PATH, newline='') as file:
+            rows = list(csv.reader(file))[:50]
+        rows = [row[:-1] + [f'{row[-1]}\n"quoted"\n, line\n'] for row in rows]
+        with tempfile.TemporaryDirectory() as directory:
+            path = f'{directory}/log.csv'
+            with open(path, 'w', newline='') as file:
+                csv.writer(file, lineterminator='\n').writerows(rows)
+            for chunk_size in (1, 100, 1000):
+                with self.subTest(chunk_size=chunk_size):
+                    items = [item for start, end in get_chunks(path, chunk_size)
+                             for item in parse_chunk(path, start, end, list)]
+                    self.assertEqual(items, rows)
+
+    def test_parse_chunk(self):
+        items = [item for start, end in get_chunks(LOG_PATH, 1000)
+                 for item in parse_chunk(LOG_PATH, start, end, main.get_query_data)]
+        with mock.patch.dict(main.os.environ, {'FILENAME': 'frc_test.csv'}):
+            self.assertEqual(items, list(main.get_queries()))
+
+    def test_parse_log_parallel(self):
+        with mock.patch.dict(main.os.environ, {'FILENAME': 'frc_test.csv'}):
+            queries = list(main.get_queries())
+        ordered = list(parse_log_parallel(LOG_PATH, main.get_query_data, 2, 1000))
+        self.assertEqual(ordered, queries)
+        unordered = list(parse_log_parallel(LOG_PATH, main.get_query_data, 2, 1000, ordered=False))
+        key = lambda query: json.dumps(query, sort_keys=True)
+        self.assertEqual(sorted(unordered, key=key), sorted(queries, key=key))
+
+    def test_read_log_parallel(self):
+        with mock.patch.dict(main.os.environ, {'FILENAME': 'frc_test.csv'}):
+            timed_queries = list(main.get_timed_queries())
+            with mock.patch.object(main, 'PARSE_WORKERS', 2), mock.patch.object(main, 'PARSE_CHUNK_SIZE', 1000):
+                self.assertEqual(list(main.get_timed_queries()), timed_queries)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,99 @@
+import unittest
+from unittest import mock
+import urllib.request
+
+from metrics import Metrics, MetricsServer, escape_label
+
+
+class MetricsTest(unittest.TestCase):
+    def test_counters(self):
+        metrics = Metrics()
+        for _ in range(3):
+            metrics.request_started()
+        metrics.request_finished({'status_code': 200, 'elapsed_time': 100.0, 'error_codes': []})
+        metrics.request_finished({'status_code': 0, 'elapsed_time': 20.0, 'error_codes': ['CALCULATION_ERROR']})
+        snapshot = metrics.snapshot()
+        self.assertEqual(snapshot['sent'], 3)
+        self.assertEqual(snapshot['completed'], 2)
+        self.assertEqual(snapshot['in_flight'], 1)
+        self.assertEqual(snapshot['status_codes'], {200: 1, 0: 1})
+        self.assertEqual(snapshot['error_codes'], {'CALCULATION_ERROR': 1})
+        self.assertAlmostEqual(snapshot['latency_total'], 120.0)
+        # Cancelled requests leave the in flight gauge without a result
+        metrics.request_finished(None)
+        self.assertEqual(metrics.snapshot()['in_flight'], 0)
+        self.assertEqual(metrics.snapshot()['completed'], 2)
+
+    def test_shard_counts(self):
+        # Counts of a shard process added to the metrics of the coordinator
+        shard = Metrics()
+        for _ in range(3):
+            shard.request_started()
+        shard.request_finished({'status_code': 200, 'elapsed_time': 100.0, 'error_codes': []})
+        shard.request_finished({'status_code': 200, 'elapsed_time': 300.0, 'error_codes': ['CALCULATION_ERROR']})
+        coordinator = Metrics()
+        coordinator.merge_counts('shard', shard.take_counts())
+        snapshot = coordinator.snapshot()
+        self.assertEqual(snapshot['sent'], 3)
+        self.assertEqual(snapshot['completed'], 2)
+        self.assertEqual(snapshot['in_flight'], 1)
+        self.assertEqual(snapshot['status_codes'], {200: 2})
+        self.assertEqual(snapshot['error_codes'], {'CALCULATION_ERROR': 1})
+        self.assertEqual(snapshot['window_count'], 2)
+        # Only the changes are taken again, the in flight gauge of the shard is replaced
+        shard.request_finished({'status_code': 500, 'elapsed_time': 50.0, 'error_codes': []})
+        coordinator.merge_counts('shard', shard.take_counts())
+        snapshot = coordinator.snapshot()
+        self.assertEqual(snapshot['sent'], 3)
+        self.assertEqual(snapshot['completed'], 3)
+        self.assertEqual(snapshot['in_flight'], 0)
+        self.assertEqual(snapshot['status_codes'], {200: 2, 500: 1})
+        self.assertAlmostEqual(snapshot['latency_total'], 450.0)
+
+    def test_rolling_window(self):
+        metrics = Metrics(window=10)
+        with mock.patch('metrics.time.monotonic', return_value=1000.0):
+            metrics.request_started()
+            metrics.request_finished({'status_code': 200, 'elapsed_time': 5000.0})
+        with mock.patch('metrics.time.monotonic', return_value=1005.0):
+            metrics.request_started()
+            metrics.request_finished({'status_code': 200, 'elapsed_time': 10.0})
+            self.assertEqual(metrics.get_window_histogram().count, 2)
+        with mock.patch('metrics.time.monotonic', return_value=1012.0):
+            histogram = metrics.get_window_histogram()
+        self.assertEqual(histogram.count, 1)
+        self.assertAlmostEqual(histogram.max, 10.0, delta=0.1)
+        # Totals are not windowed
+        self.assertEqual(metrics.completed, 2)
+
+    def test_render_prometheus(self):
+        metrics = Metrics()
+        metrics.request_started()
+        metrics.request_finished({'status_code': 200, 'elapsed_time': 50.0, 'error_codes': ['BAD"CODE']})
+        text = metrics.render_prometheus()
+        self.assertIn('frc_requests_sent_total 1\n', text)
+        self.assertIn('frc_requests_in_flight 0\n', text)
+        self.assertIn('frc_responses_total{status_code="200"} 1\n', text)
+        self.assertIn('frc_error_codes_total{code="BAD\\"CODE"} 1\n', text)
+        self.assertIn('frc_latency_ms{quantile="0.99"}', text)
+        self.assertIn('frc_latency_ms_count 1\n', text)
+        self.assertIn('# TYPE frc_latency_ms summary', text)
+
+    def test_escape_label(self):
+        self.assertEqual(escape_label('a\\b"c\nd'), 'a\\\\b\\"c\\nd')
+
+    def test_metrics_server(self):
+        metrics = Metrics()
+        metrics.request_started()
+        server = MetricsServer(metrics, host='127.0.0.1', port=0).start()
+        try:
+            with urllib.request.urlopen(f'http://127.0.0.1:{server.port}/metrics') as response:
+                self.assertTrue(response.headers['Content-Type'].startswith('text/plain'))
+                text = response.read().decode('utf-8')
+        finally:
+            server.stop()
+        self.assertIn('frc_requests_in_flight 1', text)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,69 @@
+import unittest
+from unittest import mock
+import asyncio
+
+import main
+from mock_server import MockServer, MockSettings, parse_status_codes
+
+
+QUERY = {
+    'departure_airport': 'PHKO',
+    'arrival_airport': 'KSFO',
+    'pax': 2,
+    'aircraft': 'Gulfstream G450'
+}
+
+
+class MockServerTest(unittest.TestCase):
+    def run_queries(self, settings: MockSettings, queries: list) -> list:
+        with MockServer(settings) as server, mock.patch.object(main, 'FRC_URL', server.url):
+            return asyncio.run(main.test_api_queries(queries))
+
+    def test_correct(self):
+        results = self.run_queries(MockSettings(latency=20), [QUERY])
+        self.assertEqual(results[0].get('status_code'), 200)
+        self.assertGreaterEqual(results[0].get('elapsed_time'), 20)
+        self.assertEqual(results[0].get('error_codes'), set())
+        self.assertEqual(results[0].get('warning_codes'), set())
+
+    def test_errors_and_warnings(self):
+        results = self.run_queries(MockSettings(error_rate=1, warning_rate=1), [QUERY, {'pax': 1}])
+        results = {result.get('request_body').get('pax'): result for result in results}
+        self.assertEqual(results[2].get('error_codes'), {'CALCULATION_ERROR'})
+        self.assertEqual(results[2].get('warning_codes'), {'FUEL_STOP'})
+        self.assertEqual(results[1].get('error_codes'), {'MISSING_FIELD', 'CALCULATION_ERROR'})
+        self.assertEqual(len(results[1].get('error_messages')), 4)
+
+    def test_status_codes(self):
+        results = self.run_queries(MockSettings(status_codes={500: 0.5}, seed=1), [QUERY] * 200)
+        status_codes = [result.get('status_code') for result in results]
+        self.assertEqual(set(status_codes), {200, 500})
+        self.assertAlmostEqual(status_codes.count(500) / 200, 0.5, delta=0.15)
+
+    def test_slow_body(self):
+        results = self.run_queries(MockSettings(body_chunks=4, body_chunk_delay=25), [QUERY])
+        phases = results[0].get('phases')
+        self.assertEqual(results[0].get('status_code'), 200)
+        self.assertGreaterEqual(phases.get('body'), 60)
+        self.assertLess(phases.get('ttfb'), phases.get('body'))
+
+    def test_latency_distributions(self):
+        for distribution in ('fixed', 'uniform', 'exponential', 'lognormal'):
+            settings = MockSettings(latency=10, latency_spread=0.5, latency_distribution=distribution, seed=1)
+            latencies = [settings.get_latency() for _ in range(2000)]
+            self.assertGreaterEqual(min(latencies), 0)
+            self.assertAlmostEqual(sorted(latencies)[1000], 10, delta=4)
+        with self.assertRaises(ValueError):
+            MockSettings(latency_distribution='normal')
+
+    def test_port_in_use(self):
+        with MockServer() as server:
+            with self.assertRaises(OSError):
+                MockServer(port=server.port).start()
+
+    def test_parse_status_codes(self):
+        self.assertEqual(parse_status_codes('500:0.01,429:0.05'), {500: 0.01, 429: 0.05})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,37 @@
+import unittest
+import asyncio
+import time
+
+from ratelimit import TokenBucket
+
+
+class TokenBucketTest(unittest.TestCase):
+    def test_rate(self):
+        async def acquire_all():
+            bucket = TokenBucket(rate=100, burst=5)
+            start_time = time.monotonic()
+            await asyncio.gather(*(bucket.acquire() for _ in range(25)))
+            return time.monotonic() - start_time
+
+        # 5 tokens are available at once, 20 more come at 100 per second
+        elapsed_time = asyncio.run(acquire_all())
+        self.assertGreaterEqual(elapsed_time, 0.18)
+        self.assertLess(elapsed_time, 1)
+
+    def test_burst(self):
+        async def acquire_burst():
+            bucket = TokenBucket(rate=1, burst=10)
+            return [await bucket.acquire() for _ in range(10)]
+
+        waits = asyncio.run(acquire_burst())
+        self.assertLess(max(waits), 0.05)
+
+    def test_invalid(self):
+        with self.assertRaises(ValueError):
+            TokenBucket(rate=0)
+        with self.assertRaises(ValueError):
+            TokenBucket(rate=10, burst=0)
+
+
+if __name__ == '__main__':
+    unittest.main()
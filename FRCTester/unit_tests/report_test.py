@@ -0,0 +1,120 @@
+import unittest
+from unittest import mock
+from collections import Counter
+import csv
+import gzip
+import json
+import tempfile
+
+import main
+from report import ReportWriter, read_checkpoint, skip_completed
+
+
+HEADERS = ['REQUEST_BODY', 'RESPONSE_TIME']
+
+
+class ReportWriterTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_buffered_csv(self):
+        report = ReportWriter(self.directory.name, HEADERS, flush_rows=2, flush_interval=60)
+        report.write([{'pax': 1}, '1.00000'], 'a')
+        with open(report.path) as file:
+            self.assertEqual(len(list(csv.reader(file))), 1)
+        report.write([{'pax': 2}, '2.00000'], 'b')
+        with open(report.path) as file:
+            self.assertEqual(len(list(csv.reader(file))), 3)
+        report.write([{'pax': 3}, '3.00000'], 'a')
+        report.close()
+        with open(report.path) as file:
+            rows = list(csv.reader(file))
+        self.assertEqual(rows[0], HEADERS)
+        self.assertEqual(rows[3], ["{'pax': 3}", '3.00000'])
+        self.assertEqual(read_checkpoint(report.checkpoint_path), Counter({'a': 2, 'b': 1}))
+
+    def test_resume_gzip(self):
+        with ReportWriter(self.directory.name, HEADERS, 'csv.gz') as report:
+            report.write([{'pax': 1}, '1.00000'], 'a')
+        with ReportWriter(self.directory.name, HEADERS, 'csv.gz', resume=True) as report:
+            report.write([{'pax': 2}, '2.00000'], 'b')
+        with gzip.open(report.path, 'rt') as file:
+            rows = list(csv.reader(file))
+        self.assertEqual(rows, [HEADERS, ["{'pax': 1}", '1.00000'], ["{'pax': 2}", '2.00000']])
+        self.assertEqual(read_checkpoint(report.checkpoint_path), Counter({'a': 1, 'b': 1}))
+
+    def read_rows(self, path: str, report_format: str) -> list:
+        opener = gzip.open if report_format.endswith('.gz') else open
+        with opener(path, 'rt', newline='') as file:
+            if report_format.startswith('csv'):
+                return list(csv.reader(file))[1:]
+            return [[str(value) for value in json.loads(line).values()] for line in file]
+
+    def test_resume_after_crash(self):
+        # Files of a killed run: rows were flushed, but a gzip stream was never finished and a plain report
+        # ends with a row cut off in the middle
+        for report_format in ('csv.gz', 'ndjson.gz', 'csv'):
+            with self.subTest(report_format=report_format):
+                directory = tempfile.mkdtemp(dir=self.directory.name)
+                report = ReportWriter(directory, HEADERS, report_format)
+                report.write([{'pax': 1}, '1.00000'], 'a')
+                report.flush()
+                with open(report.path, 'rb') as file:
+                    snapshot = file.read()
+                report.close()
+                with open(report.path, 'wb') as file:
+                    file.write(snapshot if report_format.endswith('.gz') else snapshot + b'"{\'pax\': 2')
+                with ReportWriter(directory, HEADERS, report_format, resume=True) as report:
+                    report.write([{'pax': 2}, '2.00000'], 'b')
+                self.assertEqual(self.read_rows(report.path, report_format),
+                                 [["{'pax': 1}", '1.00000'], ["{'pax': 2}", '2.00000']])
+                self.assertEqual(read_checkpoint(report.checkpoint_path), Counter({'a': 1, 'b': 1}))
+
+    def test_ndjson(self):
+        with ReportWriter(self.directory.name, HEADERS, 'ndjson.gz') as report:
+            report.write([{'pax': 1}, '1.00000'], 'a')
+        with gzip.open(report.path, 'rt') as file:
+            self.assertEqual([json.loads(line) for line in file], [{'REQUEST_BODY': {'pax': 1}, 'RESPONSE_TIME': '1.00000'}])
+
+    def test_unknown_format(self):
+        with self.assertRaises(ValueError):
+            ReportWriter(self.directory.name, HEADERS, 'xlsx')
+
+    def test_skip_completed(self):
+        completed = Counter({'a': 2, 'b': 1})
+        items = ['a', 'b', 'a', 'a', 'c', 'b']
+        self.assertEqual(list(skip_completed(items, completed, lambda item: item)), ['a', 'c', 'b'])
+
+
+class ResumeTest(unittest.TestCase):
+    def test_main_resume(self):
+        sent = []
+
+        async def failing_test_api_query(session, query):
+            if len(sent) == 5:
+                raise RuntimeError('Tester crashed')
+            sent.append(query)
+            return {'request_body': query, 'elapsed_time': 1.0, 'status_code': 200, 'error_codes': set(),
+                    'error_messages': set(), 'warning_codes': set(), 'warning_messages': set()}
+
+        with tempfile.TemporaryDirectory() as directory, \
+                mock.patch.dict(main.os.environ, {'FILENAME': 'frc_test.csv'}), \
+                mock.patch.object(main, 'REPORTS_PATH', directory), \
+                mock.patch.object(main, 'REPORT_FLUSH_ROWS', 1), \
+                mock.patch.object(main, 'test_api_query', failing_test_api_query):
+            with self.assertRaises(RuntimeError):
+                main.main()
+            sent.clear()
+            main.main(resume=True)
+            with open(f'{directory}/report.csv') as file:
+                rows = list(csv.reader(file))
+        self.assertEqual(len(sent), 4)
+        self.assertEqual(rows[0], main.REPORT_HEADERS)
+        self.assertEqual(len(rows), 10)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,76 @@
+import unittest
+
+import main
+from results import InternTable, ResultStore
+
+
+QUERY = {'departure_airport': 'KIV', 'arrival_airport': 'VKO', 'aircraft': 'Challenger 300', 'pax': 1}
+
+
+def get_result(query: dict, elapsed_time: float, error_codes: set = frozenset()) -> dict:
+    return {
+        'request_body': query,
+        'elapsed_time': elapsed_time,
+        'status_code': 200,
+        'error_codes': set(error_codes),
+        'error_messages': {f'{code} message' for code in error_codes},
+        'warning_codes': set(),
+        'warning_messages': set(),
+        'phases': {'ttfb': elapsed_time - 1, 'body': 1.0}
+    }
+
+
+class ResultStoreTest(unittest.TestCase):
+    def test_round_trip(self):
+        store = ResultStore()
+        result = dict(get_result(QUERY, 120.5, {'B', 'A'}), wait_time=3.0, source='api', attempts=2,
+                      hedged=True, winner='hedge', hedge_delay=25.0)
+        index = store.append(result)
+        stored = store[index]
+        self.assertEqual(stored.pop('query_hash'), main.get_query_hash(QUERY))
+        self.assertEqual(stored, result)
+        self.assertEqual(main.get_report_row(store[0]), main.get_report_row(dict(result, query_hash=store.get_query_hash(0))))
+        self.assertEqual(main.get_report_row(store[0])[3], 'A; B;')
+        self.assertEqual(main.get_report_row(store[0])[main.REPORT_HEADERS.index('HEDGE_DELAY')], '25.00000')
+
+    def test_missing_values(self):
+        store = ResultStore()
+        store.append({'request_body': QUERY, 'elapsed_time': 5.0, 'status_code': 0, 'exception': 'TimeoutError'})
+        result = store[-1]
+        self.assertEqual(result.get('phases'), {})
+        self.assertNotIn('scheduled_time', result)
+        self.assertNotIn('source', result)
+        self.assertEqual(result.get('error_codes'), set())
+        self.assertEqual(result.get('exception'), 'TimeoutError')
+        with self.assertRaises(IndexError):
+            store[1]
+
+    def test_shared_queries_and_codes(self):
+        store = ResultStore()
+        for elapsed_time in range(100):
+            store.append(get_result(dict(QUERY), elapsed_time, {'CALCULATION_ERROR'}))
+        # Written differently, same hash
+        store.append(get_result({'pax': 1, 'avoid_firs': ['B', 'A']}, 1.0))
+        store.append(get_result({'pax': 1, 'avoid_firs': ['A', 'B']}, 1.0))
+        self.assertEqual(len(store), 102)
+        self.assertEqual(len(store.queries), 3)
+        self.assertEqual(store[101].get('request_body'), {'pax': 1, 'avoid_firs': ['A', 'B']})
+        self.assertEqual(store.get_query_hash(100), store.get_query_hash(101))
+        # Empty tuple, the code tuple and the message tuple
+        self.assertEqual(len(store.values), 3)
+        self.assertEqual([result.get('elapsed_time') for result in store][:3], [0, 1, 2])
+        store.clear()
+        self.assertEqual(len(store), 0)
+
+    def test_intern_table(self):
+        table = InternTable()
+        self.assertEqual(table.add(None), 0)
+        self.assertEqual(table.add('api'), 1)
+        self.assertEqual(table.add('cache'), 2)
+        self.assertEqual(table.add('api'), 1)
+        self.assertEqual(table[2], 'cache')
+        self.assertEqual(len(table), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,161 @@
+import unittest
+from unittest import mock
+import asyncio
+import json
+
+import aiohttp
+
+import main
+from capacity import is_failed
+from hedging import Hedger
+from mock_server import MockServer, MockSettings
+
+
+QUERY = {'departure_airport': 'KIV', 'arrival_airport': 'VKO', 'aircraft': 'Challenger 300', 'pax': 1}
+
+
+class FakeResponse:
+    # 200 response with a fixed body
+    def __init__(self, body: str):
+        self.status = 200
+        self.body = body
+
+    async def json(self, content_type: str|None = 'application/json'):
+        return json.loads(self.body)
+
+    async def __aenter__(self) -> 'FakeResponse':
+        return self
+
+    async def __aexit__(self, *args) -> None:
+        pass
+
+
+class FakeSession:
+    def __init__(self, body: str):
+        self.body = body
+
+    def post(self, url: str, **kwargs) -> FakeResponse:
+        return FakeResponse(self.body)
+
+
+class RetriesTest(unittest.TestCase):
+    def setUp(self):
+        patch = mock.patch.multiple(main, RETRY_BACKOFF=0.001, RETRY_BACKOFF_MAX=0.01)
+        patch.start()
+        self.addCleanup(patch.stop)
+
+    def test_retry_status_codes(self):
+        status_codes = iter([503, 429, 200])
+
+        async def fake_test_api_query(session, query):
+            await asyncio.sleep(0.02)
+            return {'request_body': query, 'status_code': next(status_codes), 'elapsed_time': 20.0}
+
+        with mock.patch.object(main, 'test_api_query', fake_test_api_query):
+            result = asyncio.run(main.retry_api_query(None, QUERY, retries=2))
+        self.assertEqual(result.get('status_code'), 200)
+        self.assertEqual(result.get('attempts'), 3)
+        # Counted from the start of the first try, not the time of the last one
+        self.assertGreaterEqual(result.get('elapsed_time'), 60)
+
+    def test_retries_exhausted(self):
+        async def failing_test_api_query(session, query):
+            raise aiohttp.ServerDisconnectedError()
+
+        with mock.patch.object(main, 'test_api_query', failing_test_api_query):
+            result = asyncio.run(main.retry_api_query(None, QUERY, retries=1))
+        self.assertEqual(result.get('status_code'), 0)
+        self.assertEqual(result.get('attempts'), 2)
+        self.assertIn('ServerDisconnectedError', result.get('exception'))
+        row = main.get_report_row(result)
+        self.assertEqual(row[main.REPORT_HEADERS.index('ATTEMPTS')], 2)
+        self.assertIn('ServerDisconnectedError', row[main.REPORT_HEADERS.index('EXCEPTION')])
+
+    def test_not_retryable(self):
+        async def fake_test_api_query(session, query):
+            return {'request_body': query, 'status_code': 500}
+
+        with mock.patch.object(main, 'test_api_query', fake_test_api_query):
+            result = asyncio.run(main.retry_api_query(None, QUERY, retries=3))
+        self.assertEqual(result.get('attempts'), 1)
+
+    def test_unexpected_body(self):
+        # Malformed JSON, JSON that is not an object and errors that are not a list end as failed results
+        for body, error in (('<html>', 'JSONDecodeError'), ('[1, 2]', 'AttributeError'), ('{"errors": 5}', 'TypeError')):
+            with self.subTest(body=body):
+                result = asyncio.run(main.retry_api_query(FakeSession(body), QUERY, retries=2))
+                self.assertEqual(result.get('status_code'), 200)
+                self.assertEqual(result.get('attempts'), 1)
+                self.assertIn(error, result.get('exception'))
+                self.assertTrue(is_failed(result))
+                self.assertIn(error, main.get_report_row(result)[main.REPORT_HEADERS.index('EXCEPTION')])
+
+    def test_timeout(self):
+        # Hung server: the read timeout ends the request instead of stalling the run
+        async def run():
+            with mock.patch.multiple(main, TIMEOUT_READ=0.1, TIMEOUT_TOTAL=0):
+                async with main.create_session() as session:
+                    return await main.retry_api_query(session, QUERY, retries=1)
+
+        with MockServer(MockSettings(latency=2000)) as server, mock.patch.object(main, 'FRC_URL', server.url):
+            result = asyncio.run(run())
+        self.assertEqual(result.get('status_code'), 0)
+        self.assertEqual(result.get('attempts'), 2)
+        # Both read timeouts are counted, the hung server is still cut short
+        self.assertGreaterEqual(result.get('elapsed_time'), 200)
+        self.assertLess(result.get('elapsed_time'), 1000)
+
+
+class HedgingTest(unittest.TestCase):
+    def test_hedger_delay(self):
+        hedger = Hedger(percentile=95, min_samples=20, refresh=100)
+        for value in range(1, 20):
+            hedger.record(value)
+        self.assertIsNone(hedger.get_delay())
+        hedger.record(20)
+        self.assertAlmostEqual(hedger.get_delay(), 19, delta=0.5)
+
+    def test_hedge_wins(self):
+        calls = []
+
+        async def fake_test_api_query(session, query):
+            calls.append(query)
+            # The first request hangs, the duplicate answers at once
+            await asyncio.sleep(1 if len(calls) == 1 else 0.01)
+            return {'request_body': query, 'status_code': 200, 'elapsed_time': 10.0}
+
+        hedger = Hedger()
+        hedger.delay = 50
+        with mock.patch.object(main, 'test_api_query', fake_test_api_query):
+            result = asyncio.run(main.hedge_api_query(None, QUERY, hedger))
+        self.assertEqual(len(calls), 2)
+        self.assertTrue(result.get('hedged'))
+        self.assertEqual(result.get('winner'), 'hedge')
+        self.assertEqual(result.get('elapsed_time'), 60)
+        self.assertEqual(hedger.histogram.count, 1)
+        self.assertEqual(result.get('hedge_delay'), 50)
+
+    def test_no_hedge_when_fast(self):
+        calls = []
+
+        async def fake_test_api_query(session, query):
+            calls.append(query)
+            return {'request_body': query, 'status_code': 200, 'elapsed_time': 5.0}
+
+        hedger = Hedger()
+        hedger.delay = 50
+        with mock.patch.object(main, 'test_api_query', fake_test_api_query):
+            result = asyncio.run(main.hedge_api_query(None, QUERY, hedger))
+        self.assertEqual(len(calls), 1)
+        self.assertFalse(result.get('hedged'))
+        self.assertEqual(result.get('winner'), 'primary')
+
+    def test_run_api_queries_hedge(self):
+        with MockServer(MockSettings(latency=5)) as server, mock.patch.object(main, 'FRC_URL', server.url):
+            results = asyncio.run(main.test_api_queries([QUERY] * 50, concurrency=5, hedge=True))
+        self.assertEqual(len(results), 50)
+        self.assertTrue(all(result.get('winner') in ('primary', 'hedge') for result in results))
+
+
+if __name__ == '__main__':
+    unittest.main()
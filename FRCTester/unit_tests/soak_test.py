@@ -0,0 +1,115 @@
+import unittest
+from unittest import mock
+import asyncio
+import csv
+import glob
+import os
+import runpy
+import sys
+import tempfile
+import time
+
+import main
+import soak
+from mock_server import MockServer, MockSettings
+
+
+QUERIES = [{'departure_airport': 'KIV', 'arrival_airport': 'VKO', 'aircraft': 'Challenger 300', 'pax': pax} for pax in range(5)]
+
+
+class SoakTest(unittest.TestCase):
+    def test_get_soak_queries(self):
+        async def collect(duration: float, rate: float, mode: str = 'loop', seed: int = 1, limit: int|None = None) -> list:
+            queries = []
+            async for query in soak.get_soak_queries(QUERIES, duration, rate, mode, seed):
+                queries.append(query)
+                if len(queries) == limit:
+                    break
+            return queries
+
+        queries = asyncio.run(collect(0.05, 0))
+        self.assertGreater(len(queries), len(QUERIES))
+        self.assertEqual(queries[:6], QUERIES + QUERIES[:1])
+        self.assertEqual(asyncio.run(collect(10, 0, 'sample', seed=3, limit=20)),
+                         asyncio.run(collect(10, 0, 'sample', seed=3, limit=20)))
+        # Paced: about rate * duration queries
+        self.assertLessEqual(abs(len(asyncio.run(collect(0.5, 40))) - 20), 3)
+        with self.assertRaises(ValueError):
+            asyncio.run(collect(1, 0, 'shuffle'))
+        with self.assertRaises(ValueError):
+            asyncio.run(soak.get_soak_queries([], 1, 0).__anext__())
+
+    def test_report_rotation(self):
+        with tempfile.TemporaryDirectory() as directory:
+            with soak.SoakReport(directory, rotate_rows=2, keep_files=2) as report:
+                for index in range(7):
+                    report.write([index] * len(soak.SOAK_HEADERS))
+            paths = sorted(glob.glob(os.path.join(directory, 'soak-*.csv')))
+            self.assertEqual([os.path.basename(path) for path in paths], ['soak-0003.csv', 'soak-0004.csv'])
+            with open(paths[-1]) as file:
+                rows = list(csv.reader(file))
+        self.assertEqual(rows[0], soak.SOAK_HEADERS)
+        self.assertEqual([row[0] for row in rows[1:]], ['6'])
+
+    def test_window_row(self):
+        window = soak.SoakWindow(100.0)
+        window.record({'elapsed_time': 10.0, 'status_code': 200, 'error_codes': set()})
+        window.record({'elapsed_time': 30.0, 'status_code': 500, 'error_codes': set()})
+        window.record({'elapsed_time': 20.0, 'status_code': 200, 'error_codes': {'CALCULATION_ERROR'}})
+        row = dict(zip(soak.SOAK_HEADERS, window.get_row(110.0, 50 * 1024 * 1024)))
+        self.assertEqual(row['REQUESTS'], 3)
+        self.assertEqual(row['THROUGHPUT'], '0.30')
+        self.assertEqual(row['FAILED'], 2)
+        self.assertEqual(row['STATUS_CODES'], '200: 2; 500: 1')
+        self.assertEqual(row['ERROR_CODES'], 'CALCULATION_ERROR: 1')
+        self.assertEqual(row['RSS_MB'], '50.0')
+
+    def test_get_rss(self):
+        self.assertGreater(soak.get_rss(), 1024 * 1024)
+
+    def test_run_soak(self):
+        with MockServer(MockSettings(latency=2, error_rate=0.5, seed=1)) as server, \
+                mock.patch.object(main, 'FRC_URL', server.url), \
+                tempfile.TemporaryDirectory() as directory:
+            start_time = time.monotonic()
+            with soak.SoakReport(directory) as report:
+                summary = asyncio.run(soak.run_soak(QUERIES, report, duration=1.0, rate=50, window=0.25, concurrency=4))
+            elapsed_time = time.monotonic() - start_time
+            with open(report.paths[0]) as file:
+                rows = list(csv.DictReader(file))
+        # Nothing is left queued past the soak time
+        self.assertLess(elapsed_time, 1.5)
+        self.assertGreaterEqual(len(rows), 4)
+        self.assertEqual(summary['windows'], len(rows))
+        self.assertEqual(summary['requests'], sum(int(row['REQUESTS']) for row in rows))
+        # Rate limited to about 50 requests per second
+        self.assertGreater(summary['requests'], 40)
+        self.assertLess(summary['requests'], 60)
+        self.assertGreater(summary['failed'], 0)
+        self.assertGreater(summary['last_rss'], 0)
+
+    def test_run_soak_without_retries(self):
+        # Overload statuses are retryable, the windows still count every one of them
+        with MockServer(MockSettings(latency=2, status_codes={503: 0.5}, seed=1)) as server, \
+                mock.patch.object(main, 'FRC_URL', server.url), \
+                tempfile.TemporaryDirectory() as directory:
+            with soak.SoakReport(directory) as report:
+                summary = asyncio.run(soak.run_soak(QUERIES, report, duration=0.5, rate=100, window=0.5, concurrency=4))
+        self.assertGreater(summary['requests'], 30)
+        self.assertAlmostEqual(summary['failed'] / summary['requests'], 0.5, delta=0.15)
+
+    def test_soak_command(self):
+        # Run as a script, the soak test updates the metrics of the `main` module it imports
+        sent = main.METRICS.sent
+        argv = ['main.py', 'soak', '--duration', '0.5', '--rate', '20', '--window', '0.25']
+        with MockServer(MockSettings(latency=2)) as server, tempfile.TemporaryDirectory() as directory, \
+                mock.patch.multiple(main, FRC_URL=server.url, REPORTS_PATH=directory, METRICS_PORT=0), \
+                mock.patch.dict(os.environ, {'FILENAME': 'frc_test.csv'}), mock.patch.object(sys, 'argv', argv):
+            runpy.run_path(os.path.join(main.BASE_DIR, 'main.py'), run_name='__main__')
+            self.assertTrue(glob.glob(os.path.join(directory, 'soak-*.csv')))
+        self.assertGreater(main.METRICS.sent - sent, 5)
+
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,93 @@
+import unittest
+from unittest import mock
+from collections import Counter
+import itertools
+import json
+import os
+import random
+import tempfile
+
+import main
+from workload import AliasTable, WorkloadModel
+
+
+QUERIES = [
+    {'departure_airport': 'KIV', 'arrival_airport': 'VKO', 'aircraft': 'Challenger 300', 'pax': 1,
+     'airway_time': True, 'avoid_countries': ['Ukraine']},
+    {'departure_airport': 'EHAM', 'arrival_airport': 'LFPB', 'aircraft': 'f900', 'pax': 2,
+     'airway_route': True, 'ifr_route': True},
+    {'departure_airport': 'KIV', 'arrival_airport': 'VKO', 'aircraft': 'f900', 'pax': 1,
+     'airway_time': True, 'avoid_firs': ['UKBV', 'UKDV']}
+]
+
+
+class AliasTableTest(unittest.TestCase):
+    def test_sample_frequencies(self):
+        table = AliasTable(['a', 'b', 'c', 'd'], [50, 30, 15, 5])
+        rng = random.Random(1)
+        counts = Counter(table.sample(rng) for _ in range(100000))
+        for value, share in (('a', 0.5), ('b', 0.3), ('c', 0.15), ('d', 0.05)):
+            self.assertAlmostEqual(counts[value] / 100000, share, delta=0.01)
+
+    def test_single_value(self):
+        self.assertEqual(AliasTable(['a'], [3]).sample(random.Random(1)), 'a')
+
+    def test_no_values(self):
+        with self.assertRaises(ValueError):
+            AliasTable([], [])
+
+
+class WorkloadModelTest(unittest.TestCase):
+    def test_generate(self):
+        model = WorkloadModel().learn(QUERIES)
+        queries = list(model.generate(3000, seed=7))
+        self.assertEqual(len(queries), 3000)
+        self.assertEqual(queries, list(model.generate(3000, seed=7)))
+        self.assertNotEqual(queries, list(model.generate(3000, seed=8)))
+        routes = Counter((query['departure_airport'], query['arrival_airport']) for query in queries)
+        self.assertEqual(set(routes), {('KIV', 'VKO'), ('EHAM', 'LFPB')})
+        self.assertAlmostEqual(routes[('KIV', 'VKO')] / 3000, 2 / 3, delta=0.05)
+        # Flags of one log query stay together
+        for query in queries:
+            self.assertEqual(query.get('airway_route'), query.get('ifr_route'))
+        self.assertIn(['UKBV', 'UKDV'], [query.get('avoid_firs') for query in queries])
+        self.assertIn(None, [query.get('avoid_firs') for query in queries])
+
+    def test_endless(self):
+        model = WorkloadModel().learn(QUERIES)
+        self.assertEqual(len(list(itertools.islice(model.generate(), 10000))), 10000)
+
+    def test_generated_lists_are_copies(self):
+        model = WorkloadModel().learn(QUERIES[:1])
+        first, second = model.generate(2)
+        first['avoid_countries'].append('Belarus')
+        self.assertEqual(second['avoid_countries'], ['Ukraine'])
+
+    def test_empty_model(self):
+        with self.assertRaises(ValueError):
+            next(WorkloadModel().generate(1))
+
+    def test_write_read(self):
+        model = WorkloadModel().learn(QUERIES)
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'workload.json')
+            model.write(path)
+            copy = WorkloadModel.read(path)
+        self.assertEqual(copy.queries, 3)
+        self.assertEqual(list(copy.generate(100, seed=3)), list(model.generate(100, seed=3)))
+
+    def test_get_synthetic_queries(self):
+        with tempfile.TemporaryDirectory() as directory, \
+                mock.patch.dict(main.os.environ, {'FILENAME': 'frc_test.csv'}), \
+                mock.patch.object(main, 'REPORTS_PATH', directory):
+            log_queries = list(main.get_queries())
+            queries = list(main.get_synthetic_queries(500, seed=1))
+            with open(os.path.join(directory, 'workload.json')) as file:
+                self.assertEqual(json.load(file)['queries'], len(log_queries))
+        self.assertEqual(len(queries), 500)
+        aircraft = {query.get('aircraft') for query in log_queries}
+        self.assertTrue(all(query.get('aircraft') in aircraft for query in queries))
+
+
+if __name__ == '__main__':
+    unittest.main()
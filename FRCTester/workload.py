@@ -0,0 +1,132 @@
+from collections import Counter
+import json
+import random
+
+from typing import Iterable, Iterator
+
+
+# Features sampled independently of each other, the rest of a query is sampled as one profile
+# (flags, datetimes, tags), so flags that go together in the log go together in the synthetic queries
+FEATURES = ('route', 'aircraft', 'pax', 'avoid_countries', 'avoid_firs', 'profile')
+ROUTE_FIELDS = ('departure_airport', 'arrival_airport')
+LIST_FIELDS = ('avoid_countries', 'avoid_firs')
+
+
+class AliasTable:
+    # Walker's alias method (Vose's construction): O(n) to build, O(1) per sample
+    def __init__(self, values: list, weights: list):
+        if not values or len(values) != len(weights):
+            raise ValueError('Expected the same non-zero number of values and weights')
+        self.values = values
+        size = len(values)
+        total = sum(weights)
+        scaled = [weight * size / total for weight in weights]
+        self.probabilities = [1.0] * size
+        self.aliases = list(range(size))
+        small = [index for index, probability in enumerate(scaled) if probability < 1]
+        large = [index for index, probability in enumerate(scaled) if probability >= 1]
+        while small and large:
+            less = small.pop()
+            more = large.pop()
+            self.probabilities[less] = scaled[less]
+            self.aliases[less] = more
+            scaled[more] -= 1 - scaled[less]
+            if scaled[more] < 1:
+                small.append(more)
+            else:
+                large.append(more)
+        # Left over because of rounding, their probability is 1
+
+    def sample(self, rng: random.Random):
+        index = rng.randrange(len(self.values))
+        if rng.random() < self.probabilities[index]:
+            return self.values[index]
+        return self.values[self.aliases[index]]
+
+
+class WorkloadModel:
+    # Frequencies of query features learned from a log, generates any number of queries with the same mix
+    def __init__(self):
+        self.counts = {feature: Counter() for feature in FEATURES}
+        self.queries = 0
+        self.tables = None
+
+    def learn(self, queries: Iterable[dict]) -> 'WorkloadModel':
+        for query in queries:
+            self.record(query)
+        return self
+
+    def record(self, query: dict) -> None:
+        features = get_features(query)
+        for feature, value in features.items():
+            self.counts[feature][value] += 1
+        self.queries += 1
+        self.tables = None
+
+    def generate(self, count: int|None = None, seed: int = 1) -> Iterator[dict]:
+        # Endless when count is None, the same seed gives the same queries
+        if self.queries == 0:
+            raise ValueError('The model has not seen any queries')
+        if self.tables is None:
+            # Values are decoded once here, not for every generated query
+            self.tables = {feature: AliasTable([json.loads(value) for value in counts], list(counts.values()))
+                           for feature, counts in self.counts.items()}
+        rng = random.Random(seed)
+        generated = 0
+        while count is None or generated < count:
+            yield get_query({feature: table.sample(rng) for feature, table in self.tables.items()})
+            generated += 1
+
+    def to_dict(self) -> dict:
+        return {
+            'queries': self.queries,
+            'counts': {feature: [[json.loads(value), count] for value, count in counts.items()]
+                       for feature, counts in self.counts.items()}
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> 'WorkloadModel':
+        model = cls()
+        model.queries = data['queries']
+        for feature, items in data['counts'].items():
+            model.counts[feature] = Counter({json.dumps(value): count for value, count in items})
+        return model
+
+    def write(self, path: str) -> None:
+        with open(path, 'w') as file:
+            json.dump(self.to_dict(), file, ensure_ascii=False)
+
+    @classmethod
+    def read(cls, path: str) -> 'WorkloadModel':
+        with open(path) as file:
+            return cls.from_dict(json.load(file))
+
+
+def get_features(query: dict) -> dict:
+    # Values are JSON strings, so lists and dicts can be counted and the model can be saved
+    profile = {key: value for key, value in query.items()
+               if key not in ROUTE_FIELDS and key not in LIST_FIELDS and key not in ('aircraft', 'pax')}
+    return {
+        'route': json.dumps([query.get(field) for field in ROUTE_FIELDS]),
+        'aircraft': json.dumps(query.get('aircraft')),
+        'pax': json.dumps(query.get('pax')),
+        'avoid_countries': json.dumps(query.get('avoid_countries')),
+        'avoid_firs': json.dumps(query.get('avoid_firs')),
+        'profile': json.dumps(profile, sort_keys=True)
+    }
+
+
+def get_query(features: dict) -> dict:
+    # Features are decoded values shared by all the generated queries, lists are copied
+    query = {}
+    for field, value in zip(ROUTE_FIELDS, features['route']):
+        if value is not None:
+            query[field] = value
+    for field in ('aircraft', 'pax'):
+        if features[field] is not None:
+            query[field] = features[field]
+    query.update(features['profile'])
+    for field in LIST_FIELDS:
+        if features[field] is not None:
+            query[field] = list(features[field])
+    return query